@@ -0,0 +1,161 @@
+"""
+Times every stage of the pipeline on seeded synthetic citation graphs at several scales.
+
+Usage:
+    python Benchmarks/benchmark_pipeline.py --scales 10k 100k 1M 10M --workers 4
+
+Each scale gets a run report (see `scripts.instrumentation.RunReport`); the reports are written
+together as JSON and summarized in a table of stage wall times per scale.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import scripts.data_loader as dl
+import scripts.label_assigner as la
+import scripts.community_detection as cd
+import scripts.community_backends as cb
+import scripts.community_analysis as ca
+import scripts.instrumentation as ins
+import scripts.synthetic_graph as sg
+
+DEFAULT_SCALES = ('10k', '100k', '1M', '10M')
+STAGES = ('loader', 'labeler', 'detection', 'community_stats', 'fisher', 'visualization')
+_SUFFIXES = {'k': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9}
+
+
+def parse_scale(scale):
+    """ Return the number of edges of a scale such as '100k' or '1M'. """
+    if scale[-1] in _SUFFIXES:
+        return int(float(scale[:-1]) * _SUFFIXES[scale[-1]])
+    return int(scale)
+
+
+def benchmark_scale(num_edges, work_dir, seed=0, workers=1, betweenness_samples=64, visualize_max_edges=None,
+                    skip=(), backends=('infomap',)):
+    """
+    Run the pipeline stages on one synthetic graph.
+
+    Args:
+        num_edges (int): Number of edges of the synthetic graph.
+        work_dir (str): Directory for the generated files and outputs.
+        seed (int): Seed of the generator.
+        workers (int): Number of processes for labeling, betweenness and clustering.
+        betweenness_samples (int): Pivots for 'kpivot' betweenness; 0 computes it exactly.
+        visualize_max_edges (int): Largest graph that is visualized; None visualizes every scale.
+        skip (tuple): Names of stages to leave out.
+        backends (tuple): Community detection backends to compare; the first one's partition is analyzed.
+
+    Returns:
+        RunReport: Timings of the stages.
+    """
+    parameters = {'edges': num_edges, 'seed': seed, 'workers': workers, 'betweenness_samples': betweenness_samples,
+                  'backends': list(backends)}
+    report = ins.RunReport(parameters)
+    edge_file = os.path.join(work_dir, 'citations.txt')
+    dates_file = os.path.join(work_dir, 'dates.txt')
+    with report.activate():
+        with ins.stage('generate') as record:
+            citations = sg.synthetic_citations(num_edges, seed)
+            sg.write_snap_files(citations, edge_file, dates_file)
+            record.count(nodes=len(citations.paper_ids), edges=len(citations.sources))
+
+        with ins.stage('loader') as record:
+            graph = dl.load_citation_graph(edge_file, dates_file)
+            record.count(nodes=graph.number_of_nodes(), edges=graph.number_of_edges())
+
+        subfield_dict = la.create_subfield_dictionary()
+        metadata = sg.synthetic_metadata(graph.node_ids.tolist(), subfield_dict, seed)
+        if 'labeler' not in skip:
+            with ins.stage('labeler') as record:
+                labeled_papers = la.label_papers(metadata, subfield_dict, os.path.join(work_dir, 'labels.json'),
+                                                 workers=workers)
+                label_matrix = la.LabelMatrix.from_dict(labeled_papers, graph.interner)
+                record.count(papers=len(labeled_papers))
+        else:
+            label_matrix = la.LabelMatrix.from_dict({}, graph.interner)
+
+        if 'detection' in skip:
+            return report
+        with ins.stage('detection'):
+            detections = [cb.detect_communities(graph, backend) for backend in backends]
+        community_labels = detections[0].labels
+
+        if 'community_stats' in skip:
+            return report
+        with ins.stage('community_stats') as record:
+            mode = ('kpivot', betweenness_samples) if betweenness_samples else ('exact', None)
+            community_stats, _ = ca.prepare_community_stats(community_labels, label_matrix, graph, *mode,
+                                                            workers=workers)
+            record.count(communities=len(community_stats))
+
+        if 'fisher' not in skip:
+            with ins.stage('fisher') as record:
+                ca.perform_fisher_analysis(community_stats, label_matrix, graph.number_of_nodes())
+                record.count(tests=sum(len(stats['fisher_results']) for stats in community_stats.values()))
+
+        if 'visualization' not in skip and (visualize_max_edges is None or graph.number_of_edges() <= visualize_max_edges):
+            with ins.stage('visualization') as record:
+                cd.visualize_communities(graph, community_labels, community_stats, output_path=work_dir)
+                record.count(nodes=graph.number_of_nodes())
+    return report
+
+
+def summary_table(reports):
+    """ Format the wall time of each top-level stage, and the peak memory, with one column per scale. """
+    columns = [f"{report.parameters['edges']:,} edges" for report in reports]
+    stages = [{record.name: record for record in report.stages} for report in reports]
+    backends = dict.fromkeys(backend for report in reports for backend in report.parameters['backends'])
+    rows = []
+    for stage_name in ('generate',) + STAGES + tuple(f'detection/{backend}' for backend in backends):
+        times = [by_name[stage_name].wall_time if stage_name in by_name else None for by_name in stages]
+        rows.append([stage_name] + ['-' if time is None else f"{time:.3f} s" for time in times])
+    for backend in backends:
+        name = f'detection/{backend}'
+        rows.append([f'{backend} modularity'] + [f"{by_name[name].values['modularity']:.4f}" if name in by_name else '-'
+                                                  for by_name in stages])
+    rows.append(['peak RSS'] + [f"{max(record.peak_rss or 0 for record in report.stages) / 2 ** 20:.0f} MiB"
+                                for report in reports])
+    widths = [max(len(row[column]) for row in rows + [['stage'] + columns]) for column in range(len(columns) + 1)]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+                     for row in [['stage'] + columns] + rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', nargs='+', default=list(DEFAULT_SCALES), help="Edge counts, e.g. 10k 1M.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--betweenness-samples', type=int, default=64, help="0 computes exact betweenness.")
+    parser.add_argument('--visualize-max-edges', type=int, default=None)
+    parser.add_argument('--skip', nargs='*', default=[], choices=STAGES)
+    parser.add_argument('--backends', nargs='+', default=['infomap'], choices=sorted(cb.BACKENDS),
+                        help="Community detection backends to compare; the first one's partition is analyzed.")
+    parser.add_argument('--output', default=os.path.join('Results', 'benchmarks.json'))
+    args = parser.parse_args(argv)
+
+    reports = []
+    for scale in args.scales:
+        work_dir = tempfile.mkdtemp(prefix='benchmark-')
+        try:
+            print(f"Benchmarking {scale} edges...")
+            reports.append(benchmark_scale(parse_scale(scale), work_dir, args.seed, args.workers,
+                                           args.betweenness_samples, args.visualize_max_edges, tuple(args.skip),
+                                           tuple(args.backends)))
+        finally:
+            shutil.rmtree(work_dir)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump({'machine': platform.machine(), 'cpu_count': os.cpu_count(),
+                   'scales': [report.to_dict() for report in reports]}, file, indent=2, default=str)
+    print(summary_table(reports))
+    print(f"Benchmark results saved to {args.output}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+FEED_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">\n<title>ArXiv Query</title>\n'
+ENTRY = ('<entry><id>http://arxiv.org/abs/{id}v{version}</id><published>{published}</published>'
+         '<title>{title}</title><summary>{summary}</summary>{authors}</entry>\n')
+ERROR_ENTRY = ('<entry><id>http://arxiv.org/api/errors#incorrect_id_format_for_{id}</id>'
+               '<title>Error</title><summary>incorrect id format for {id}</summary></entry>\n')
+
+
+def atom_response(papers, id_list, malformed=()):
+    """ Return the (status, body) the arXiv API would give for `id_list` if it only knew `papers`. """
+    bad = [paper_id for paper_id in id_list if paper_id in malformed]
+    if bad:
+        return 400, (FEED_HEADER + ERROR_ENTRY.format(id=escape(bad[0])) + '</feed>').encode('utf-8')
+    entries = [_entry(paper_id, papers[paper_id]) for paper_id in id_list if paper_id in papers]
+    return 200, (FEED_HEADER + ''.join(entries) + '</feed>').encode('utf-8')
+
+
+def _entry(paper_id, record):
+    authors = ''.join(f'<author><name>{escape(name)}</name></author>' for name in record.get('authors', []))
+    return ENTRY.format(id=escape(paper_id), version=record.get('version', 1),
+                        published=record.get('published', '1999-01-01T00:00:00Z'),
+                        title=escape(record['title']), summary=escape(record['abstract']), authors=authors)
+
+
+class FakeArxivServer:
+    """
+    Local stand-in for the arXiv export API, serving Atom feeds for `/api/query?id_list=...`.
+
+    Known papers are answered from `papers`; unknown IDs are left out of the feed, and any ID in
+    `malformed` makes the whole query fail with an error feed and status 400, as arXiv does. The first
+    `fail_first` requests get a 503. Every requested id_list is recorded in `requests`.
+
+    Usage:
+        with FakeArxivServer({'hep-ph/9301253': {'title': ..., 'abstract': ...}}) as server:
+            fetcher = ArxivFetcher(url=server.url, rate=1000)
+    """
+
+    def __init__(self, papers, malformed=(), fail_first=0):
+        self.papers = papers
+        self.malformed = set(malformed)
+        self.fail_first = fail_first
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api/query"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, id_list):
+        """ Return the (status, body) answer to a query for `id_list`. """
+        with self._lock:
+            self.requests.append(id_list)
+            if len(self.requests) <= self.fail_first:
+                return 503, b'Service Unavailable'
+        return atom_response(self.papers, id_list, self.malformed)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                id_list = [paper_id for paper_id in query.get('id_list', [''])[0].split(',') if paper_id]
+                status, body = server.respond(id_list)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/atom+xml')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,130 @@
+from . import test_setup
+import unittest
+from datetime import datetime, timezone
+import asyncio
+from scripts.arxiv_fetcher import ArxivFetcher, AsyncArxivFetcher, AtomFeedParser, TokenBucket, FetchBatch, parse_atom_feed, arxiv_id
+from .fake_arxiv_server import FakeArxivServer, atom_response
+
+class TestArxivFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.papers = {f"hep-ph/930{i:04d}": {"title": f"Paper\n  {i}", "abstract": f" Abstract {i} ",
+                                             "authors": ["A. Author", "B. Author"]} for i in range(10)}
+        self.sleeps = []
+
+    def fetcher(self, server, **kwargs):
+        return ArxivFetcher(url=server.url, rate=1e6, burst=1e6, sleep=self.sleeps.append, **kwargs)
+
+    def test_fetches_in_id_list_batches(self):
+        """Test that IDs are requested in batches and Atom entries are mapped back to the dataset's IDs."""
+        paper_ids = [f"930{i:04d}" for i in range(10)] + ["9399999"]
+        with FakeArxivServer(self.papers) as server:
+            result = self.fetcher(server, batch_size=4).fetch(paper_ids)
+        self.assertEqual([len(id_list) for id_list in server.requests], [4, 4, 3])
+        self.assertEqual(sorted(result.found), paper_ids[:10])
+        self.assertEqual(result.not_found, ["9399999"])
+        self.assertEqual(result.failed, [])
+        record = result.found["9300003"]
+        self.assertEqual(record["title"], "Paper 3")
+        self.assertEqual(record["abstract"], "Abstract 3")
+        self.assertEqual(record["authors"], ["A. Author", "B. Author"])
+        self.assertEqual(record["published"], datetime(1999, 1, 1, tzinfo=timezone.utc))
+
+    def test_retries_transient_failures_with_backoff(self):
+        """Test that 503 answers are retried after a backoff, and batches that keep failing are reported as failed."""
+        with FakeArxivServer(self.papers, fail_first=2) as server:
+            result = self.fetcher(server, batch_size=10).fetch(["9300001"])
+        self.assertEqual(list(result.found), ["9300001"])
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(len(self.sleeps), 2)
+
+        with FakeArxivServer(self.papers, fail_first=100) as server:
+            result = self.fetcher(server, max_retries=2).fetch(["9300001", "9300002"])
+        self.assertEqual(result, FetchBatch({}, [], ["9300001", "9300002"]))
+        self.assertEqual(len(server.requests), 3)
+
+    def test_malformed_id_is_isolated(self):
+        """Test that a batch rejected for one malformed ID is split so the other papers are still found."""
+        paper_ids = ["9300000", "9300001", "bad/id", "9300002"]
+        with FakeArxivServer(self.papers, malformed=["bad/id"]) as server:
+            result = self.fetcher(server).fetch(paper_ids)
+        self.assertEqual(sorted(result.found), ["9300000", "9300001", "9300002"])
+        self.assertEqual(result.not_found, ["bad/id"])
+
+    def test_parse_atom_feed_strips_versions(self):
+        """Test that entry IDs lose their version suffix and error entries are flagged."""
+        _, body = atom_response({}, ["hep-ph/9301253"])
+        _, error = atom_response({}, ["x"], malformed=["x"])
+        self.assertEqual(parse_atom_feed(body), ({}, False))
+        self.assertEqual(parse_atom_feed(error), ({}, True))
+        _, body = atom_response({"0704.0001": {"title": "t", "abstract": "a", "version": 3}}, ["0704.0001"])
+        self.assertEqual(list(parse_atom_feed(body)[0]), ["0704.0001"])
+        self.assertEqual(arxiv_id("9301253"), "hep-ph/9301253")
+
+    def test_streaming_parser_matches_whole_feed(self):
+        """Test that feeding the response in small chunks gives the same records as parsing it at once."""
+        _, body = atom_response(self.papers, list(self.papers))
+        parser = AtomFeedParser()
+        for start in range(0, len(body), 7):
+            parser.feed(body[start:start + 7])
+        self.assertEqual(parser.close(), parse_atom_feed(body))
+        self.assertEqual(len(parser.records), 10)
+
+
+class TestAsyncArxivFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.papers = {f"hep-ph/930{i:04d}": {"title": f"Paper {i}", "abstract": f"Abstract {i}"} for i in range(10)}
+        self.paper_ids = [f"930{i:04d}" for i in range(10)] + ["9399999", "bad/id"]
+
+    def fetcher(self, server, **kwargs):
+        return AsyncArxivFetcher(url=server.url, rate=1e6, burst=1e6, backoff=0, **kwargs)
+
+    def test_matches_sync_fetcher(self):
+        """Test that concurrent batches over one session find, miss and isolate the same papers as the sync fetcher."""
+        with FakeArxivServer(self.papers, malformed=["bad/id"], fail_first=1) as server:
+            batches = list(self.fetcher(server, batch_size=3, concurrency=3).iter_batches(self.paper_ids))
+        with FakeArxivServer(self.papers, malformed=["bad/id"]) as server:
+            expected = ArxivFetcher(url=server.url, rate=1e6, burst=1e6, sleep=lambda seconds: None).fetch(self.paper_ids)
+        self.assertEqual(len(batches), 4)
+        result = FetchBatch({}, [], [])
+        for batch in batches:
+            result.found.update(batch.found)
+            result.not_found.extend(batch.not_found)
+        self.assertEqual(result.found, expected.found)
+        self.assertEqual(sorted(result.not_found), ["9399999", "bad/id"])
+
+    def test_async_generator_and_early_stop(self):
+        """Test the async generator on a caller's loop, and that abandoning the sync iterator stops the background loop."""
+        async def collect(fetcher):
+            return [batch async for batch in fetcher.aiter_batches(self.paper_ids[:10])]
+
+        with FakeArxivServer(self.papers) as server:
+            batches = asyncio.run(collect(self.fetcher(server, batch_size=5)))
+            self.assertEqual(sorted(pid for batch in batches for pid in batch.found), self.paper_ids[:10])
+
+            iterator = self.fetcher(server, batch_size=1, concurrency=1).iter_batches(self.paper_ids[:10])
+            next(iterator)
+            iterator.close()
+            self.assertLess(len(server.requests), 12)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_waits_for_refill(self):
+        """Test that the bucket allows its burst and then spaces requests at its rate."""
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=0.5, capacity=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            bucket.acquire()
+        self.assertEqual(sleeps, [2.0, 2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+from . import test_setup
+import unittest
+import numpy as np
+import networkx as nx
+from scripts.citation_graph import CitationGraph
+from scripts.centrality import betweenness_centrality, source_dependencies
+
+class TestBetweennessCentrality(unittest.TestCase):
+
+    def setUp(self):
+        self.nx_graph = nx.gnp_random_graph(120, 0.04, seed=3, directed=True)
+        self.graph = CitationGraph.from_networkx(self.nx_graph)
+        self.expected = np.array(list(nx.betweenness_centrality(self.nx_graph).values()))
+
+    def test_exact_matches_networkx(self):
+        """Test that the exact mode reproduces networkx on directed and undirected graphs."""
+        values, info = betweenness_centrality(self.graph)
+        np.testing.assert_allclose(values, self.expected, atol=1e-12)
+        self.assertEqual(info, {'mode': 'exact', 'samples': 120, 'epsilon': 0.0, 'delta': 0.0})
+
+        undirected = self.nx_graph.to_undirected()
+        values, _ = betweenness_centrality(CitationGraph.from_networkx(undirected))
+        np.testing.assert_allclose(values, list(nx.betweenness_centrality(undirected).values()), atol=1e-12)
+
+    def test_source_dependencies_on_path(self):
+        """Test Brandes dependencies on a path with two equal shortest routes."""
+        graph = CitationGraph.from_edges([0, 0, 1, 2], [1, 2, 3, 3], np.array(['a', 'b', 'c', 'd']))
+        self.assertEqual(source_dependencies(graph.indptr, graph.indices, 0).tolist(), [0.0, 0.5, 0.5, 0.0])
+
+    def test_kpivot_reports_error_bound(self):
+        """Test that pivot sampling is seeded, uses the requested samples and stays within its bound."""
+        values, info = betweenness_centrality(self.graph, 'kpivot', samples=60, seed=7)
+        repeat, _ = betweenness_centrality(self.graph, 'kpivot', samples=60, seed=7)
+        np.testing.assert_array_equal(values, repeat)
+        self.assertEqual(info['samples'], 60)
+        self.assertGreater(info['epsilon'], 0)
+        self.assertLessEqual(np.abs(values - self.expected).max(), info['epsilon'])
+
+    def test_adaptive_stops_at_target(self):
+        """Test that the adaptive sampler either meets the target error or falls back to every source."""
+        values, info = betweenness_centrality(self.graph, 'adaptive', epsilon=0.2, seed=1)
+        self.assertTrue(info['epsilon'] <= 0.2)
+        self.assertLessEqual(np.abs(values - self.expected).max(), max(info['epsilon'], 1e-12))
+
+    def test_unknown_mode(self):
+        """Test that unknown modes and missing pivot counts are rejected."""
+        with self.assertRaises(ValueError):
+            betweenness_centrality(self.graph, 'fast')
+        with self.assertRaises(ValueError):
+            betweenness_centrality(self.graph, 'kpivot')
+
+if __name__ == '__main__':
+    unittest.main()
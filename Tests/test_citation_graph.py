@@ -0,0 +1,81 @@
+from . import test_setup
+import unittest
+from unittest.mock import patch
+import numpy as np
+import networkx as nx
+from scripts.citation_graph import CitationGraph, GrowingGraph
+
+class TestCitationGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.node_ids = np.array(['a', 'b', 'c'])
+        # Duplicate edge (0, 1) should be stored once
+        self.graph = CitationGraph.from_edges([0, 0, 1, 2, 0], [1, 2, 2, 0, 1], self.node_ids)
+
+    def test_from_edges_builds_csr(self):
+        """Test that the CSR offsets and targets are built in first-appearance order."""
+        self.assertEqual(list(self.graph.indptr), [0, 2, 3, 4])
+        self.assertEqual(list(self.graph.indices), [1, 2, 2, 0])
+        self.assertEqual(self.graph.number_of_edges(), 4)
+
+    def test_degrees_match_networkx(self):
+        """Test that degree arrays follow networkx conventions."""
+        nx_graph = self.graph.to_networkx()
+        self.assertEqual(list(self.graph.degree()), [nx_graph.degree(node) for node in self.node_ids])
+        self.assertEqual(list(self.graph.in_degree()), [nx_graph.in_degree(node) for node in self.node_ids])
+
+    def test_undirected_round_trip(self):
+        """Test that an undirected networkx graph survives conversion to CSR and back."""
+        nx_graph = nx.Graph([('p1', 'p2'), ('p2', 'p3'), ('p3', 'p3')])
+        graph = CitationGraph.from_networkx(nx_graph)
+        self.assertFalse(graph.directed)
+        self.assertEqual(graph.number_of_edges(), 3)
+        self.assertEqual(list(graph.degree()), [d for _, d in nx_graph.degree()])
+        self.assertTrue(nx.utils.graphs_equal(graph.to_networkx(), nx_graph))
+
+    def test_to_undirected_merges_directions(self):
+        """Test that reciprocal citations become one undirected edge, as in networkx."""
+        undirected = self.graph.to_undirected()
+        self.assertFalse(undirected.directed)
+        self.assertIs(undirected.interner, self.graph.interner)
+        self.assertTrue(nx.utils.graphs_equal(undirected.to_networkx(), self.graph.to_networkx().to_undirected()))
+
+    @patch('scripts.citation_graph.MIN_COMPACTION_SLOTS', 16)
+    def test_growing_graph_matches_from_edges(self):
+        """
+        Test that growing a graph by many batches, which moves rows past their slots and compacts the
+        buffer, gives the graph built from all edges at once, with the same in-edges and undirected view.
+        """
+        rng = np.random.default_rng(0)
+        grown = GrowingGraph(self.graph)
+        sources, targets = [0, 0, 1, 2], [1, 2, 2, 0]
+        for batch in range(60):
+            grown.add_nodes([f'n{batch}'])
+            new_sources = rng.integers(0, grown.number_of_nodes(), 30)
+            new_targets = rng.integers(0, grown.number_of_nodes(), 30)
+            _, first = np.unique(new_sources * grown.number_of_nodes() + new_targets, return_index=True)
+            new_sources, new_targets = new_sources[np.sort(first)], new_targets[np.sort(first)]
+            new = ~grown.has_edges(new_sources, new_targets)
+            grown.add_edges(new_sources[new], new_targets[new])
+            sources += new_sources[new].tolist()
+            targets += new_targets[new].tolist()
+        expected = CitationGraph.from_edges(sources, targets, grown.to_graph().node_ids)
+        self.assertEqual(grown.index_of(['b', 'n7', 'zz']).tolist(), [1, 10, -1])
+        self.assertEqual(grown.to_graph().indptr.tolist(), expected.indptr.tolist())
+        self.assertEqual(grown.to_graph().indices.tolist(), expected.indices.tolist())
+        self.assertEqual(grown.number_of_edges(), expected.number_of_edges())
+        nodes = np.arange(expected.number_of_nodes())
+        rows, predecessors = grown.predecessors(nodes)
+        self.assertEqual(np.bincount(rows, minlength=len(nodes)).tolist(), expected.in_degree().tolist())
+        rows, neighbours = grown.neighbours(nodes)
+        undirected = expected.to_undirected()
+        self.assertEqual(neighbours.tolist(), np.concatenate([np.sort(undirected.successors(node)) for node in nodes]).tolist())
+
+        undirected = GrowingGraph(self.graph.to_undirected())
+        undirected.add_edges([1], [1])
+        self.assertEqual(undirected.number_of_edges(), 4)
+        self.assertTrue(nx.utils.graphs_equal(undirected.to_graph().to_networkx(),
+                                              nx.Graph([('a', 'b'), ('a', 'c'), ('b', 'c'), ('b', 'b')])))
+
+if __name__ == '__main__':
+    unittest.main()
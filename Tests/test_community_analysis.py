@@ -1,7 +1,11 @@
 from . import test_setup
 import unittest
 from scripts.community_analysis import prepare_community_stats, perform_fisher_analysis, calculate_overall_subfield_counts
+from scripts.citation_graph import CitationGraph
+from scripts.label_assigner import LabelMatrix
+from scripts.module_tree import ModuleTree
 import collections as col
+import numpy as np
 import scipy.stats as st
 import networkx as nx
 
@@ -37,6 +41,89 @@ class TestCommunityAnalysis(unittest.TestCase):
         self.assertEqual(result[2]['dominant_subfield'], expected_stats[2]['dominant_subfield'])
         self.assertEqual(result[2]['dominant_percentage'], expected_stats[2]['dominant_percentage'])
 
+    def test_prepare_community_stats_from_arrays(self):
+        """
+        Tests that integer-indexed inputs (community label array, label matrix and CSR graph)
+        produce the same statistics as the dict-based inputs.
+        """
+        graph = CitationGraph.from_networkx(self.mock_graph)
+        labels = np.array([self.partition[node] for node in graph.node_ids])
+        label_matrix = LabelMatrix.from_dict(self.labeled_papers, graph.interner)
+        expected, expected_global = prepare_community_stats(self.partition, self.labeled_papers, self.mock_graph)
+        result, result_global = prepare_community_stats(labels, label_matrix, graph)
+        self.assertEqual(list(result), list(expected))
+        for community_id in expected:
+            self.assertEqual(dict(result[community_id]['subfields']), dict(expected[community_id]['subfields']))
+            self.assertAlmostEqual(result[community_id]['edge_density'], expected[community_id]['edge_density'])
+        self.assertEqual(result_global, expected_global)
+        self.assertEqual(calculate_overall_subfield_counts(label_matrix), calculate_overall_subfield_counts(self.labeled_papers))
+
+    def test_prepare_community_stats_records_betweenness_mode(self):
+        """
+        Tests that the betweenness mode and its error bound are reported in the global statistics.
+        """
+        _, global_stats = prepare_community_stats(self.partition, self.labeled_papers, self.mock_graph,
+                                                  betweenness_mode='kpivot', betweenness_samples=2, seed=0)
+        self.assertEqual(global_stats['betweenness_mode'], 'kpivot')
+        self.assertEqual(global_stats['betweenness_samples'], 2)
+        self.assertGreater(global_stats['betweenness_epsilon'], 0)
+
+    def test_prepare_community_stats_with_workers(self):
+        """
+        Tests that spreading betweenness and clustering over worker processes gives the same statistics.
+        """
+        expected, expected_global = prepare_community_stats(self.partition, self.labeled_papers, self.mock_graph)
+        result, result_global = prepare_community_stats(self.partition, self.labeled_papers, self.mock_graph, workers=2)
+        for community_id in expected:
+            self.assertAlmostEqual(result[community_id]['avg_clustering'], expected[community_id]['avg_clustering'])
+            self.assertAlmostEqual(result[community_id]['avg_betweenness_centrality'],
+                                   expected[community_id]['avg_betweenness_centrality'])
+        self.assertEqual(result_global.keys(), expected_global.keys())
+        for key, value in expected_global.items():
+            self.assertAlmostEqual(result_global[key], value)
+
+    def test_community_metrics_match_subgraphs(self):
+        """
+        Tests the grouped single-pass metrics against networkx run on each community's subgraph
+        of a directed graph with reciprocal edges and a triangle.
+        """
+        digraph = nx.DiGraph([('a', 'b'), ('b', 'a'), ('b', 'c'), ('c', 'a'), ('c', 'd'), ('d', 'e'), ('e', 'd')])
+        partition = {'a': 0, 'b': 0, 'c': 0, 'd': 1, 'e': 1}
+        graph = CitationGraph.from_networkx(digraph)
+        community_stats, _ = prepare_community_stats(partition, {}, graph)
+        for community, nodes in enumerate([['a', 'b', 'c'], ['d', 'e']]):
+            subgraph = digraph.subgraph(nodes)
+            self.assertEqual(community_stats[community]['count'], len(nodes))
+            self.assertAlmostEqual(community_stats[community]['edge_density'], nx.density(subgraph))
+            self.assertAlmostEqual(community_stats[community]['avg_clustering'], nx.average_clustering(subgraph))
+
+    def test_hierarchy_levels_match_flat_partitions(self):
+        """
+        Tests that every level of a module tree, whether computed from the nodes or aggregated from a
+        finer level, gives the statistics of its flat partition, and that subcommunities name their parent.
+        """
+        graph = CitationGraph.from_networkx(nx.connected_caveman_graph(4, 4).to_directed())
+        coarse, fine = np.arange(16) // 8, np.arange(16) // 4 + 10
+        labeled_papers = {node: ['Physics'] if node % 3 else ['Math', 'Physics'] for node in range(16)}
+        tree = ModuleTree.from_labels(coarse, fine)
+        for order in ([1, 2], [2, 1]):
+            hierarchy, global_stats = prepare_community_stats(tree, labeled_papers, graph, level=None)
+            self.assertEqual(global_stats['levels'], 2)
+            for level in order:
+                with self.subTest(order=order, level=level):
+                    expected, _ = prepare_community_stats([coarse, fine][level - 1], labeled_papers, graph)
+                    result = hierarchy.level(level)
+                    self.assertEqual(list(result), list(expected))
+                    for community_id, stats in expected.items():
+                        self.assertEqual(list(result[community_id]['subfields'].items()),
+                                         list(stats['subfields'].items()))
+                        for key in ('count', 'edge_density', 'avg_clustering', 'avg_degree_centrality',
+                                    'avg_betweenness_centrality', 'cut_size', 'conductance',
+                                    'modularity_contribution', 'dominant_percentage'):
+                            self.assertAlmostEqual(result[community_id][key], stats[key])
+        self.assertEqual([stats['parent'] for stats in hierarchy.level(2).values()], [0, 0, 1, 1])
+        self.assertIs(hierarchy.level(2), hierarchy.level(2))
+
     def test_perform_fisher_analysis(self):
         """
         Tests the Fisher's Exact Test analysis performed on community statistics.
@@ -52,6 +139,26 @@ class TestCommunityAnalysis(unittest.TestCase):
                     self.assertGreaterEqual(result['p_value'], 0.0)
                     self.assertLessEqual(result['p_value'], 1.0)
 
+    def test_perform_fisher_analysis_matches_scipy_with_correction(self):
+        """
+        Tests the batched Fisher results against scipy on each table, and the corrected p-value column.
+        """
+        community_stats, _ = prepare_community_stats(self.partition, self.labeled_papers, self.mock_graph)
+        updated_stats = perform_fisher_analysis(community_stats, self.labeled_papers, self.total_papers, 'bonferroni')
+        overall_counts = calculate_overall_subfield_counts(self.labeled_papers)
+        tests = sum(len(stats['subfields']) for stats in updated_stats.values())
+        for stats in updated_stats.values():
+            for subfield, result in stats['fisher_results'].items():
+                count_in = stats['subfields'][subfield]
+                count_out = overall_counts[subfield] - count_in
+                table = [[count_in, count_out], [stats['count'] - count_in, self.total_papers - stats['count'] - count_out]]
+                odds_ratio, p_value = st.fisher_exact(table)
+                self.assertEqual(result['odds_ratio'], odds_ratio)
+                self.assertAlmostEqual(result['p_value'], p_value)
+                self.assertAlmostEqual(result['p_adjusted'], min(1.0, p_value * tests))
+        with self.assertRaises(ValueError):
+            perform_fisher_analysis(community_stats, self.labeled_papers, self.total_papers, 'holm')
+
     def test_calculate_overall_subfield_counts(self):
         """
         Tests the calculation of overall subfield counts across all labeled papers.
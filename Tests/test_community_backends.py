@@ -0,0 +1,68 @@
+from . import test_setup
+import unittest
+from unittest.mock import patch
+import networkx as nx
+import numpy as np
+from scripts import community_backends as cb
+from scripts.citation_graph import CitationGraph
+
+class TestCommunityBackends(unittest.TestCase):
+
+    def setUp(self):
+        # Six cliques of five papers joined in a ring
+        self.graph = CitationGraph.from_networkx(nx.connected_caveman_graph(6, 5).to_directed())
+        self.cliques = np.arange(30) // 5
+
+    def assertSamePartition(self, labels, expected):
+        pairs = set(zip(labels.tolist(), expected.tolist()))
+        self.assertEqual(len(pairs), len(set(labels.tolist())))
+        self.assertEqual(len(pairs), len(set(expected.tolist())))
+
+    def test_backends_find_the_cliques(self):
+        """Test that every installed backend recovers the cliques and reports their modularity."""
+        expected_quality = nx.community.modularity(self.graph.to_networkx(keyed_by_index=True),
+                                                   [set(range(start, start + 5)) for start in range(0, 30, 5)])
+        for backend in ('infomap', 'louvain', 'label_propagation') + (('leiden',) if cb.leidenalg else ()):
+            with self.subTest(backend=backend):
+                result = cb.detect_communities(self.graph, backend, seed=3)
+                self.assertEqual(result.backend, backend)
+                self.assertSamePartition(result.labels, self.cliques)
+                self.assertAlmostEqual(result.quality, expected_quality)
+                self.assertGreaterEqual(result.elapsed, 0.0)
+                np.testing.assert_array_equal(result.tree.labels(1), result.labels)
+
+    def test_label_propagation_is_seeded(self):
+        """Test that label propagation is reproducible and numbers communities in order of first appearance."""
+        graph = CitationGraph.from_networkx(nx.gnm_random_graph(300, 900, seed=4))
+        labels = cb.label_propagation_labels(graph, seed=1)
+        np.testing.assert_array_equal(labels, cb.label_propagation_labels(graph, seed=1))
+        _, first_seen = np.unique(labels, return_index=True)
+        self.assertTrue(np.all(np.diff(first_seen) > 0))
+
+    def test_label_propagation_warm_start(self):
+        """Test that a warm start keeps the initial labels and only moves nodes around the active ones."""
+        initial = self.cliques * 10
+        initial[[0, 7]] = [50, 0]
+        labels = cb.label_propagation_labels(self.graph, seed=1, initial_labels=initial, active=[7])
+        expected = self.cliques * 10
+        expected[0] = 50
+        np.testing.assert_array_equal(labels, expected)
+
+    def test_unknown_and_missing_backends(self):
+        """Test that unknown backends are rejected and the optional Leiden backend explains what is missing."""
+        with self.assertRaises(ValueError):
+            cb.detect_communities(self.graph, 'walktrap')
+        with patch.object(cb, 'leidenalg', None), self.assertRaises(ImportError):
+            cb.detect_communities(self.graph, 'leiden')
+
+    def test_register_backend(self):
+        """Test that registered backends are available through detect_communities."""
+        with patch.dict(cb.BACKENDS):
+            cb.register_backend('single')(lambda graph: np.zeros(graph.number_of_nodes(), dtype=np.int32))
+            result = cb.detect_communities(self.graph, 'single')
+        self.assertEqual(result.quality, 0.0)
+        self.assertNotIn('single', cb.BACKENDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
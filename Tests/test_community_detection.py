@@ -1,8 +1,12 @@
 from . import test_setup
 import unittest
 from unittest.mock import patch, MagicMock
-from scripts.community_detection import detect_communities_infomap, analyze_community_subfields
+import os
+import tempfile
+from scripts.community_detection import detect_communities_infomap, detect_community_labels, detect_module_tree, analyze_community_subfields, visualize_communities
+from scripts.citation_graph import CitationGraph
 import networkx as nx
+import numpy as np
 
 class TestDetectCommunitiesInfomap(unittest.TestCase):
     @patch('scripts.community_detection.infomap.Infomap')
@@ -17,23 +21,90 @@ class TestDetectCommunitiesInfomap(unittest.TestCase):
         graph = nx.Graph()
         graph.add_edge(0, 1)
 
-        # Setup the mock Infomap instance
+        # Setup the mock Infomap instance and the result of its run
         mock_instance = mock_infomap.return_value
-        mock_instance.run = MagicMock()
-
-        # Setup the nodes property to yield mock nodes directly
-        mock_node_0 = MagicMock(node_id=0, module_id=1)
-        mock_node_1 = MagicMock(node_id=1, module_id=1)
-        mock_instance.nodes = [mock_node_0, mock_node_1]
-
-        # Mock add_link to simulate the Infomap internal behavior
-        mock_instance.add_link = MagicMock()
+        mock_instance.run.return_value = MagicMock(codelength=1.0, modules=MagicMock(return_value={0: 1, 1: 1}))
 
         result = detect_communities_infomap(graph)
 
         expected = {0: 1, 1: 1}
         self.assertEqual(result, expected)
 
+    @patch('scripts.community_detection.infomap.Infomap')
+    def test_detect_community_labels(self, mock_infomap):
+        """
+        Tests that labels come back as an array over node indices and that nodes
+        Infomap does not report receive their own singleton community.
+        """
+        graph = CitationGraph.from_edges([0], [1], np.array(['a', 'b', 'c']))
+        mock_instance = mock_infomap.return_value
+        mock_instance.run.return_value = MagicMock(codelength=1.0, modules=MagicMock(return_value={0: 1, 1: 2}))
+
+        labels = detect_community_labels(graph)
+
+        self.assertEqual(labels.tolist(), [1, 2, 3])
+        mock_instance.add_link.assert_not_called()
+        (links,), _ = mock_instance.add_links.call_args
+        self.assertEqual(links.tolist(), [[0, 1]])
+        mock_infomap.assert_called_once_with(seed=123, num_trials=1, silent=True, directed=False, two_level=False)
+
+    @patch('scripts.community_detection.infomap.Infomap')
+    def test_keeps_trial_with_shortest_codelength(self, mock_infomap):
+        """
+        Tests that trials are seeded one after another and the partition with the shortest codelength wins.
+        """
+        graph = CitationGraph.from_edges([0, 1], [1, 2], np.array(['a', 'b', 'c']))
+        codelengths = {5: 3.0, 6: 2.0, 7: 2.0, 8: 4.0}
+
+        def trial(seed, **options):
+            instance = MagicMock()
+            instance.run.return_value = MagicMock(codelength=codelengths[seed],
+                                                  modules=MagicMock(return_value={0: seed, 1: seed, 2: 0}))
+            return instance
+        mock_infomap.side_effect = trial
+
+        labels = detect_community_labels(graph, seed=5, trials=4, directed=True, two_level=True)
+
+        self.assertEqual(labels.tolist(), [6, 6, 0])
+        self.assertEqual([call.kwargs['seed'] for call in mock_infomap.call_args_list], [5, 6, 7, 8])
+        self.assertTrue(all(call.kwargs['directed'] and call.kwargs['two_level'] for call in mock_infomap.call_args_list))
+
+    def test_trials_do_not_depend_on_workers(self):
+        """
+        Tests that running the trials in worker processes gives the same partition, and that a time limit
+        still runs one trial.
+        """
+        graph = CitationGraph.from_networkx(nx.connected_caveman_graph(6, 5).to_directed())
+        labels = detect_community_labels(graph, seed=1, trials=3)
+        np.testing.assert_array_equal(detect_community_labels(graph, seed=1, trials=3, workers=2), labels)
+        self.assertEqual(len(np.unique(labels)), 6)
+        limited = detect_community_labels(graph, seed=1, trials=100, time_limit=0)
+        np.testing.assert_array_equal(limited, detect_community_labels(graph, seed=1))
+
+    def test_detect_module_tree(self):
+        """
+        Tests that Infomap finds groups of cliques as top-level modules with the cliques below them, and
+        that the top level matches the flat labels.
+        """
+        graph = nx.Graph()
+        for clique in range(16):
+            base = clique * 6
+            graph.add_edges_from((base + i, base + j) for i in range(6) for j in range(i + 1, 6))
+            graph.add_edges_from((base, (clique // 4 * 4 + other) * 6 + 1) for other in range(clique % 4 + 1, 4))
+        graph.add_edges_from((group * 24 + 2, (group + 1) % 4 * 24 + 3) for group in range(4))
+        graph = CitationGraph.from_networkx(graph)
+
+        tree = detect_module_tree(graph)
+
+        np.testing.assert_array_equal(tree.labels(1), detect_community_labels(graph))
+        self.assertEqual(tree.num_levels, 2)
+        self.assertEqual(len(np.unique(tree.labels(1))), 4)
+        cliques = graph.node_ids // 6
+        self.assertEqual(len(set(zip(tree.labels(2).tolist(), cliques.tolist()))), 16)
+        self.assertEqual(tree.num_modules(2), 16)
+        np.testing.assert_array_equal(tree.parents(2)[tree.indices(2)], tree.indices(1))
+        self.assertAlmostEqual(tree.codelength, sum(tree.level_codelengths()))
+
 class TestAnalyzeCommunitySubfields(unittest.TestCase):
     def test_analyze_community_subfields(self):
         """
@@ -67,5 +138,23 @@ class TestAnalyzeCommunitySubfields(unittest.TestCase):
 
         self.assertEqual(result, expected)
 
+    def test_visualize_communities(self):
+        """
+        Tests that a networkx graph with a partition dict and a CSR graph with a label array both
+        render, and that the layout is cached between the runs.
+        """
+        graph = nx.connected_caveman_graph(3, 4)
+        partition = {node: node // 4 for node in graph}
+        community_stats = {community: {'count': 4} for community in range(3)}
+        with tempfile.TemporaryDirectory() as output_path:
+            cache_file = os.path.join(output_path, 'layout.npz')
+            visualize_communities(graph, partition, community_stats, output_path=output_path, cache_file=cache_file)
+            csr_graph = CitationGraph.from_networkx(graph)
+            with patch('scripts.layout._force_layout') as force_layout:
+                visualize_communities(csr_graph, np.arange(12) // 4, community_stats, output_path=output_path,
+                                      cache_file=cache_file)
+                force_layout.assert_not_called()
+            self.assertTrue(os.path.exists(os.path.join(output_path, 'community_visualization.png')))
+
 if __name__ == '__main__':
     unittest.main()
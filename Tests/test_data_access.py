@@ -3,8 +3,12 @@ import unittest
 import os
 import tempfile
 import json
+import shutil
 from datetime import datetime
-from scripts.data_access import save_json_cache, load_json_cache, JSONEncoder
+from unittest.mock import patch
+import numpy as np
+from scripts.citation_graph import CitationGraph
+from scripts.data_access import save_json_cache, load_json_cache, JSONEncoder, JsonJournal, save_graph_snapshot, load_graph_snapshot
 
 class TestJSONCache(unittest.TestCase):
 
@@ -14,11 +18,8 @@ class TestJSONCache(unittest.TestCase):
         self.cache_file = os.path.join(self.test_dir, 'test_cache.json')
 
     def tearDown(self):
-        # First, remove all files in the directory
-        for filename in os.listdir(self.test_dir):
-            file_path = os.path.join(self.test_dir, filename)
-            os.unlink(file_path)  
-        os.rmdir(self.test_dir)  
+        # Remove the directory together with any cache files or snapshots written into it
+        shutil.rmtree(self.test_dir)
 
 
     def test_save_json_cache(self):
@@ -51,5 +52,82 @@ class TestJSONCache(unittest.TestCase):
         loaded_data = load_json_cache(self.cache_file)
         self.assertEqual(loaded_data, {})
 
+    def test_save_json_cache_reports_failure(self):
+        """ Test that saving reports failure and leaves no temporary file behind """
+        self.assertTrue(save_json_cache({'a': 1}, self.cache_file))
+        self.assertFalse(save_json_cache({'a': object()}, self.cache_file))
+        self.assertEqual(os.listdir(self.test_dir), ['test_cache.json'])
+        self.assertEqual(load_json_cache(self.cache_file), {'a': 1})
+
+
+class TestJsonJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.journal_file = os.path.join(self.test_dir, 'cache.json.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_append_flushes_in_batches(self):
+        """ Test that records reach the file once a batch is full and all of them on close """
+        journal = JsonJournal(self.journal_file, flush_every=2, flush_interval=3600)
+        journal.append('a', {'published': datetime(2001, 1, 2)})
+        self.assertEqual(os.path.getsize(self.journal_file), 0)
+        journal.append('b', 2)
+        self.assertEqual(JsonJournal(self.journal_file).replay(), {'a': {'published': '2001-01-02T00:00:00'}, 'b': 2})
+        journal.append('a', 3)
+        journal.close()
+        self.assertEqual(JsonJournal(self.journal_file).replay(), {'a': 3, 'b': 2})
+
+    def test_replay_skips_torn_record_and_discard_removes_journal(self):
+        """ Test that an incomplete last line from a crash is ignored """
+        with open(self.journal_file, 'w') as f:
+            f.write('["a", 1]\n["b", {"title": "cut')
+        journal = JsonJournal(self.journal_file)
+        self.assertEqual(journal.replay(), {'a': 1})
+        journal.discard()
+        self.assertFalse(os.path.exists(self.journal_file))
+
+
+class TestGraphSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.source_file = os.path.join(self.test_dir, 'edges.txt')
+        with open(self.source_file, 'w') as f:
+            f.write("1001\t2001\n")
+        self.snapshot_dir = os.path.join(self.test_dir, 'edges.snapshot')
+        self.graph = CitationGraph.from_edges([0, 1], [1, 0], np.array(['0001001', '0002001']))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_snapshot_round_trip_is_memory_mapped(self):
+        """ Test that a saved snapshot reloads memory-mapped with identical arrays """
+        save_graph_snapshot(self.graph, self.snapshot_dir, [self.source_file])
+        loaded = load_graph_snapshot(self.snapshot_dir, [self.source_file])
+        self.assertIsInstance(loaded.indices, np.memmap)
+        np.testing.assert_array_equal(loaded.indptr, self.graph.indptr)
+        np.testing.assert_array_equal(loaded.node_ids, self.graph.node_ids)
+        self.assertIsNone(loaded.dates)
+
+    def test_snapshot_is_stale_after_source_changes(self):
+        """ Test that a snapshot is ignored once its source file changes """
+        save_graph_snapshot(self.graph, self.snapshot_dir, [self.source_file])
+        with open(self.source_file, 'a') as f:
+            f.write("1002\t2002\n")
+        self.assertIsNone(load_graph_snapshot(self.snapshot_dir, [self.source_file]))
+
+    def test_snapshot_is_stale_after_format_change(self):
+        """ Test that a snapshot written under an older format version is ignored """
+        with patch('scripts.data_access.SNAPSHOT_FORMAT_VERSION', 1):
+            save_graph_snapshot(self.graph, self.snapshot_dir, [self.source_file])
+        self.assertIsNone(load_graph_snapshot(self.snapshot_dir, [self.source_file]))
+
+    def test_missing_snapshot(self):
+        """ Test behavior when no snapshot has been written """
+        self.assertIsNone(load_graph_snapshot(self.snapshot_dir, [self.source_file]))
+
 if __name__ == '__main__':
     unittest.main()
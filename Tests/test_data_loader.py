@@ -35,6 +35,20 @@ class TestLoadCitationNetwork(unittest.TestCase):
         graph = data_loader.load_citation_network(self.temp_file.name)
         self.assertEqual(len(graph.edges()), 3, "Should only have 3 valid edges")
 
+    def test_malformed_first_line_is_skipped(self):
+        """Ensure that a first line with three fields is skipped and the lines after it parse as usual."""
+        for first_line in ("1\t2\t3\n", "#a\tb\tc\n"):
+            with self.subTest(first_line=first_line):
+                with open(self.temp_file.name, 'w') as f:
+                    f.write(first_line + "1001\t2001\n1002\t2002\t\n2001\t1001\n")
+                from_papers, to_papers = data_loader.read_edge_list(self.temp_file.name)
+                self.assertEqual(list(zip(from_papers, to_papers)), [('0001001', '0002001'), ('0002001', '0001001')])
+        with open(self.temp_file.name, 'w') as f:
+            f.write("0001001\t2000-01-05\textra\n0001002\t2000-01-06\n")
+        dates = data_loader.load_paper_dates(self.temp_file.name)
+        self.assertEqual([str(date.date()) for date in dates], ['2000-01-06'])
+        self.assertEqual(list(dates.index), ['0001002'])
+
     def test_empty_and_comment_only_file(self):
         """Test loading an empty or comment-only file."""
         # Clear and rewrite the file with only a comment
@@ -44,5 +58,72 @@ class TestLoadCitationNetwork(unittest.TestCase):
         self.assertEqual(len(graph), 0)
         self.assertEqual(len(graph.edges()), 0)
 
+    def test_load_citation_graph(self):
+        """Test that the CSR loader formats IDs and keeps first-appearance node order."""
+        graph = data_loader.load_citation_graph(self.temp_file.name)
+        self.assertEqual(list(graph.node_ids), ['0001001', '0002001', '0001002', '0002002'])
+        self.assertEqual(graph.number_of_edges(), 3)
+        self.assertEqual(list(graph.successors(0)), [1])
+
+    def test_networkx_view_matches_csr_graph(self):
+        """Test that the networkx view holds the same nodes and edges as the CSR graph."""
+        graph = data_loader.load_citation_network(self.temp_file.name)
+        self.assertIsInstance(graph, nx.DiGraph)
+        self.assertEqual(sorted(graph.edges()), [('0001001', '0002001'), ('0001002', '0002002'), ('0002001', '0001001')])
+
+    def test_load_citation_graph_with_dates(self):
+        """
+        Test that paper dates are aligned to node indices, with NaT for undated papers, and that a date
+        listed only under the cross-listed "11<true_id>" form reaches the paper's true ID.
+        """
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as dates_file:
+            dates_file.write("# cross-listed papers have ids 11<true_id>\n0001001\t2000-01-05\n0002001\t2000-02-01\n"
+                             "0002001\t2000-01-20\n11001002\t2000-01-03\n11002001\t2000-01-10\n")
+        try:
+            graph = data_loader.load_citation_graph(self.temp_file.name, dates_path=dates_file.name)
+        finally:
+            os.remove(dates_file.name)
+        self.assertEqual([str(date) for date in graph.dates], ['2000-01-05', '2000-01-10', '2000-01-03', 'NaT'])
+    def test_sharded_parsing_matches_single_process_load(self):
+        """
+        Test that shards end at line boundaries and that parsing tiny shards, with header and comment
+        lines inside them, gives the single-process graph for any number of workers.
+        """
+        with open(self.temp_file.name, 'a') as f:
+            f.write("# A comment between edges\n1003\t1001\n\n1002\t2002\n 11001004\t2002 \nbad\tline\textra\n")
+        ranges = data_loader.shard_ranges(self.temp_file.name, 5, min_shard_bytes=1)
+        with open(self.temp_file.name, 'rb') as f:
+            data = f.read()
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(stop, start)
+            self.assertEqual(data[stop - 1:stop], b'\n')
+
+        expected = data_loader.load_citation_graph(self.temp_file.name)
+        for workers in (1, 2, 3):
+            with self.subTest(workers=workers):
+                interner, codes = data_loader.read_interned_edges(self.temp_file.name, workers, min_shard_bytes=1)
+                self.assertEqual(interner.ids.tolist(), expected.node_ids.tolist())
+                self.assertEqual(codes.tolist(), [[0, 1], [2, 3], [1, 0], [4, 0], [2, 3], [5, 3]])
+        graph = data_loader.load_citation_graph(self.temp_file.name, workers=2)
+        self.assertEqual(graph.node_ids.tolist(), expected.node_ids.tolist())
+        self.assertEqual(graph.indices.tolist(), expected.indices.tolist())
+
+    def test_sharded_parsing_with_malformed_first_line(self):
+        """Test that a malformed first line is skipped alike by the single-process and sharded parsers."""
+        with open(self.temp_file.name, 'w') as f:
+            f.write("1\t2\t3\n1001\t2001\nbad\tline\textra\n1002\t2002\n2001\t1001\n")
+        expected = data_loader.load_citation_graph(self.temp_file.name, workers=1)
+        self.assertEqual(expected.node_ids.tolist(), ['0001001', '0002001', '0001002', '0002002'])
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                interner, codes = data_loader.read_interned_edges(self.temp_file.name, workers, min_shard_bytes=1)
+                self.assertEqual(interner.ids.tolist(), expected.node_ids.tolist())
+                self.assertEqual(codes.tolist(), [[0, 1], [2, 3], [1, 0]])
+        graph = data_loader.load_citation_graph(self.temp_file.name, workers=2)
+        self.assertEqual(graph.indices.tolist(), expected.indices.tolist())
+
+
 if __name__ == '__main__':
     unittest.main()
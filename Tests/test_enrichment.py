@@ -0,0 +1,42 @@
+from . import test_setup
+import unittest
+import numpy as np
+import scipy.stats as st
+from scripts import enrichment as en
+
+class TestEnrichment(unittest.TestCase):
+
+    def test_fisher_exact_batch_matches_scipy(self):
+        """Test odds ratios and two-sided p-values against scipy on random, tied and degenerate tables."""
+        rng = np.random.default_rng(0)
+        tables = rng.integers(0, 60, size=(300, 4)).tolist()
+        tables += [[5, 5, 5, 5], [3, 3, 3, 3], [0, 4, 7, 0], [0, 0, 3, 4], [2, 0, 0, 9], [0, 0, 0, 0],
+                   [1200, 4300, 800, 28000], [30, 0, 70, 34000]]
+        odds_ratios, p_values = en.fisher_exact_batch(*np.array(tables).T)
+        for table, odds_ratio, p_value in zip(tables, odds_ratios, p_values):
+            with self.subTest(table=table):
+                expected_odds, expected_p = st.fisher_exact([table[:2], table[2:]])
+                if np.isnan(expected_odds):
+                    self.assertTrue(np.isnan(odds_ratio))
+                else:
+                    self.assertAlmostEqual(odds_ratio, expected_odds)
+                self.assertTrue(np.isclose(p_value, expected_p, rtol=1e-9, atol=1e-300))
+
+    def test_log_factorials_are_cached(self):
+        """Test that the log-factorial table is extended once and shared between calls."""
+        table = en.log_factorials(1000)
+        self.assertAlmostEqual(table[10], np.log(3628800))
+        self.assertIs(en.log_factorials(500), table)
+        self.assertGreater(len(en.log_factorials(len(table))), len(table))
+
+    def test_adjust_pvalues(self):
+        """Test Bonferroni and Benjamini-Hochberg corrections against hand-computed values."""
+        p_values = [0.01, 0.04, 0.03, 0.5]
+        np.testing.assert_allclose(en.adjust_pvalues(p_values, 'bonferroni'), [0.04, 0.16, 0.12, 1.0])
+        np.testing.assert_allclose(en.adjust_pvalues(p_values, 'fdr_bh'), [0.04, 0.16 / 3, 0.16 / 3, 0.5])
+        with self.assertRaises(ValueError):
+            en.adjust_pvalues(p_values, 'holm')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+from . import test_setup
+import unittest
+import numpy as np
+import networkx as nx
+from scripts.citation_graph import CitationGraph
+from scripts.graph_metrics import density, degree_centrality, clustering, group_mean, modularity
+
+class TestGraphMetrics(unittest.TestCase):
+
+    def test_clustering_matches_networkx(self):
+        """Test directed and undirected clustering, self-loops included, against networkx."""
+        for directed in (True, False):
+            with self.subTest(directed=directed):
+                nx_graph = nx.gnp_random_graph(60, 0.1, seed=1, directed=directed)
+                nx_graph.add_edge(0, 0)
+                graph = CitationGraph.from_networkx(nx_graph)
+                expected = list(nx.clustering(nx_graph).values())
+                np.testing.assert_allclose(clustering(graph, block_size=16), expected)
+
+    def test_density_and_degree_centrality(self):
+        """Test density conventions and degree centrality against networkx."""
+        nx_graph = nx.DiGraph([(0, 1), (1, 2), (2, 0), (2, 2)])
+        graph = CitationGraph.from_networkx(nx_graph)
+        self.assertAlmostEqual(density(3, 4), nx.density(nx_graph))
+        self.assertEqual(density(np.array([1, 2]), np.array([1, 1]), directed=False).tolist(), [0.0, 1.0])
+        np.testing.assert_allclose(degree_centrality(graph), list(nx.degree_centrality(nx_graph).values()))
+
+    def test_group_mean(self):
+        """Test per-group means, with empty groups reported as zero."""
+        result = group_mean(np.array([1.0, 3.0, 5.0]), np.array([0, 0, 2]), np.array([2, 0, 1]))
+        self.assertEqual(result.tolist(), [2.0, 0.0, 5.0])
+
+    def test_modularity_matches_networkx(self):
+        """Test directed and undirected modularity, self-loops and resolution included, against networkx."""
+        labels = np.random.default_rng(0).integers(0, 4, 50)
+        for directed in (True, False):
+            with self.subTest(directed=directed):
+                nx_graph = nx.gnm_random_graph(50, 150, seed=2, directed=directed)
+                nx_graph.add_edge(3, 3)
+                graph = CitationGraph.from_networkx(nx_graph)
+                communities = [set(np.flatnonzero(labels == label).tolist()) for label in range(4)]
+                for resolution in (1.0, 0.5):
+                    self.assertAlmostEqual(modularity(graph, labels[graph.node_ids.astype(int)], resolution),
+                                           nx.community.modularity(nx_graph, communities, resolution=resolution))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+from . import test_setup
+import unittest
+import numpy as np
+from scripts.id_interner import IdInterner
+
+class TestIdInterner(unittest.TestCase):
+
+    def setUp(self):
+        self.interner, self.codes = IdInterner.from_values(['9203201', '0001024', '9203201', '119203001'])
+
+    def test_from_values_interns_in_first_appearance_order(self):
+        """Test that repeated IDs share an index and indices follow first appearance."""
+        self.assertEqual(list(self.interner.ids), ['9203201', '0001024', '119203001'])
+        self.assertEqual(self.codes.dtype, np.int32)
+        self.assertEqual(list(self.codes), [0, 1, 0, 2])
+
+    def test_index_of_and_lookup(self):
+        """Test vectorized lookups in both directions, with -1 for unknown IDs."""
+        self.assertEqual(list(self.interner.index_of(['0001024', 'missing'])), [1, -1])
+        self.assertEqual(list(self.interner.lookup([2, 0])), ['119203001', '9203201'])
+        self.assertIn('9203201', self.interner)
+
+    def test_cross_listed_ids(self):
+        """Test that the "11<true_id>" form is flagged and mapped back to the true ID."""
+        self.assertEqual(list(self.interner.cross_listed()), [False, False, True])
+        self.assertEqual(list(self.interner.true_ids()), ['9203201', '0001024', '9203001'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+from . import test_setup
+import unittest
+from unittest.mock import patch
+import networkx as nx
+import numpy as np
+from scripts import incremental as inc
+from scripts import citation_graph as cg
+from scripts.citation_graph import CitationGraph, GrowingGraph
+from scripts.label_assigner import LabelMatrix
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        # Four cliques of five papers joined in a ring, papers 'p0' to 'p19'
+        caveman = nx.relabel_nodes(nx.connected_caveman_graph(4, 5).to_directed(), lambda node: f'p{node}')
+        self.graph = CitationGraph.from_networkx(caveman)
+        self.labels = np.arange(20) // 5
+        self.labeled_papers = {f'p{node}': ['Physics'] if node % 2 else ['Math', 'Physics'] for node in range(20)}
+        self.label_matrix = LabelMatrix.from_dict(self.labeled_papers, self.graph.interner)
+
+    def test_extend_graph_skips_known_citations(self):
+        """Test that new papers are appended in order and citations already in the graph or delta are skipped."""
+        delta = inc.extend_graph(self.graph, ['p0', 'p20', 'p20', 'p21'], ['p2', 'p0', 'p0', 'p20'], paper_ids=['p22'])
+        self.assertEqual(delta.num_previous_nodes, 20)
+        self.assertEqual(delta.graph.node_ids.tolist()[20:], ['p22', 'p20', 'p21'])
+        self.assertEqual(list(zip(delta.sources.tolist(), delta.targets.tolist())), [(21, 0), (22, 21)])
+        self.assertEqual(delta.graph.number_of_edges(), self.graph.number_of_edges() + 2)
+
+    def test_match_labels(self):
+        """Test that communities take the label of the reference community they overlap most."""
+        labels = inc.match_labels(np.array([5, 5, 5, 6, 6, 7]), np.array([1, 1, 0, 0, 0, 0]))
+        self.assertEqual(labels.tolist(), [1, 1, 1, 0, 0, 2])
+
+    def test_updates_match_a_fresh_tally(self):
+        """
+        Test that after each warm-started update the partition keeps its community labels and the
+        incrementally updated statistics equal those counted from scratch on the grown graph.
+        """
+        for method in inc.UPDATE_METHODS:
+            with self.subTest(method=method):
+                communities = inc.IncrementalCommunities(self.graph, self.labels, self.label_matrix, method, seed=2)
+                # A new paper citing into the first clique, and a clique member moving to the second clique
+                communities.update(['p20', 'p20', 'p20', 'p4', 'p4', 'p4', 'p4'],
+                                   ['p0', 'p1', 'p2', 'p5', 'p6', 'p7', 'p8'],
+                                   labeled_papers={'p20': ['Optics']})
+                self.assertEqual(communities.labels[:4].tolist(), [0, 0, 0, 0])
+                self.assertEqual(communities.labels[20], 0)
+                self.assertEqual(sorted(set(communities.labels.tolist())), [0, 1, 2, 3])
+                fresh = inc.CommunityTally(communities.graph, communities.labels, communities.label_matrix)
+                result, expected = communities.community_stats(), fresh.community_stats()
+                self.assertEqual(list(result), list(expected))
+                for community_id, stats in expected.items():
+                    self.assertEqual(result[community_id]['subfields'], stats['subfields'])
+                    for key in ('count', 'internal_edges', 'edge_density', 'avg_degree_centrality', 'cut_size',
+                                'conductance', 'modularity_contribution', 'dominant_percentage'):
+                        self.assertAlmostEqual(result[community_id][key], stats[key])
+        with self.assertRaises(ValueError):
+            inc.IncrementalCommunities(self.graph, self.labels, self.label_matrix, 'walktrap')
+
+    def test_local_update_reads_only_rows_around_the_delta(self):
+        """
+        Test that a 'local' update never rebuilds or scans the whole graph: the undirected view and the
+        CSR arrays are not rebuilt and only rows of the papers next to the new citations are read.
+        """
+        communities = inc.IncrementalCommunities(self.graph, self.labels, self.label_matrix, 'local', seed=2)
+        rebuilt = AssertionError("the whole graph was rebuilt")
+        with patch.object(cg._GrowingRows, 'entries', autospec=True, side_effect=cg._GrowingRows.entries) as entries, \
+                patch.object(CitationGraph, 'to_undirected', side_effect=rebuilt), \
+                patch.object(CitationGraph, 'from_edges', side_effect=rebuilt), \
+                patch.object(CitationGraph, 'degree', side_effect=rebuilt), \
+                patch.object(GrowingGraph, 'to_graph', side_effect=rebuilt):
+            communities.update(['p20', 'p20'], ['p0', 'p1'], labeled_papers={'p20': ['Optics']})
+        read = np.unique(np.concatenate([call.args[1] for call in entries.call_args_list]))
+        self.assertIn(20, read.tolist())
+        self.assertLessEqual(set(read.tolist()), {0, 1, 20})
+        self.assertEqual(communities.labels[20], 0)
+        self.assertEqual(communities.community_stats()[0]['count'], 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+from . import test_setup
+import unittest
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import networkx as nx
+from scripts import instrumentation as ins
+from scripts.community_analysis import prepare_community_stats
+
+@ins.instrumented(items=lambda result: {'values': len(result)})
+def squares(count):
+    return [value * value for value in range(count)]
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_records_nested_stages(self):
+        """Test that stages and instrumented calls are recorded with their nesting, timings and item counts."""
+        report = ins.RunReport({'workers': 2})
+        with report.activate():
+            with ins.stage('outer') as record:
+                squares(1000)
+                record.count(items=3)
+        self.assertIsNone(ins.active_report())
+        self.assertEqual([record.name for record in report.stages], ['outer/squares', 'outer'])
+        inner, outer = report.stages
+        self.assertEqual(inner.items, {'values': 1000})
+        self.assertEqual(outer.items, {'items': 3})
+        self.assertGreaterEqual(outer.wall_time, inner.wall_time)
+        self.assertGreaterEqual(outer.cpu_time, 0.0)
+        self.assertGreater(outer.peak_rss, 0)
+
+    def test_inactive_is_a_no_op(self):
+        """Test that instrumented functions and stages work unchanged when no report is active."""
+        self.assertEqual(squares(3), [0, 1, 4])
+        with ins.stage('unused') as record:
+            record.count(items=1)
+
+    def test_save_report_with_profiles(self):
+        """Test the JSON report, and that top-level stages are profiled while nested ones are not."""
+        report = ins.RunReport({'mode': 'exact'}, profiler='cprofile', profile_dir=self.test_dir)
+        graph = nx.DiGraph([('a', 'b'), ('b', 'c'), ('c', 'a'), ('c', 'd')])
+        with report.activate():
+            prepare_community_stats({'a': 0, 'b': 0, 'c': 0, 'd': 1}, {'a': ['Physics']}, graph)
+        report_file = os.path.join(self.test_dir, 'run_report.json')
+        report.save(report_file)
+        with open(report_file) as file:
+            saved = json.load(file)
+        self.assertEqual(saved['parameters'], {'mode': 'exact'})
+        stages = {stage['name']: stage for stage in saved['stages']}
+        self.assertIn('prepare_community_stats/betweenness', stages)
+        self.assertIn('prepare_community_stats/density', stages)
+        self.assertEqual(stages['prepare_community_stats']['items'], {'communities': 2})
+        self.assertIsNone(stages['prepare_community_stats/betweenness']['profile'])
+        profile = stages['prepare_community_stats']['profile']
+        self.assertTrue(pstats.Stats(profile).total_calls > 0)
+
+    def test_unknown_profiler(self):
+        """Test that unknown profilers are rejected."""
+        with self.assertRaises(ValueError):
+            ins.RunReport(profiler='perf')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 from . import test_setup
 import unittest
-from scripts.label_assigner import assign_labels, create_subfield_dictionary, label_paper, label_papers
+from scripts.label_assigner import assign_labels, create_subfield_dictionary, label_paper, label_papers, LabelMatrix, LabelMatrixBuilder, keyword_matcher, iter_labeled_papers, content_hash, dictionary_fingerprint
+import re
+from scripts.id_interner import IdInterner
 from unittest.mock import patch, MagicMock
 
 class TestLabelAssigner(unittest.TestCase):
@@ -49,6 +51,134 @@ class TestLabelAssigner(unittest.TestCase):
         result = label_paper("1234567", metadata, self.subfield_dict)
         self.assertEqual(result, expected)
 
+    def test_assign_labels_overlapping_keywords(self):
+        """Test that keywords nested in longer keywords are found, and that labels keep dictionary priority."""
+        subfield_dict = {"neutrino": "A", "neutrino oscillation": "B", "oscillation": "C", "e": "D", "g-2": "E"}
+        self.assertEqual(assign_labels("NEUTRINO OSCILLATIONS", "", subfield_dict, max_labels=5), ["A"])
+        self.assertEqual(assign_labels("", "Neutrino oscillation data", subfield_dict, max_labels=5), ["A", "B", "C"])
+        self.assertEqual(assign_labels("electron g-2", "e-g-2", subfield_dict, max_labels=5), ["D", "E"])
+        self.assertEqual(assign_labels("neutrino", "oscillation", subfield_dict, max_labels=5), ["A", "C"])
+
+    def test_keyword_matcher_matches_per_keyword_search(self):
+        """Test that the combined matcher finds exactly the keywords a separate word-boundary search finds."""
+        text = "B0 meson mixing, B0_s decays and chiral symmetry breaking at three-loop QCD-like M-theory; spin-1 Mesons."
+        expected = {keyword.lower() for keyword in self.subfield_dict
+                    if re.search(r'\b{}\b'.format(re.escape(keyword)), text, re.IGNORECASE)}
+        self.assertEqual(keyword_matcher(self.subfield_dict).find_keywords(text), expected)
+
+    def test_keyword_matcher_is_cached(self):
+        """Test that equal dictionaries share one compiled matcher."""
+        self.assertIs(keyword_matcher(self.subfield_dict), keyword_matcher(create_subfield_dictionary()))
+
+    @patch('scripts.label_assigner.load_json_cache', return_value={})
+    @patch('scripts.label_assigner.save_json_cache')
+    def test_label_papers_in_worker_processes(self, mock_save, mock_load):
+        """Test that labeling blocks in worker processes gives the same labels, in metadata order, as the serial path."""
+        metadata = {str(i): {"title": title, "abstract": "Unknown"} for i, title in
+                    enumerate(["SUSY and dark matter", "Lattice QCD", "nothing here", "neutrino oscillation"] * 5)}
+        expected = {pid: assign_labels(entry["title"], entry["abstract"], self.subfield_dict) for pid, entry in metadata.items()}
+        result = label_papers(metadata, self.subfield_dict, 'labels.json', workers=2, chunk_size=3)
+        self.assertEqual(list(result.items()), list(expected.items()))
+        saved = mock_save.call_args[0][0]
+        self.assertEqual({pid: entry["labels"] for pid, entry in saved.items()}, result)
+
+        chunks = list(iter_labeled_papers(metadata.items(), self.subfield_dict, 'labels.json', chunk_size=8))
+        self.assertEqual([len(chunk) for chunk in chunks], [8, 8, 4])
+
+    @patch('scripts.label_assigner.keyword_matcher')
+    @patch('scripts.label_assigner.load_json_cache')
+    @patch('scripts.label_assigner.save_json_cache')
+    def test_label_papers_relabels_only_stale_entries(self, mock_save, mock_load, mock_matcher):
+        """Test that cached labels are reused unless the paper's text, the dictionary or the cache format changed."""
+        metadata = {"a": {"title": "SUSY", "abstract": ""}, "b": {"title": "QCD", "abstract": ""},
+                    "c": {"title": "gluon", "abstract": ""}, "d": {"title": "new", "abstract": ""}}
+        dictionary = dictionary_fingerprint(self.subfield_dict)
+        mock_load.return_value = {
+            "a": {"labels": ["Cached"], "hash": content_hash("SUSY", ""), "dictionary": dictionary},
+            "b": {"labels": ["Cached"], "hash": content_hash("old title", ""), "dictionary": dictionary},
+            "c": ["Cached"],
+        }
+        assign = mock_matcher.return_value.assign_labels
+        assign.return_value = ["Fresh"]
+        result = label_papers(metadata, self.subfield_dict, 'labels.json')
+        self.assertEqual([call[0][0] for call in assign.call_args_list], ["QCD", "gluon", "new"])
+        self.assertEqual(result, {"a": ["Cached"], "b": ["Fresh"], "c": ["Fresh"], "d": ["Fresh"]})
+        self.assertEqual(mock_save.call_args[0][0]["d"], {"labels": ["Fresh"], "hash": content_hash("new", ""),
+                                                          "dictionary": dictionary})
+
+        mock_load.return_value = mock_save.call_args[0][0]
+        mock_save.reset_mock()
+        assign.reset_mock()
+        self.assertEqual(label_papers(metadata, self.subfield_dict, 'labels.json'), result)
+        mock_save.assert_not_called()
+        assign.assert_not_called()
+
+        changed_dict = dict(self.subfield_dict, axion="Cosmology")
+        label_papers(metadata, changed_dict, 'labels.json')
+        self.assertEqual(assign.call_count, 4)
+
+    @patch('scripts.label_assigner.load_json_cache', return_value={})
+    @patch('scripts.label_assigner.save_json_cache')
+    def test_iter_labeled_papers_streams_blocks(self, mock_save, mock_load):
+        """Test that blocks are yielded while the record stream is still being produced."""
+        consumed = []
+
+        def records():
+            for i, title in enumerate(["SUSY", "QCD", "gluon", "axion", "none"]):
+                consumed.append(i)
+                yield str(i), {"title": title, "abstract": ""}
+
+        blocks = iter_labeled_papers(records(), self.subfield_dict, 'labels.json', chunk_size=2)
+        self.assertEqual(next(blocks), {"0": ["Supersymmetry"], "1": ["Quantum Chromodynamics"]})
+        self.assertLess(len(consumed), 5)
+        self.assertEqual(list(blocks), [{"2": ["Quantum Chromodynamics"], "3": ["Beyond the Standard Model"]},
+                                        {"4": ["Unknown"]}])
+        mock_save.assert_called_once()
+
+
+class TestLabelMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.interner = IdInterner(['p1', 'p2', 'p3'])
+        self.labeled_papers = {'p2': ['Math', 'Physics'], 'p1': ['Physics'], 'other': ['Math']}
+        self.label_matrix = LabelMatrix.from_dict(self.labeled_papers, self.interner)
+
+    def test_from_dict_keeps_label_order(self):
+        """Test that ranks record label order and unlabeled papers get the default label."""
+        self.assertEqual(self.label_matrix.subfields, ['Math', 'Physics', 'Unknown'])
+        self.assertEqual(self.label_matrix.ranks.tolist(), [[0, 1, 0], [1, 2, 0], [0, 0, 1]])
+        self.assertEqual(self.label_matrix.to_dict(self.interner), {'p1': ['Physics'], 'p2': ['Math', 'Physics']})
+
+    def test_builder_matches_from_dict(self):
+        """Test that adding a dict in blocks builds the same matrix as encoding it at once."""
+        builder = LabelMatrixBuilder(self.interner)
+        builder.add({'p2': ['Math', 'Physics']})
+        builder.add({'p1': ['Physics'], 'other': ['Math']})
+        built = builder.build()
+        self.assertEqual(built.subfields, self.label_matrix.subfields)
+        self.assertEqual(built.ranks.tolist(), self.label_matrix.ranks.tolist())
+        self.assertEqual(built.labeled.tolist(), self.label_matrix.labeled.tolist())
+        self.assertEqual(built.outside_counts.tolist(), self.label_matrix.outside_counts.tolist())
+
+    def test_append_encodes_only_new_papers(self):
+        """
+        Test that appending papers keeps existing rows and columns, appends new subfields, and copies the
+        shared row buffer instead of overwriting rows when an older matrix is appended to again.
+        """
+        grown = self.label_matrix.append(['p4', 'p5'], {'p4': ['Optics', 'Math'], 'p9': ['Optics']})
+        self.assertEqual(grown.subfields, ['Math', 'Physics', 'Unknown', 'Optics'])
+        self.assertEqual(grown.ranks.tolist(), [[0, 1, 0, 0], [1, 2, 0, 0], [0, 0, 1, 0], [2, 0, 0, 1], [0, 0, 1, 0]])
+        self.assertEqual(grown.labeled.tolist(), [True, True, False, True, False])
+        self.assertEqual(grown.overall_counts().tolist(), [3, 2, 0, 2])
+        again = grown.append(['p6'], {'p6': ['Math']})
+        branch = grown.append(['p7'])
+        self.assertEqual(again.ranks[5].tolist(), [1, 0, 0, 0])
+        self.assertEqual(branch.ranks[5].tolist(), [0, 0, 1, 0])
+        self.assertEqual(grown.ranks.shape, (5, 4))
+
+    def test_overall_counts(self):
+        """Test that overall counts include labeled papers outside the ID table but not default labels."""
+        self.assertEqual(self.label_matrix.overall_counts().tolist(), [2, 2, 0])
 
 
 if __name__ == '__main__':
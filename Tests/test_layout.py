@@ -0,0 +1,53 @@
+from . import test_setup
+import unittest
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+import networkx as nx
+import numpy as np
+from scripts import layout
+from scripts.citation_graph import CitationGraph
+
+class TestLayout(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        # Five cliques of eight papers joined in a ring, and one paper hanging off the first clique
+        caveman = nx.connected_caveman_graph(5, 8)
+        caveman.add_edge(0, 40)
+        self.graph = CitationGraph.from_networkx(caveman.to_directed())
+        self.labels = np.append(np.arange(40) // 8, 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_members_fill_separate_discs(self):
+        """Test that each module's members lie in a disc of their own, hubs at its centre."""
+        positions = layout.community_layout(self.graph, self.labels, seed=1, max_modules=5)
+        self.assertEqual(positions.shape, (41, 2))
+        centers = np.array([positions[self.labels == module].mean(axis=0) for module in range(5)])
+        radii = np.array([np.linalg.norm(positions[self.labels == module] - centers[module], axis=1).max()
+                          for module in range(5)])
+        gaps = np.linalg.norm(centers[:, None] - centers[None, :], axis=2) - radii[:, None] - radii[None, :]
+        self.assertTrue(np.all(gaps[~np.eye(5, dtype=bool)] > 0))
+        # The small module is packed at the rim of the module it cites
+        distances = np.linalg.norm(centers - positions[40], axis=1)
+        self.assertEqual(np.argmin(distances), 0)
+        self.assertGreater(distances[0], radii[0])
+
+    def test_positions_are_cached(self):
+        """Test that cached positions are reused for the same graph and partition, and recomputed otherwise."""
+        cache_file = os.path.join(self.test_dir, 'layout.npz')
+        positions = layout.community_layout(self.graph, self.labels, cache_file=cache_file)
+        with patch.object(layout, '_force_layout') as force_layout:
+            np.testing.assert_array_equal(layout.community_layout(self.graph, self.labels, cache_file=cache_file),
+                                          positions)
+            force_layout.assert_not_called()
+        changed = layout.community_layout(self.graph, self.labels % 2, cache_file=cache_file)
+        self.assertEqual(changed.shape, positions.shape)
+        self.assertIsNone(layout.load_layout(cache_file, layout.layout_key(self.graph, self.labels, 0, 50, 1000)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+from . import test_setup
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from scripts import main
+from scripts import data_loader as dl
+from scripts import label_assigner as la
+from scripts import community_detection as cd
+from scripts.data_access import save_json_cache
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.metadata_cache = os.path.join(self.test_dir, 'metadata_cache.json')
+        data_dir = os.path.join(os.path.dirname(__file__), '..', 'Data')
+        self.graph = dl.load_citation_graph(os.path.join(data_dir, 'cit-HepPhtest.txt'))
+        titles = ["SUSY at the LHC", "Lattice QCD", "neutrino oscillation", "nothing"]
+        self.metadata = {pid: {"title": titles[i % 4], "abstract": "dark matter" if i % 3 else ""}
+                         for i, pid in enumerate(self.graph.node_ids.tolist())}
+        save_json_cache(self.metadata, self.metadata_cache, "metadata")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_streaming_matches_staged(self):
+        """Test that the streaming pipeline gives the same labels and communities as running the stages in turn."""
+        subfield_dict = la.create_subfield_dictionary()
+        label_matrix, detection = main.stream_labels_and_communities(
+            self.graph, subfield_dict, self.metadata_cache, os.path.join(self.test_dir, 'stream_labels.json'))
+
+        labeled_papers = la.label_papers(self.metadata, subfield_dict, os.path.join(self.test_dir, 'staged_labels.json'))
+        expected = la.LabelMatrix.from_dict(labeled_papers, self.graph.interner)
+        self.assertEqual(label_matrix.subfields, expected.subfields)
+        np.testing.assert_array_equal(label_matrix.ranks, expected.ranks)
+        np.testing.assert_array_equal(detection.labels, cd.detect_community_labels(self.graph))
+        self.assertEqual(detection.backend, 'infomap')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,65 +1,131 @@
 from . import test_setup
 import unittest
-from unittest.mock import patch, MagicMock
-from scripts.metadata_extractor import query_arxiv, fetch_metadata
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+from scripts.metadata_extractor import fetch_metadata, iter_metadata
+from scripts.arxiv_fetcher import ArxivFetcher, AsyncArxivFetcher, FetchBatch
+from scripts.data_access import load_json_cache
+from .fake_arxiv_server import FakeArxivServer
 
 class TestMetadataExtractor(unittest.TestCase):
 
-    @patch('scripts.metadata_extractor.arxiv.Search')
-    def test_query_arxiv_valid_id(self, mock_search):
-        # Setup mock results from the arXiv search
-        mock_result = MagicMock()
-        mock_result.title = "Sample Title"
-        mock_result.summary = "Sample Abstract"
-        mock_result.published = "2021-01-01"
-        mock_result.authors = [MagicMock(name="Author One"), MagicMock(name="Author Two")]
-        mock_search.return_value.results.return_value = iter([mock_result])
-
-        # Call the function under test
-        result = query_arxiv('1234567')
-
-        # Assert expected results
-        self.assertIsNotNone(result)
-        self.assertEqual(result['title'], "Sample Title")
-        self.assertEqual(result['abstract'], "Sample Abstract")
-    
-    def test_query_arxiv_invalid_id(self):
-        # Call the function with an invalid paper ID
-        result = query_arxiv('invalid123')
-        # Assert that the result is None
-        self.assertIsNone(result)
-
     @patch('scripts.metadata_extractor.load_json_cache', return_value={})
     @patch('scripts.metadata_extractor.save_json_cache')
-    @patch('scripts.metadata_extractor.query_arxiv', side_effect=lambda x: {"title": "Dynamic Testing", "abstract": "Testing in progress", "published": "2022-01-01", "authors": ["Tester"]})
-    def test_fetch_metadata(self, mock_query_arxiv, mock_save_json_cache, mock_load_json_cache):
+    def test_fetch_metadata(self, mock_save_json_cache, mock_load_json_cache):
         # Prepare a list of paper IDs and the expected results
         paper_ids = ['1234567', '2345678']
+        fetcher = StubFetcher(found={pid: {"title": "Dynamic Testing", "abstract": "Testing in progress"} for pid in paper_ids})
         # Call the function
-        metadata = fetch_metadata(paper_ids)
+        metadata = fetch_metadata(paper_ids, fetcher=fetcher)
 
         # Check that metadata is fetched and cached correctly
         self.assertEqual(metadata['1234567']['title'], "Dynamic Testing")
+        self.assertEqual(fetcher.requested, paper_ids)
         self.assertTrue(mock_save_json_cache.called)
 
     @patch('scripts.metadata_extractor.load_json_cache', return_value={"1234567": {"title": "Cached Title"}})
     def test_fetch_metadata_with_cache_hit(self, mock_load_json_cache):
         # Test that cached data is used and no further API call is made
         paper_ids = ['1234567']  # This ID should be found in cache
-        metadata = fetch_metadata(paper_ids)
+        fetcher = StubFetcher()
+        metadata = fetch_metadata(paper_ids, fetcher=fetcher)
 
         # Assert that the cached data is returned
         self.assertEqual(metadata['1234567']['title'], "Cached Title")
+        self.assertEqual(fetcher.requested, [])
 
+    @patch('scripts.metadata_extractor.load_json_cache', return_value={})
     @patch('scripts.metadata_extractor.save_json_cache')
-    @patch('scripts.metadata_extractor.query_arxiv', return_value=None)
-    def test_fetch_metadata_api_failure(self, mock_query_arxiv, mock_save_json_cache):
-        # Simulate API failure
-        paper_ids = ['unknown_id']
-        metadata = fetch_metadata(paper_ids)
+    def test_fetch_metadata_api_failure(self, mock_save_json_cache, mock_load_json_cache):
+        # Papers arXiv does not know get fallback data; transient failures are not cached
+        metadata = fetch_metadata(['unknown_id', 'flaky_id'], fetcher=StubFetcher(not_found=['unknown_id'], failed=['flaky_id']))
         # Check if fallback data is used
         self.assertEqual(metadata['unknown_id']['title'], "Unknown")
+        self.assertNotIn('flaky_id', metadata)
         self.assertTrue(mock_save_json_cache.called)
 
+    @patch('scripts.metadata_extractor.load_json_cache', return_value={})
+    @patch('scripts.metadata_extractor.save_json_cache')
+    def test_fetch_metadata_only_transient_failures(self, mock_save_json_cache, mock_load_json_cache):
+        # Nothing is written when every request failed
+        metadata = fetch_metadata(['flaky_id'], fetcher=StubFetcher(failed=['flaky_id']))
+        self.assertEqual(metadata, {})
+        mock_save_json_cache.assert_not_called()
+
+    @patch('scripts.metadata_extractor.save_json_cache', return_value=True)
+    @patch('scripts.metadata_extractor.load_json_cache', return_value={"1234567": {"title": "Cached Title"}})
+    def test_fetch_metadata_journal_recovery_and_compaction(self, mock_load_json_cache, mock_save_json_cache):
+        # Records journaled by an interrupted run are reused, and the journal is compacted into the cache
+        test_dir = tempfile.mkdtemp()
+        try:
+            cache_file = os.path.join(test_dir, 'metadata_cache.json')
+            with open(cache_file + '.journal', 'w') as f:
+                f.write('["2345678", {"title": "Journaled"}]\n["3456789", {"tit')
+            fetcher = StubFetcher(found={'3456789': {"title": "Fetched 3456789"}})
+            metadata = fetch_metadata(['1234567', '2345678', '3456789'], cache_file, fetcher=fetcher)
+
+            self.assertEqual(metadata['2345678']['title'], "Journaled")
+            self.assertEqual(metadata['3456789']['title'], "Fetched 3456789")
+            self.assertEqual(fetcher.requested, ['3456789'])
+            mock_save_json_cache.assert_called_once_with(metadata, cache_file, description="metadata")
+            self.assertFalse(os.path.exists(cache_file + '.journal'))
+        finally:
+            shutil.rmtree(test_dir)
+
+    def test_fetch_metadata_from_local_server(self):
+        # End to end against the local stand-in for the arXiv API
+        test_dir = tempfile.mkdtemp()
+        try:
+            cache_file = os.path.join(test_dir, 'metadata_cache.json')
+            papers = {'hep-ph/9301253': {"title": "Served", "abstract": "From the fake server"}}
+            with FakeArxivServer(papers) as server:
+                fetcher = ArxivFetcher(url=server.url, rate=1e6, sleep=lambda seconds: None)
+                metadata = fetch_metadata(['9301253', '9301254'], cache_file, fetcher=fetcher)
+            self.assertEqual(metadata['9301253']['abstract'], "From the fake server")
+            self.assertEqual(metadata['9301254']['title'], "Unknown")
+            self.assertEqual(load_json_cache(cache_file)['9301253']['title'], "Served")
+            self.assertEqual(os.listdir(test_dir), ['metadata_cache.json'])
+        finally:
+            shutil.rmtree(test_dir)
+
+    @patch('scripts.metadata_extractor.save_json_cache', return_value=True)
+    @patch('scripts.metadata_extractor.load_json_cache', return_value={"1234567": {"title": "Cached Title"}})
+    def test_iter_metadata_streams_records(self, mock_load_json_cache, mock_save_json_cache):
+        # Cached records come first; fetched ones are journaled before they are yielded and compacted at the end
+        test_dir = tempfile.mkdtemp()
+        try:
+            cache_file = os.path.join(test_dir, 'metadata_cache.json')
+            papers = {'hep-ph/2345678': {"title": "Streamed", "abstract": "Async"}}
+            with FakeArxivServer(papers) as server:
+                records = iter_metadata(['1234567', '2345678'], cache_file, AsyncArxivFetcher(url=server.url, rate=1e6))
+                self.assertEqual(next(records), ('1234567', {"title": "Cached Title"}))
+                paper_id, metadata = next(records)
+                self.assertEqual((paper_id, metadata['title']), ('2345678', "Streamed"))
+                self.assertTrue(os.path.exists(cache_file + '.journal'))
+                mock_save_json_cache.assert_not_called()
+                self.assertEqual(list(records), [])
+            mock_save_json_cache.assert_called_once()
+            self.assertFalse(os.path.exists(cache_file + '.journal'))
+        finally:
+            shutil.rmtree(test_dir)
+
+
+class StubFetcher:
+    """ Fetcher double answering every batch from fixed outcomes. """
+
+    def __init__(self, found=None, not_found=(), failed=()):
+        self.found = found or {}
+        self.not_found = list(not_found)
+        self.failed = list(failed)
+        self.requested = []
+
+    def iter_batches(self, paper_ids):
+        self.requested.extend(paper_ids)
+        yield FetchBatch({pid: self.found[pid] for pid in paper_ids if pid in self.found},
+                         [pid for pid in paper_ids if pid in self.not_found],
+                         [pid for pid in paper_ids if pid in self.failed])
+
 if __name__ == '__main__':
     unittest.main()
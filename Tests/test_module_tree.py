@@ -0,0 +1,60 @@
+from . import test_setup
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+import numpy as np
+from scripts.module_tree import ModuleTree
+
+def tree_node(path, codelength=0.0, flow=0.0, node_id=None):
+    return SimpleNamespace(path=path, depth=len(path), is_leaf=node_id is not None, node_id=node_id,
+                           module_id=path[0] if path else 1, codelength=codelength, flow=flow)
+
+class TestModuleTree(unittest.TestCase):
+
+    def setUp(self):
+        # Module 1 splits into (1, 1) and (1, 2); module 2 holds its nodes directly; node 6 is not reported
+        nodes = [
+            tree_node((), codelength=0.5, flow=1.0),
+            tree_node((1,), codelength=0.2, flow=0.6),
+            tree_node((1, 1), codelength=1.0, flow=0.4),
+            tree_node((1, 1, 1), node_id=0), tree_node((1, 1, 2), node_id=2),
+            tree_node((1, 2), codelength=0.8, flow=0.2),
+            tree_node((1, 2, 1), node_id=1), tree_node((1, 2, 2), node_id=5),
+            tree_node((2,), codelength=0.9, flow=0.4),
+            tree_node((2, 1), node_id=3), tree_node((2, 2), node_id=4),
+        ]
+        self.tree = ModuleTree.from_infomap(MagicMock(tree=MagicMock(return_value=nodes)), num_nodes=7)
+
+    def test_from_infomap(self):
+        """Test that every level partitions all nodes and that leaf modules are carried down to deeper levels."""
+        self.assertEqual(self.tree.num_levels, 2)
+        self.assertEqual(self.tree.labels(1).tolist(), [1, 1, 1, 2, 2, 1, 3])
+        self.assertEqual(self.tree.indices(2).tolist(), [0, 1, 0, 2, 2, 1, 3])
+        self.assertEqual(self.tree.parents(2).tolist(), [0, 0, 1, 2])
+        np.testing.assert_array_equal(self.tree.parents(2)[self.tree.indices(2)], self.tree.indices(1))
+        np.testing.assert_allclose(self.tree.flows(2), [0.4, 0.2, 0.4, 0.0])
+
+    def test_codelengths(self):
+        """Test that carried-down modules add no codelength and the levels add up to the total codelength."""
+        np.testing.assert_allclose(self.tree.codelengths(1), [0.2, 0.9, 0.0])
+        np.testing.assert_allclose(self.tree.codelengths(2), [1.0, 0.8, 0.0, 0.0])
+        np.testing.assert_allclose(self.tree.level_codelengths(), [0.5, 1.1, 1.8])
+        self.assertAlmostEqual(self.tree.codelength, 3.4)
+        with self.assertRaises(ValueError):
+            self.tree.parents(1)
+        with self.assertRaises(ValueError):
+            self.tree.labels(3)
+
+    def test_from_labels(self):
+        """Test nested label arrays, nodes outside the partition, and that levels must refine each other."""
+        tree = ModuleTree.from_labels([7, 7, 3, -1, 3], [5, 6, 8, -1, 8])
+        self.assertEqual(tree.labels(1).tolist(), [7, 7, 3, -1, 3])
+        self.assertEqual(tree.labels(2).tolist(), [5, 6, 8, -1, 8])
+        self.assertEqual(tree.parents(2).tolist(), [0, 0, 1])
+        self.assertTrue(np.isnan(tree.codelength))
+        with self.assertRaises(ValueError):
+            ModuleTree.from_labels([0, 0, 1], [0, 1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
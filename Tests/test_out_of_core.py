@@ -0,0 +1,97 @@
+from . import test_setup
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from scripts import data_loader
+from scripts import out_of_core as ooc
+from scripts import synthetic_graph
+from scripts.quotient_graph import QuotientGraph
+
+class TestOutOfCore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.edge_file = os.path.join(self.temp_dir, 'edges.txt')
+        self.dates_file = os.path.join(self.temp_dir, 'dates.txt')
+        citations = synthetic_graph.synthetic_citations(3000, seed=4)
+        synthetic_graph.write_snap_files(citations, self.edge_file, self.dates_file)
+        # Duplicate a few citations across the file so runs overlap
+        with open(self.edge_file) as f:
+            lines = f.readlines()
+        with open(self.edge_file, 'a') as f:
+            f.writelines(lines[3:50])
+        self.expected = data_loader.load_citation_graph(self.edge_file, self.dates_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_spilling_interner_matches_first_appearance_order(self):
+        """Test that IDs spilled to disk keep their index and new IDs are numbered in order of first appearance."""
+        interner = ooc.SpillingInterner(self.temp_dir, max_ids=3, max_runs=2)
+        first = interner.intern(np.array(['c', 'a', 'c', 'b', 'd']))
+        second = interner.intern(np.array(['e', 'a', 'dd', 'b', 'c', 'f', 'g', 'h', 'e']))
+        self.assertEqual(first.tolist(), [0, 1, 0, 2, 3])
+        self.assertEqual(second.tolist(), [4, 1, 5, 2, 0, 6, 7, 8, 4])
+        self.assertEqual(interner.ids().tolist(), ['c', 'a', 'b', 'd', 'e', 'dd', 'f', 'g', 'h'])
+
+    def test_out_of_core_graph_matches_in_memory_graph(self):
+        """
+        Test that a load under a memory limit small enough to spill IDs and sort many runs gives the
+        nodes, dates and deduplicated successors of the in-memory loader, and is reused as a snapshot.
+        """
+        snapshot_dir = os.path.join(self.temp_dir, 'snapshot')
+        graph = ooc.load_citation_graph_out_of_core(self.edge_file, snapshot_dir, self.dates_file, memory_limit=40000)
+        expected = self.expected
+        self.assertEqual(graph.node_ids.tolist(), expected.node_ids.tolist())
+        np.testing.assert_array_equal(graph.indptr, expected.indptr)
+        np.testing.assert_array_equal(graph.dates, expected.dates)
+        for node in range(expected.number_of_nodes()):
+            self.assertEqual(graph.successors(node).tolist(), sorted(expected.successors(node).tolist()))
+        self.assertIsInstance(graph.indices, np.memmap)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['dates.txt', 'edges.txt', 'snapshot'])
+
+        reloaded = ooc.load_citation_graph_out_of_core(self.edge_file, snapshot_dir, self.dates_file, memory_limit=1)
+        np.testing.assert_array_equal(reloaded.indices, graph.indices)
+
+    def test_malformed_lines_are_skipped_in_every_chunk(self):
+        """
+        Test that lines with three fields are skipped whether they open the file or a chunk, so the
+        out-of-core graph holds exactly the two-field edges.
+        """
+        with open(self.edge_file, 'w') as f:
+            f.write("1\t2\t3\n1001\t2001\n4\t5\t6\n1002\t2002\n#a\tb\tc\n2001\t1001\n")
+        for chunk_lines in (1, 2, 3):
+            with self.subTest(chunk_lines=chunk_lines):
+                chunks = list(data_loader.iter_edge_chunks(self.edge_file, chunk_lines))
+                edges = [edge for from_papers, to_papers in chunks for edge in zip(from_papers, to_papers)]
+                self.assertEqual(edges, [('0001001', '0002001'), ('0001002', '0002002'), ('0002001', '0001001')])
+        snapshot_dir = os.path.join(self.temp_dir, 'snapshot')
+        graph = ooc.load_citation_graph_out_of_core(self.edge_file, snapshot_dir, memory_limit=1)
+        self.assertEqual(graph.node_ids.tolist(), ['0001001', '0002001', '0001002', '0002002'])
+        self.assertEqual([graph.successors(node).tolist() for node in range(4)], [[1], [0], [3], []])
+
+    def test_streaming_stats_match_in_memory_stats(self):
+        """Test that the statistics streamed over small row blocks equal those computed on the whole graph."""
+        graph = self.expected
+        labels = np.arange(graph.number_of_nodes()) % 7
+        stats = ooc.streaming_graph_stats(graph, labels, memory_limit=1000)
+        sources, targets = graph.edge_arrays()
+        in_degree = np.bincount(targets, minlength=graph.number_of_nodes())
+        num_nodes = graph.number_of_nodes()
+        self.assertEqual(stats['nodes'], num_nodes)
+        self.assertEqual(stats['edges'], graph.number_of_edges())
+        self.assertAlmostEqual(stats['density'], graph.number_of_edges() / (num_nodes * (num_nodes - 1)))
+        self.assertAlmostEqual(stats['average_degree'], graph.degree().mean())
+        self.assertEqual(stats['max_in_degree'], in_degree.max())
+        self.assertEqual(stats['max_out_degree'], np.diff(graph.indptr).max())
+        self.assertEqual(stats['isolated_nodes'], np.count_nonzero(graph.degree() == 0))
+        self.assertEqual(stats['communities'], 7)
+        self.assertEqual(stats['largest_community'], np.bincount(labels).max())
+        self.assertAlmostEqual(stats['internal_edge_fraction'], np.mean(labels[sources] == labels[targets]))
+        self.assertAlmostEqual(stats['modularity'], QuotientGraph.from_partition(graph, labels).modularity())
+
+
+if __name__ == '__main__':
+    unittest.main()
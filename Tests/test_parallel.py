@@ -0,0 +1,37 @@
+from . import test_setup
+import unittest
+import numpy as np
+import networkx as nx
+from scripts.citation_graph import CitationGraph
+from scripts import centrality as ce
+from scripts import graph_metrics as gm
+from scripts.parallel import SharedGraphPool
+
+class TestSharedGraphPool(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = CitationGraph.from_networkx(nx.gnp_random_graph(80, 0.06, seed=5, directed=True))
+        self.sources = np.arange(0, 80, 3)
+
+    def test_workers_match_serial(self):
+        """Test that results reduced from worker processes equal the in-process computation."""
+        expected_total, expected_sq = ce.accumulate_dependencies(self.graph.indptr, self.graph.indices, self.sources)
+        with SharedGraphPool(self.graph, workers=2) as pool:
+            total, total_sq = pool.accumulate_dependencies(self.sources)
+            clustering = pool.clustering()
+            subset = pool.clustering(np.array([4, 1, 60]))
+        np.testing.assert_allclose(total, expected_total, atol=1e-12)
+        np.testing.assert_allclose(total_sq, expected_sq, atol=1e-12)
+        np.testing.assert_array_equal(clustering, gm.clustering(self.graph))
+        np.testing.assert_array_equal(subset, gm.clustering(self.graph)[[4, 1, 60]])
+
+    def test_single_worker_runs_in_process(self):
+        """Test that one worker starts no pool and allocates no shared memory."""
+        with SharedGraphPool(self.graph, workers=1) as pool:
+            self.assertIsNone(pool._executor)
+            self.assertEqual(pool._segments, [])
+            values, _ = ce.betweenness_centrality(self.graph, accumulate=pool.accumulate_dependencies)
+        np.testing.assert_allclose(values, ce.betweenness_centrality(self.graph)[0], atol=1e-12)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+from . import test_setup
+import unittest
+import networkx as nx
+import numpy as np
+from scripts.quotient_graph import QuotientGraph
+from scripts.citation_graph import CitationGraph
+from scripts import graph_metrics as gm
+
+class TestQuotientGraph(unittest.TestCase):
+
+    def test_module_stats_match_networkx(self):
+        """Test cut sizes, conductance and internal edges against networkx, and that modularity terms add up."""
+        for directed in (True, False):
+            nx_graph = nx.gnm_random_graph(40, 160, seed=3, directed=directed)
+            nx_graph.add_edge(5, 5)
+            graph = CitationGraph.from_networkx(nx_graph)
+            labels = np.array([node % 3 * 10 for node in graph.node_ids])
+            quotient = QuotientGraph.from_partition(graph, labels)
+            self.assertEqual(quotient.community_ids.tolist(), [0, 10, 20])
+            self.assertAlmostEqual(quotient.modularity(), gm.modularity(graph, labels))
+            stats = quotient.module_stats()
+            for community in (0, 10, 20):
+                with self.subTest(directed=directed, community=community):
+                    members = {node for node in nx_graph if node % 3 * 10 == community}
+                    others = set(nx_graph) - members
+                    self.assertEqual(stats[community]['cut_size'], nx.cut_size(nx_graph, members, others))
+                    self.assertAlmostEqual(stats[community]['conductance'], nx.conductance(nx_graph, members, others))
+                    self.assertEqual(stats[community]['internal_edges'], nx_graph.subgraph(members).number_of_edges())
+            if not directed:
+                np.testing.assert_array_equal(quotient.matrix.toarray(), quotient.matrix.toarray().T)
+
+    def test_coarsen_and_add_edges(self):
+        """Test that merging communities and adding or removing edges match collapsing the graph again."""
+        nx_graph = nx.gnm_random_graph(30, 90, seed=5)
+        graph = CitationGraph.from_networkx(nx_graph)
+        labels = np.array(graph.node_ids) % 4
+        quotient = QuotientGraph.from_partition(graph, labels)
+        coarse = quotient.coarsen([0, 1, 0, 1], community_ids=[7, 8])
+        expected = QuotientGraph.from_partition(graph, labels % 2)
+        self.assertEqual(coarse.community_ids.tolist(), [7, 8])
+        np.testing.assert_array_equal(coarse.matrix.toarray(), expected.matrix.toarray())
+        # Removing every edge in the opposite orientation empties an undirected quotient graph
+        sources, targets = graph.edge_arrays()
+        emptied = quotient.add_edges(labels[targets], labels[sources], -1)
+        self.assertEqual(emptied.counts.nnz, 0)
+        self.assertEqual(quotient.resize(6).num_modules, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
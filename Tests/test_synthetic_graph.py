@@ -0,0 +1,60 @@
+from . import test_setup
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from scripts import synthetic_graph as sg
+from scripts import data_loader as dl
+from scripts import label_assigner as la
+
+class TestSyntheticGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_generates_seeded_citation_dag(self):
+        """Test that the graph is reproducible, only cites earlier papers and has the requested size."""
+        citations = sg.synthetic_citations(20000, seed=3)
+        again = sg.synthetic_citations(20000, seed=3)
+        for field, other in zip(citations, again):
+            np.testing.assert_array_equal(field, other)
+        self.assertFalse(np.array_equal(citations.targets[:1000], sg.synthetic_citations(20000, seed=4).targets[:1000]))
+
+        self.assertTrue(np.all(citations.sources > citations.targets))
+        self.assertTrue(np.all(np.diff(citations.dates.astype(np.int64)) >= 0))
+        self.assertEqual(len(np.unique(citations.paper_ids)), len(citations.paper_ids))
+        self.assertEqual(len(np.unique(citations.sources * len(citations.paper_ids) + citations.targets)),
+                         len(citations.sources))
+        self.assertGreater(len(citations.sources), 0.95 * 20000)
+        in_degree = np.bincount(citations.targets, minlength=len(citations.paper_ids))
+        self.assertGreater(in_degree.max(), 10 * in_degree.mean())
+
+    def test_round_trip_through_loader(self):
+        """Test that the written SNAP files load back into the same graph with its dates."""
+        citations = sg.synthetic_citations(5000, seed=1)
+        edge_file, dates_file = os.path.join(self.test_dir, 'edges.txt'), os.path.join(self.test_dir, 'dates.txt')
+        sg.write_snap_files(citations, edge_file, dates_file)
+        graph = dl.load_citation_graph(edge_file, dates_file)
+        self.assertEqual(graph.number_of_edges(), len(citations.sources))
+        index = graph.interner.index_of([f"{paper_id:07d}" for paper_id in citations.paper_ids.tolist()])
+        sources, targets = graph.edge_arrays()
+        self.assertEqual(set(zip(sources.tolist(), targets.tolist())),
+                         set(zip(index[citations.sources].tolist(), index[citations.targets].tolist())))
+        # Papers without citations in either direction are not part of the edge list
+        in_graph = index >= 0
+        np.testing.assert_array_equal(graph.dates[index[in_graph]], citations.dates[in_graph])
+
+    def test_metadata_is_labeled(self):
+        """Test that synthetic abstracts carry keywords the labeler recognizes."""
+        subfield_dict = la.create_subfield_dictionary()
+        metadata = sg.synthetic_metadata([str(i) for i in range(50)], subfield_dict, seed=0)
+        labels = [la.assign_labels(record['title'], record['abstract'], subfield_dict) for record in metadata.values()]
+        self.assertTrue(all(labels))
+
+
+if __name__ == '__main__':
+    unittest.main()
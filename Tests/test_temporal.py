@@ -0,0 +1,56 @@
+from . import test_setup
+import unittest
+import networkx as nx
+import numpy as np
+from scripts import temporal as tp
+from scripts.citation_graph import CitationGraph
+from scripts.label_assigner import LabelMatrix
+
+class TestTemporal(unittest.TestCase):
+
+    def setUp(self):
+        # Three cliques of four papers joined in a ring, one clique submitted per year; paper 12 has no date and its citation cannot be placed
+        caveman = nx.connected_caveman_graph(3, 4).to_directed()
+        caveman.add_edges_from([(0, 12), (4, 12), (12, 8)])
+        self.graph = CitationGraph.from_networkx(caveman)
+        years = [str(1992 + node // 4) for node in range(12)] + ['NaT']
+        self.graph.dates = np.array(years, dtype='datetime64[Y]').astype('datetime64[D]')[self.graph.node_ids.astype(int)]
+        labeled_papers = {node: ['Physics'] if node < 8 else ['Math'] for node in range(13)}
+        self.label_matrix = LabelMatrix.from_dict(labeled_papers, self.graph.interner)
+
+    def test_index_slices_periods(self):
+        """Test that citations enter with their later paper and undated papers with their first citation."""
+        index = tp.TemporalIndex(self.graph, 'year')
+        self.assertEqual(index.periods.astype(str).tolist(), ['1992', '1993', '1994'])
+        self.assertEqual(index.undated_edges, 1)
+        entered = []
+        for position in range(len(index)):
+            nodes, sources, targets = index.delta(position)
+            entered.extend(self.graph.node_ids[nodes].tolist())
+            periods = np.fmax(self.graph.dates[sources], self.graph.dates[targets]).astype('datetime64[Y]')
+            self.assertTrue(np.all(periods == index.periods[position]))
+        self.assertEqual(sorted(entered), list(range(13)))
+        self.assertEqual(entered.index(12), 4)
+        months = tp.TemporalIndex(self.graph, 'month')
+        self.assertEqual(len(months), 25)
+        self.assertEqual(len(months.delta(1)[0]), 0)
+        with self.assertRaises(ValueError):
+            tp.TemporalIndex(self.graph, 'week')
+
+    def test_community_snapshots(self):
+        """Test that each snapshot grows the previous one and that communities keep their labels."""
+        snapshots = tp.community_snapshots(self.graph, self.label_matrix, 'year', seed=1)
+        self.assertEqual([snapshot.graph.number_of_nodes() for snapshot in snapshots], [5, 9, 13])
+        self.assertEqual(snapshots[-1].graph.number_of_edges(), self.graph.number_of_edges() - 1)
+        for before, after in zip(snapshots, snapshots[1:]):
+            np.testing.assert_array_equal(after.graph.node_ids[:len(before.labels)], before.graph.node_ids)
+        first_clique = snapshots[0].labels[0]
+        for snapshot in snapshots:
+            self.assertTrue(np.all(snapshot.labels[:4] == first_clique))
+            self.assertEqual(snapshot.community_stats[first_clique]['dominant_subfield'], 'Physics')
+        np.testing.assert_array_equal(snapshots[-1].graph.dates, self.graph.dates[snapshots[-1].graph.node_ids.astype(int)])
+        self.assertEqual(len(snapshots[-1].community_stats), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
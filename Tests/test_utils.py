@@ -1,7 +1,9 @@
 from . import test_setup
 import unittest
 from unittest.mock import mock_open, patch, call
-from scripts.utils import save_analysis, format_paper_id
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from scripts.utils import save_analysis, save_snapshots, format_paper_id
 
 class TestSaveCommunityAnalysis(unittest.TestCase):
     @patch('builtins.open', new_callable=mock_open)
@@ -47,6 +49,22 @@ class TestSaveCommunityAnalysis(unittest.TestCase):
         handle.write.assert_any_call("  dominant_subfield: Electroweak Physics\n")
         handle.write.assert_any_call("  subfields: {'Gravitational Physics': 600, 'Electroweak Physics': 5586}\n")
 
+        save_analysis(community_stats, global_stats, output_file, level=2)
+        handle.write.assert_any_call("Community Specific Metrics (level 2):\n")
+
+    @patch('builtins.open', new_callable=mock_open)
+    def test_save_snapshots(self, mock_file):
+        """Test that each snapshot lists its size and its largest communities first."""
+        graph = MagicMock(number_of_nodes=MagicMock(return_value=3), number_of_edges=MagicMock(return_value=2))
+        community_stats = {0: {'count': 1, 'dominant_subfield': 'Math', 'dominant_percentage': 100.0},
+                           4: {'count': 2, 'dominant_subfield': 'Physics', 'dominant_percentage': 50.0}}
+        snapshot = SimpleNamespace(period='1993', graph=graph, community_stats=community_stats, modularity=0.25)
+        save_snapshots([snapshot], 'snapshots.txt', top=1)
+        handle = mock_file.return_value.__enter__.return_value
+        written = [args[0] for args, _ in handle.write.call_args_list]
+        self.assertEqual(written, ["Snapshot 1993:\n", "  papers: 3\n", "  citations: 2\n", "  communities: 2\n",
+                                   "  modularity: 0.25\n", "  Community 4: 2 papers, Physics (50.0%)\n", "\n"])
+
 
 class TestFormatPaperId(unittest.TestCase):
 
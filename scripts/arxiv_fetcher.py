@@ -0,0 +1,394 @@
+import asyncio
+import collections as col
+import queue
+import random
+import re as regex
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+import aiohttp
+import requests
+
+ARXIV_API_URL = "http://export.arxiv.org/api/query"
+ATOM = '{http://www.w3.org/2005/Atom}'
+
+FetchBatch = col.namedtuple('FetchBatch', ['found', 'not_found', 'failed'])
+FetchBatch.__doc__ = """
+Outcome of fetching one id_list batch.
+
+Attributes:
+    found (dict): Paper ID -> metadata record for the papers arXiv returned.
+    not_found (list): Paper IDs arXiv answered for but does not know.
+    failed (list): Paper IDs whose request kept failing; they should be retried on a later run.
+"""
+
+
+def arxiv_id(paper_id):
+    """ Return the arXiv identifier of a paper ID, prefixing bare seven-digit IDs with "hep-ph/". """
+    if paper_id.isdigit() and len(paper_id) == 7:
+        return f"hep-ph/{paper_id}"
+    return paper_id
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: at most `capacity` requests at once, refilled at `rate` per second.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Largest number of tokens held, i.e. the allowed burst.
+        clock (callable): Monotonic clock, replaceable in tests.
+        sleep (callable): Sleep function, replaceable in tests.
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """ Take one token now and return how many seconds the caller must wait before using it. """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            self._tokens -= 1
+            return wait
+
+    def acquire(self):
+        """ Take one token, waiting until one is available. """
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+
+
+class RequestsTransport:
+    """
+    Default transport: one `requests.Session`, so connections are kept alive between batches.
+
+    A transport is any callable taking (url, params, timeout) and returning (status code, body bytes);
+    network errors are raised as exceptions.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+
+    def __call__(self, url, params, timeout):
+        response = self.session.get(url, params=params, timeout=timeout)
+        return response.status_code, response.content
+
+
+class AtomFeedParser:
+    """
+    Incremental parser for arXiv API Atom feeds.
+
+    Bytes can be fed as they arrive from the network; each entry is turned into a metadata record
+    as soon as its closing tag is read and its element is then cleared, so memory does not grow
+    with the size of the response.
+
+    Attributes:
+        records (dict): arXiv ID without version -> metadata record, for the entries read so far.
+        is_error (bool): Whether the feed carried an API error report.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=('end',))
+        self.records = {}
+        self.is_error = False
+
+    def feed(self, data):
+        """ Parse another chunk of the response body. """
+        self._parser.feed(data)
+        self._read_entries()
+
+    def close(self):
+        """ Finish parsing; raises `ET.ParseError` if the feed is incomplete. """
+        self._parser.close()
+        self._read_entries()
+        return self.records, self.is_error
+
+    def _read_entries(self):
+        for _, element in self._parser.read_events():
+            if element.tag != ATOM + 'entry':
+                continue
+            entry_id = element.findtext(ATOM + 'id', '').strip()
+            if '/api/errors' in entry_id:
+                self.is_error = True
+            else:
+                self.records[_strip_version(entry_id)] = _entry_record(element)
+            element.clear()
+
+
+def parse_atom_feed(body):
+    """
+    Parse an arXiv API Atom feed.
+
+    Args:
+        body (bytes): The response body.
+
+    Returns:
+        tuple: ({arXiv ID without version: metadata record}, whether the feed is an API error report).
+    """
+    parser = AtomFeedParser()
+    parser.feed(body)
+    return parser.close()
+
+
+def _strip_version(entry_id):
+    return regex.sub(r'v\d+$', '', entry_id.split('/abs/', 1)[-1])
+
+
+def _entry_record(entry):
+    published = entry.findtext(ATOM + 'published', '').strip()
+    return {
+        "title": ' '.join(entry.findtext(ATOM + 'title', '').split()),
+        "abstract": entry.findtext(ATOM + 'summary', '').strip(),
+        "published": datetime.fromisoformat(published.replace('Z', '+00:00')) if published else None,
+        "authors": [author.findtext(ATOM + 'name', '').strip() for author in entry.iter(ATOM + 'author')]
+    }
+
+
+class ArxivFetcher:
+    """
+    Fetches paper metadata from the arXiv API in id_list batches.
+
+    Requests pass through a token bucket (arXiv asks for no more than one request every three
+    seconds) and are retried with exponential backoff and jitter on network errors, HTTP statuses
+    other than 200 and 400, and empty feeds; a batch that only ever gets empty feeds is not found.
+    A batch rejected as a whole because one of its IDs is malformed is split in half until the bad
+    IDs are isolated. Papers are reported as found, not found, or failed; only failures are transient.
+
+    Args:
+        transport (callable): (url, params, timeout) -> (status, body); defaults to `RequestsTransport`.
+        batch_size (int): Number of IDs per request.
+        rate (float): Requests per second allowed by the token bucket.
+        burst (int): Requests allowed back to back before the rate applies.
+        max_retries (int): Retries of a request before its papers count as failed.
+        backoff (float): Base delay in seconds, doubled on every retry.
+        timeout (float): Timeout of one request in seconds.
+        url (str): API endpoint.
+        sleep (callable): Sleep function, replaceable in tests.
+    """
+
+    def __init__(self, transport=None, batch_size=100, rate=1 / 3, burst=1, max_retries=4, backoff=3.0,
+                 timeout=30.0, url=ARXIV_API_URL, sleep=time.sleep):
+        self.transport = transport or RequestsTransport()
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(rate, burst, sleep=sleep)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.url = url
+        self.sleep = sleep
+        self._random = random.Random()
+
+    def iter_batches(self, paper_ids):
+        """
+        Fetch metadata batch by batch.
+
+        Args:
+            paper_ids (list): Paper IDs in the dataset's form.
+
+        Yields:
+            FetchBatch: The outcome of each batch, as soon as it is known.
+        """
+        paper_ids = list(dict.fromkeys(paper_ids))
+        for start in range(0, len(paper_ids), self.batch_size):
+            yield self._fetch_batch(paper_ids[start:start + self.batch_size])
+
+    def fetch(self, paper_ids):
+        """ Fetch every paper and merge the batch outcomes into one `FetchBatch`. """
+        return _merge_batches(self.iter_batches(paper_ids))
+
+    def _fetch_batch(self, paper_ids):
+        ids = {arxiv_id(paper_id): paper_id for paper_id in paper_ids}
+        params = {'id_list': ','.join(ids), 'max_results': len(ids)}
+        only_empty = True
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.sleep(self._random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            self.bucket.acquire()
+            try:
+                status, body = self.transport(self.url, params, self.timeout)
+                records, is_error = parse_atom_feed(body) if status == 200 else ({}, False)
+            except Exception as e:
+                print(f"Error querying arXiv for {len(ids)} papers (attempt {attempt + 1}): {e}")
+                only_empty = False
+                continue
+            outcome = _settle_batch(paper_ids, ids, status, records, is_error)
+            if outcome is _SPLIT:
+                return self._split_batch(paper_ids)
+            if isinstance(outcome, FetchBatch):
+                return outcome
+            only_empty = only_empty and outcome is _EMPTY
+        return _exhausted_batch(paper_ids, only_empty)
+
+    def _split_batch(self, paper_ids):
+        if len(paper_ids) == 1:
+            return FetchBatch({}, list(paper_ids), [])
+        middle = len(paper_ids) // 2
+        return _merge_batches([self._fetch_batch(paper_ids[:middle]), self._fetch_batch(paper_ids[middle:])])
+
+
+class AsyncArxivFetcher(ArxivFetcher):
+    """
+    Asynchronous variant of `ArxivFetcher` built on one pooled `aiohttp` session.
+
+    Batches are requested concurrently, at most `concurrency` at a time, over keep-alive connections,
+    still within the token bucket's rate. Responses are parsed with `AtomFeedParser` while they
+    stream in, and batches are yielded in completion order. The rate, retry and splitting rules are
+    those of `ArxivFetcher`.
+
+    `aiter_batches` is an async generator for callers with an event loop; `iter_batches` runs the
+    loop on a background thread so synchronous callers can consume batches while the next ones
+    are still in flight.
+
+    Args:
+        concurrency (int): Largest number of requests in flight.
+        Other arguments are those of `ArxivFetcher`, except `transport` and `sleep`.
+    """
+
+    def __init__(self, batch_size=100, rate=1 / 3, burst=1, max_retries=4, backoff=3.0, timeout=30.0,
+                 url=ARXIV_API_URL, concurrency=4):
+        super().__init__(transport=_no_transport, batch_size=batch_size, rate=rate, burst=burst,
+                         max_retries=max_retries, backoff=backoff, timeout=timeout, url=url)
+        self.concurrency = concurrency
+
+    async def aiter_batches(self, paper_ids):
+        """
+        Fetch metadata batch by batch on the running event loop.
+
+        Args:
+            paper_ids (list): Paper IDs in the dataset's form.
+
+        Yields:
+            FetchBatch: The outcome of each batch, in completion order.
+        """
+        paper_ids = list(dict.fromkeys(paper_ids))
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            tasks = [asyncio.ensure_future(self._fetch_batch_async(session, semaphore, paper_ids[start:start + self.batch_size]))
+                     for start in range(0, len(paper_ids), self.batch_size)]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    yield await task
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def iter_batches(self, paper_ids):
+        """ Fetch metadata batch by batch, running the event loop on a background thread. """
+        results = queue.Queue()
+        stop = threading.Event()
+        thread = threading.Thread(target=asyncio.run, args=(self._produce(paper_ids, results, stop),), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    async def _produce(self, paper_ids, results, stop):
+        try:
+            async for batch in self.aiter_batches(paper_ids):
+                if stop.is_set():
+                    break
+                results.put(batch)
+        except Exception as e:
+            results.put(e)
+        finally:
+            results.put(_DONE)
+
+    async def _fetch_batch_async(self, session, semaphore, paper_ids):
+        ids = {arxiv_id(paper_id): paper_id for paper_id in paper_ids}
+        params = {'id_list': ','.join(ids), 'max_results': str(len(ids))}
+        only_empty = True
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            await asyncio.sleep(self.bucket.reserve())
+            try:
+                async with semaphore, session.get(self.url, params=params) as response:
+                    status = response.status
+                    parser = AtomFeedParser()
+                    if status == 200:
+                        async for chunk in response.content.iter_chunked(1 << 16):
+                            parser.feed(chunk)
+                        parser.close()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ET.ParseError) as e:
+                print(f"Error querying arXiv for {len(ids)} papers (attempt {attempt + 1}): {e}")
+                only_empty = False
+                continue
+            outcome = _settle_batch(paper_ids, ids, status, parser.records, parser.is_error)
+            if outcome is _SPLIT:
+                if len(paper_ids) == 1:
+                    return FetchBatch({}, list(paper_ids), [])
+                middle = len(paper_ids) // 2
+                return _merge_batches(await asyncio.gather(self._fetch_batch_async(session, semaphore, paper_ids[:middle]),
+                                                           self._fetch_batch_async(session, semaphore, paper_ids[middle:])))
+            if isinstance(outcome, FetchBatch):
+                return outcome
+            only_empty = only_empty and outcome is _EMPTY
+        return _exhausted_batch(paper_ids, only_empty)
+
+
+# Markers used by `_settle_batch` and by `AsyncArxivFetcher.iter_batches`
+_SPLIT = object()
+_EMPTY = object()
+_RETRY = object()
+_DONE = object()
+
+
+def _settle_batch(paper_ids, ids, status, records, is_error):
+    """
+    Decide what an answer means for a batch.
+
+    Returns:
+        FetchBatch, `_SPLIT` when the batch must be bisected to isolate malformed IDs, or `_RETRY` or
+        `_EMPTY` when the request should be retried.
+    """
+    if status == 400 or (status == 200 and is_error and not records):
+        # The API rejects a whole id_list when one of its IDs is malformed
+        return _SPLIT
+    if status != 200:
+        return _RETRY
+    if not records:
+        # arXiv occasionally answers a valid query with an empty feed, but unknown IDs get one too
+        return _EMPTY
+    found = {ids[key]: record for key, record in records.items() if key in ids}
+    return FetchBatch(found, [paper_id for paper_id in paper_ids if paper_id not in found], [])
+
+
+def _exhausted_batch(paper_ids, only_empty):
+    """ Outcome of a batch whose retries ran out: not found if every answer was an empty feed, else failed. """
+    if only_empty:
+        return FetchBatch({}, list(paper_ids), [])
+    return FetchBatch({}, [], list(paper_ids))
+
+
+def _merge_batches(batches):
+    merged = FetchBatch({}, [], [])
+    for batch in batches:
+        merged.found.update(batch.found)
+        merged.not_found.extend(batch.not_found)
+        merged.failed.extend(batch.failed)
+    return merged
+
+
+def _no_transport(url, params, timeout):
+    raise RuntimeError("AsyncArxivFetcher fetches through its aiohttp session.")
@@ -0,0 +1,187 @@
+import math
+import numpy as np
+
+BETWEENNESS_MODES = ('exact', 'kpivot', 'adaptive')
+
+
+def source_dependencies(indptr, indices, source):
+    """
+    Brandes dependencies of every node on shortest paths from one source.
+
+    The breadth-first search runs level by level on the CSR arrays: each level gathers the out-edges
+    of the whole frontier at once, and the dependencies are accumulated back level by level.
+
+    Args:
+        indptr (np.ndarray): CSR row offsets.
+        indices (np.ndarray): CSR successor lists.
+        source (int): Source node index.
+
+    Returns:
+        np.ndarray: delta_s(v) for every node v, with delta_s(source) = 0.
+    """
+    num_nodes = len(indptr) - 1
+    distance = np.full(num_nodes, -1, dtype=np.int64)
+    sigma = np.zeros(num_nodes)
+    distance[source] = 0
+    sigma[source] = 1.0
+
+    levels = []
+    frontier = np.array([source], dtype=np.int64)
+    depth = 0
+    while frontier.size:
+        starts = indptr[frontier]
+        lengths = indptr[frontier + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            break
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        parents = np.repeat(frontier, lengths)
+        children = indices[offsets].astype(np.int64)
+
+        discovered = children[distance[children] < 0]
+        distance[discovered] = depth + 1
+        on_path = distance[children] == depth + 1
+        parents, children = parents[on_path], children[on_path]
+        sigma += np.bincount(children, weights=sigma[parents], minlength=num_nodes)
+        levels.append((parents, children))
+        frontier = np.unique(discovered)
+        depth += 1
+
+    delta = np.zeros(num_nodes)
+    for parents, children in reversed(levels):
+        contribution = sigma[parents] / sigma[children] * (1.0 + delta[children])
+        delta += np.bincount(parents, weights=contribution, minlength=num_nodes)
+    delta[source] = 0.0
+    return delta
+
+
+def accumulate_dependencies(indptr, indices, sources):
+    """
+    Sum the Brandes dependencies, and their squares, over a set of source nodes.
+
+    Args:
+        indptr (np.ndarray): CSR row offsets.
+        indices (np.ndarray): CSR successor lists.
+        sources (iterable): Source node indices.
+
+    Returns:
+        tuple: (sum of delta_s, sum of delta_s ** 2) arrays over nodes.
+    """
+    num_nodes = len(indptr) - 1
+    total = np.zeros(num_nodes)
+    total_sq = np.zeros(num_nodes)
+    for source in sources:
+        delta = source_dependencies(indptr, indices, int(source))
+        total += delta
+        total_sq += delta * delta
+    return total, total_sq
+
+
+def betweenness_centrality(graph, mode='exact', samples=None, epsilon=0.01, delta=0.1, seed=None, accumulate=None):
+    """
+    Normalized betweenness centrality of every node, exact or estimated from sampled sources.
+
+    Values are on the scale of `nx.betweenness_centrality(graph)`. The sampled modes use the estimator
+    networkx >= 3.5 uses for `k` pivots (see `_rescale`) and report a bound `epsilon` such that, with
+    probability at least 1 - `delta`, every node's estimate is within `epsilon` of its exact value:
+
+    - 'exact': every node is a source; the error is 0.
+    - 'kpivot': `samples` sources drawn without replacement; the bound follows from Hoeffding's
+      inequality with a union bound over nodes.
+    - 'adaptive': sources are drawn in doubling batches until the empirical Bernstein bound of every
+      node falls to the target `epsilon`, or every node has been used as a source.
+
+    Args:
+        graph (CitationGraph): The graph.
+        mode (str): One of 'exact', 'kpivot' or 'adaptive'.
+        samples (int): Number of pivots for 'kpivot'.
+        epsilon (float): Target absolute error for 'adaptive'.
+        delta (float): Failure probability of the reported bound.
+        seed (int): Seed for pivot sampling.
+        accumulate (callable): Optional replacement for `accumulate_dependencies` taking only the sources,
+            such as `SharedGraphPool.accumulate_dependencies` to spread the sources over processes.
+
+    Returns:
+        tuple: (betweenness array, info dict with 'mode', 'samples', 'epsilon' and 'delta').
+    """
+    if mode not in BETWEENNESS_MODES:
+        raise ValueError(f"Unknown betweenness mode '{mode}', expected one of {BETWEENNESS_MODES}.")
+    if mode == 'kpivot' and not samples:
+        raise ValueError("The 'kpivot' betweenness mode needs a number of samples.")
+
+    if accumulate is None:
+        def accumulate(sources):
+            return accumulate_dependencies(graph.indptr, graph.indices, sources)
+
+    num_nodes = graph.number_of_nodes()
+    if mode == 'exact':
+        order, limit, batch = np.arange(num_nodes), num_nodes, num_nodes
+    else:
+        order = np.random.default_rng(seed).permutation(num_nodes)
+        limit = num_nodes if mode == 'adaptive' else min(samples, num_nodes)
+        batch = limit
+    if mode == 'adaptive':
+        # The bound cannot reach epsilon before its 7 * log / (3 * m) term does
+        log_term = math.log(4 * max(num_nodes, 1) / delta)
+        batch = min(num_nodes, int(math.ceil(7 * log_term / (3 * epsilon))) + 1)
+        checkpoints = int(math.ceil(math.log2(num_nodes / batch))) + 1 if num_nodes > batch else 1
+
+    total = np.zeros(num_nodes)
+    total_sq = np.zeros(num_nodes)
+    used = 0
+    achieved = 1.0
+    while used < limit:
+        batch_total, batch_sq = accumulate(order[used:used + batch])
+        total += batch_total
+        total_sq += batch_sq
+        used = min(used + batch, limit)
+        if mode == 'adaptive':
+            achieved = _bernstein_bound(total, total_sq, order[:used], num_nodes, delta / checkpoints)
+            if achieved <= epsilon:
+                break
+            batch = used
+
+    if used >= num_nodes:
+        achieved = 0.0
+    elif mode == 'kpivot':
+        achieved = min(math.sqrt(math.log(2 * num_nodes / delta) / (2 * max(used - 1, 1))), 1.0)
+    info = {'mode': mode, 'samples': used, 'epsilon': achieved, 'delta': delta if achieved else 0.0}
+    return _rescale(total, num_nodes, order[:used]), info
+
+
+def _rescale(total, num_nodes, sources):
+    """
+    Normalize summed dependencies as networkx >= 3.5 does, including its correction for sampled sources.
+
+    Earlier releases, such as the pinned 3.0, scale every node by n / k when `k` sources are sampled; here
+    a node that was itself a source is averaged over the k - 1 other sources, which the bounds assume.
+    """
+    if num_nodes <= 2:
+        return total
+    used = len(sources)
+    if used >= num_nodes:
+        return total / ((num_nodes - 1) * (num_nodes - 2))
+    scale = np.full(num_nodes, 1 / (used * (num_nodes - 2)))
+    scale[sources] = 1 / ((used - 1) * (num_nodes - 2)) if used > 1 else math.nan
+    return total * scale
+
+
+def _bernstein_bound(total, total_sq, sources, num_nodes, delta):
+    """
+    Largest empirical Bernstein deviation bound over all nodes (Maurer and Pontil, 2009).
+
+    Each sample is delta_s(v) / (n - 2), which lies in [0, 1] and whose mean over sources s != v is the
+    normalized betweenness of v. Nodes that were sampled as sources have one observation fewer.
+    """
+    if num_nodes <= 2:
+        return 0.0
+    count = np.full(num_nodes, float(len(sources)))
+    count[sources] -= 1
+    if count.min() < 2:
+        return 1.0
+    scale = num_nodes - 2
+    mean = total / scale / count
+    variance = np.maximum((total_sq / scale ** 2 - count * mean ** 2) / (count - 1), 0.0)
+    log_term = math.log(4 * num_nodes / delta)
+    bound = np.sqrt(2 * variance * log_term / count) + 7 * log_term / (3 * (count - 1))
+    return float(min(bound.max(), 1.0))
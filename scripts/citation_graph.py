@@ -0,0 +1,398 @@
+import numpy as np
+import networkx as nx
+import pandas as pd
+import scipy.sparse as sparse
+from scripts.id_interner import IdInterner
+
+# Abandoned slots a GrowingGraph tolerates before compacting its row buffers, besides one per stored entry
+MIN_COMPACTION_SLOTS = 1024
+
+
+class CitationGraph:
+    """
+    Lightweight directed graph stored as compressed sparse row (CSR) arrays.
+
+    Nodes are dense integer indices into `node_ids`; the successors of node `i`
+    are `indices[indptr[i]:indptr[i + 1]]`.
+
+    Attributes:
+        interner (IdInterner): Shared table mapping paper IDs to node indices.
+        indptr (np.ndarray): Row offsets of length `number_of_nodes() + 1`.
+        indices (np.ndarray): Concatenated successor lists.
+        directed (bool): Whether edges are directed. Undirected graphs store every edge in both rows.
+        dates (np.ndarray or None): Submission date of each node as datetime64[D], NaT where unknown.
+    """
+
+    def __init__(self, node_ids, indptr, indices, directed=True, dates=None):
+        self.interner = node_ids if isinstance(node_ids, IdInterner) else IdInterner(node_ids)
+        self.indptr = indptr
+        self.indices = indices
+        self.directed = directed
+        self.dates = dates
+
+    @property
+    def node_ids(self):
+        """ Paper ID for each node index. """
+        return self.interner.ids
+
+    @classmethod
+    def from_edges(cls, sources, targets, node_ids, directed=True):
+        """
+        Build a CSR graph from integer edge arrays.
+
+        Duplicate edges are dropped and each row keeps the order in which its edges first
+        appeared, which mirrors the adjacency order of a networkx graph built edge by edge.
+
+        Args:
+            sources (np.ndarray): Source node index of each edge.
+            targets (np.ndarray): Target node index of each edge.
+            node_ids (np.ndarray or IdInterner): Paper ID for each node index.
+            directed (bool): Whether the edges are directed.
+
+        Returns:
+            CitationGraph: The graph in CSR form.
+        """
+        num_nodes = len(node_ids)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if not directed:
+            sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+
+        keys = sources * max(num_nodes, 1) + targets
+        _, first_seen = np.unique(keys, return_index=True)
+        first_seen.sort()
+        sources, targets = sources[first_seen], targets[first_seen]
+
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+        return cls(node_ids, indptr, targets[order].astype(np.int32), directed)
+
+    @classmethod
+    def from_networkx(cls, graph, nodes=None):
+        """
+        Build a CSR graph from a networkx graph.
+
+        Args:
+            graph (nx.Graph): A directed or undirected networkx graph.
+            nodes (iterable): Optional node order; graph nodes not listed are appended in networkx order.
+
+        Returns:
+            CitationGraph: The graph in CSR form.
+        """
+        node_ids = list(dict.fromkeys(node for node in (nodes or ()) if node in graph))
+        listed = set(node_ids)
+        node_ids += [node for node in graph.nodes() if node not in listed]
+        node_ids = np.fromiter(node_ids, dtype=object, count=len(node_ids))
+        node_to_int = {node: idx for idx, node in enumerate(node_ids)}
+        edges = np.array([(node_to_int[u], node_to_int[v]) for u, v in graph.edges()], dtype=np.int64).reshape(-1, 2)
+        return cls.from_edges(edges[:, 0], edges[:, 1], node_ids, directed=graph.is_directed())
+
+    def __len__(self):
+        return self.number_of_nodes()
+
+    def number_of_nodes(self):
+        return len(self.indptr) - 1
+
+    def number_of_edges(self):
+        if self.directed:
+            return len(self.indices)
+        return (len(self.indices) + self.number_of_selfloops()) // 2
+
+    def number_of_selfloops(self):
+        return int(np.count_nonzero(self.row_indices() == self.indices))
+
+    def row_indices(self):
+        """ Return the source node index of every stored CSR entry. """
+        return np.repeat(np.arange(self.number_of_nodes(), dtype=np.int32), np.diff(self.indptr))
+
+    def edge_arrays(self):
+        """
+        Return the edges as parallel source/target index arrays.
+
+        Returns:
+            tuple: (sources, targets) arrays. Undirected edges are listed once, with source <= target.
+        """
+        sources, targets = self.row_indices(), self.indices
+        if not self.directed:
+            keep = sources <= targets
+            sources, targets = sources[keep], targets[keep]
+        return sources, targets
+
+    def successors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def out_degree(self):
+        return np.diff(self.indptr)
+
+    def in_degree(self):
+        return np.bincount(self.indices, minlength=self.number_of_nodes())
+
+    def degree(self):
+        """ Return node degrees using networkx conventions (in + out for directed graphs, self-loops count twice). """
+        if self.directed:
+            return self.out_degree() + self.in_degree()
+        loops = np.bincount(self.indices[self.row_indices() == self.indices], minlength=self.number_of_nodes())
+        return self.out_degree() + loops
+
+    def adjacency_matrix(self):
+        """ Return the binary adjacency matrix as a scipy CSR matrix sharing this graph's index arrays. """
+        num_nodes = self.number_of_nodes()
+        data = np.ones(len(self.indices), dtype=np.float64)
+        return sparse.csr_matrix((data, self.indices, self.indptr), shape=(num_nodes, num_nodes))
+
+    def to_undirected(self):
+        """ Return the undirected graph with an edge wherever this graph has one in either direction. """
+        if not self.directed:
+            return self
+        sources, targets = self.edge_arrays()
+        graph = CitationGraph.from_edges(sources, targets, self.interner, directed=False)
+        graph.dates = self.dates
+        return graph
+
+    def edge_subgraph(self, keep):
+        """
+        Return the graph restricted to a subset of its stored CSR entries, keeping every node.
+
+        Args:
+            keep (np.ndarray): Boolean mask over `indices`. For undirected graphs it must keep both directions of an edge.
+
+        Returns:
+            CitationGraph: The filtered graph, sharing this graph's ID table and dates.
+        """
+        counts = np.bincount(self.row_indices()[keep], minlength=self.number_of_nodes())
+        indptr = np.zeros(self.number_of_nodes() + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return CitationGraph(self.interner, indptr, self.indices[keep], self.directed, self.dates)
+
+    def to_networkx(self, keyed_by_index=False):
+        """
+        Materialise the graph as a networkx graph.
+
+        Args:
+            keyed_by_index (bool): Label nodes by integer index instead of paper ID.
+
+        Returns:
+            nx.DiGraph or nx.Graph: A networkx view of the graph with the same node and adjacency order.
+        """
+        graph = nx.DiGraph() if self.directed else nx.Graph()
+        sources, targets = self.edge_arrays()
+        if keyed_by_index:
+            graph.add_nodes_from(range(self.number_of_nodes()))
+            graph.add_edges_from(zip(sources.tolist(), targets.tolist()))
+        else:
+            graph.add_nodes_from(self.node_ids.tolist())
+            graph.add_edges_from(zip(self.node_ids[sources].tolist(), self.node_ids[targets].tolist()))
+        return graph
+
+
+class GrowingGraph:
+    """
+    A citation graph that grows in place by batches of papers and citations.
+
+    Each row of successors (and, for directed graphs, of predecessors) lives in a slot with spare
+    capacity inside one buffer. A row that outgrows its slot moves to the end of the buffer with
+    twice the room, and the buffer is compacted once more than half of it is abandoned slots, so
+    adding a batch costs amortized time in the size of the batch. New paper IDs go to a dict until
+    they outnumber the ID index, which is then rebuilt. Looking up rows costs the degrees of the
+    nodes looked up. Only `to_graph`, which materializes a CitationGraph, visits the whole graph.
+
+    Args:
+        graph (CitationGraph): The graph to start from; its arrays are copied.
+    """
+
+    def __init__(self, graph):
+        self.directed = graph.directed
+        self._index = pd.Index(graph.node_ids)
+        self._id_dtype = graph.node_ids.dtype
+        self._appended = {}
+        self._ids = _reserve(np.empty(0, dtype=object), graph.number_of_nodes())
+        self._ids[:graph.number_of_nodes()] = graph.node_ids
+        self._num_nodes = graph.number_of_nodes()
+        self._num_edges = graph.number_of_edges()
+        self._dates = graph.dates
+        self._successors = _GrowingRows(graph.indptr, graph.indices)
+        self._predecessors = None
+        if self.directed:
+            order = np.argsort(graph.indices, kind='stable')
+            indptr = np.zeros(self._num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(graph.indices, minlength=self._num_nodes), out=indptr[1:])
+            self._predecessors = _GrowingRows(indptr, graph.row_indices()[order])
+        self._graph = graph
+
+    def number_of_nodes(self):
+        return self._num_nodes
+
+    def number_of_edges(self):
+        return self._num_edges
+
+    @property
+    def node_ids(self):
+        """ Paper ID for each node index, as an object array. """
+        return self._ids[:self._num_nodes]
+
+    def index_of(self, paper_ids):
+        """ Return the int64 node index of each paper ID, -1 for unknown IDs. """
+        paper_ids = np.asarray(paper_ids, dtype=object)
+        indices = self._index.get_indexer(paper_ids).astype(np.int64)
+        if self._appended:
+            missing = np.flatnonzero(indices < 0)
+            indices[missing] = [self._appended.get(paper_id, -1) for paper_id in paper_ids[missing].tolist()]
+        return indices
+
+    def add_nodes(self, paper_ids):
+        """ Append papers with new IDs as nodes without citations. """
+        paper_ids = np.asarray(paper_ids, dtype=object)
+        start = self._num_nodes
+        self._ids = _reserve(self._ids, start + len(paper_ids))
+        self._ids[start:start + len(paper_ids)] = paper_ids
+        self._num_nodes += len(paper_ids)
+        self._appended.update(zip(paper_ids.tolist(), range(start, self._num_nodes)))
+        if len(self._appended) > len(self._index):
+            self._index = pd.Index(self.node_ids)
+            self._appended = {}
+        self._successors.add_rows(len(paper_ids))
+        if self._predecessors is not None:
+            self._predecessors.add_rows(len(paper_ids))
+        self._graph = None
+
+    def add_edges(self, sources, targets):
+        """
+        Append edges to their rows, after the existing ones. The edges must not be in the graph yet
+        (see `has_edges`) and must be unique; undirected edges are stored in both rows.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        self._num_edges += len(sources)
+        if self.directed:
+            self._predecessors.append(targets, sources)
+        else:
+            loops = sources == targets
+            sources, targets = np.concatenate([sources, targets[~loops]]), np.concatenate([targets, sources[~loops]])
+        self._successors.append(sources, targets)
+        self._graph = None
+
+    def has_edges(self, sources, targets):
+        """ Check many edges at once, looking only at the rows of their source nodes. """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        known = sources < self._num_nodes
+        rows, stored = self.successors(np.unique(sources[known]))
+        width = max(self._num_nodes, int(targets.max(initial=0)) + 1)
+        return known & np.isin(sources * width + targets, rows * width + stored)
+
+    def successors(self, nodes):
+        """ Return (row, successor) pairs of the given nodes' stored edges. """
+        return self._successors.entries(np.asarray(nodes, dtype=np.int64))
+
+    def predecessors(self, nodes):
+        """ Return (row, predecessor) pairs of the given nodes' incoming edges; directed graphs only. """
+        return self._predecessors.entries(np.asarray(nodes, dtype=np.int64))
+
+    def neighbours(self, nodes):
+        """ Return (row, neighbour) pairs of the given nodes in the undirected view, as `to_undirected` has them. """
+        rows, neighbours = self.successors(nodes)
+        if not self.directed:
+            return rows, neighbours
+        in_rows, in_neighbours = self.predecessors(nodes)
+        width = max(self._num_nodes, 1)
+        keys = np.unique(np.concatenate([rows * width + neighbours, in_rows * width + in_neighbours]))
+        return keys // width, keys % width
+
+    def to_graph(self):
+        """ Return the current graph as a CitationGraph, built once per batch. Dates of new nodes are NaT. """
+        if self._graph is None:
+            indptr, indices = self._successors.to_csr()
+            dates = self._dates
+            if dates is not None and self._num_nodes > len(dates):
+                dates = np.concatenate([dates, np.full(self._num_nodes - len(dates), np.datetime64('NaT'),
+                                                       dtype=dates.dtype)])
+            # String IDs go back to a fixed-width array, other IDs stay Python objects as in `from_networkx`
+            if self._id_dtype == object or not self._num_nodes:
+                ids = self.node_ids.astype(self._id_dtype)
+            else:
+                ids = np.asarray(self.node_ids.tolist())
+            self._graph = CitationGraph(ids, indptr, indices, self.directed, dates)
+        return self._graph
+
+
+class _GrowingRows:
+    """ CSR rows that each own a slot with spare capacity in a shared buffer, so rows grow in place. """
+
+    def __init__(self, indptr, indices):
+        self.starts = np.asarray(indptr[:-1], dtype=np.int64).copy()
+        self.lengths = np.diff(indptr).astype(np.int64)
+        self.capacities = self.lengths.copy()
+        self.data = np.array(indices, dtype=np.int32)
+        self.used = len(self.data)
+        self.num_rows = len(self.starts)
+        self.num_entries = len(self.data)
+
+    def add_rows(self, count):
+        size = self.num_rows + count
+        self.starts, self.lengths, self.capacities = (_reserve(array, size) for array in
+                                                      (self.starts, self.lengths, self.capacities))
+        self.starts[self.num_rows:size] = self.used
+        self.lengths[self.num_rows:size] = 0
+        self.capacities[self.num_rows:size] = 0
+        self.num_rows = size
+
+    def entries(self, nodes):
+        rows, positions = _slot_entries(self.starts, self.lengths, nodes)
+        return rows, self.data[positions].astype(np.int64)
+
+    def append(self, rows, values):
+        order = np.argsort(rows, kind='stable')
+        rows, values = rows[order], values[order]
+        grown, counts = np.unique(rows, return_counts=True)
+        needed = self.lengths[grown] + counts
+        full = needed > self.capacities[grown]
+        if full.any():
+            self._move(grown[full], 2 * needed[full])
+        group_start = np.searchsorted(rows, rows)
+        positions = self.starts[rows] + self.lengths[rows] + np.arange(len(rows)) - group_start
+        self.data[positions] = values
+        self.lengths[grown] += counts
+        self.num_entries += len(rows)
+        if self.used > 2 * self.num_entries + MIN_COMPACTION_SLOTS:
+            self._move(np.arange(self.num_rows), self.lengths[:self.num_rows], compact=True)
+
+    def _move(self, nodes, capacities, compact=False):
+        """ Copy rows into new slots of the given capacities at the end of the buffer, or into a new buffer. """
+        _, positions = _slot_entries(self.starts, self.lengths, nodes)
+        values = self.data[positions]
+        lengths = self.lengths[nodes]
+        first = 0 if compact else self.used
+        starts = first + np.cumsum(capacities) - capacities
+        size = first + int(capacities.sum())
+        data = np.empty(size, dtype=np.int32) if compact else _reserve(self.data, size)
+        offsets = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        data[np.repeat(starts, lengths) + offsets] = values
+        self.data = data
+        self.starts[nodes] = starts
+        self.capacities[nodes] = capacities
+        self.used = size
+
+    def to_csr(self):
+        lengths = self.lengths[:self.num_rows]
+        indptr = np.zeros(self.num_rows + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        _, positions = _slot_entries(self.starts, self.lengths, np.arange(self.num_rows))
+        return indptr, self.data[positions]
+
+
+def _slot_entries(starts, lengths, nodes):
+    """ Return the row and the buffer position of every entry of the given rows. """
+    lengths = lengths[nodes]
+    ends = np.cumsum(lengths)
+    positions = np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts[nodes] - (ends - lengths), lengths)
+    return np.repeat(nodes, lengths).astype(np.int64), positions
+
+
+def _reserve(array, size):
+    """ Return `array`, or a copy with at least twice its length, so that it holds `size` entries. """
+    if size <= len(array):
+        return array
+    grown = np.empty(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
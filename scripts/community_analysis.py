@@ -1,94 +1,394 @@
 import collections as col
-import scipy.stats as st
-import networkx as nx
+import numpy as np
+from scipy import sparse
+from scripts.citation_graph import CitationGraph
+from scripts.module_tree import ModuleTree
+from scripts.quotient_graph import QuotientGraph
+from scripts import label_assigner as la
+from scripts import graph_metrics as gm
+from scripts import centrality as ce
+from scripts import enrichment as en
+from scripts import instrumentation as ins
+from scripts.parallel import SharedGraphPool
 
-def prepare_community_stats(partition, labeled_papers, graph):
+@ins.instrumented(items=lambda result: {'communities': len(result[0]) if isinstance(result[0], dict)
+                                        else result[0].tree.num_modules(1)})
+def prepare_community_stats(partition, labeled_papers, graph, betweenness_mode='exact', betweenness_samples=None,
+                            betweenness_epsilon=0.01, betweenness_delta=0.1, seed=None, workers=1, level=1):
     """
     Calculates detailed community and global statistics for a given graph.
 
     This function processes a graph based on provided partition and labeled papers to compute metrics such as 
     paper count, subfields, and various centrality measures for each community. It also calculates global metrics
-    like edge density and clustering coefficient for the entire graph.
+    like edge density and clustering coefficient for the entire graph. Cut sizes, conductance and modularity
+    contributions of the communities come from the quotient graph of citations between them (see
+    `quotient_graph.QuotientGraph`). Betweenness centrality can be estimated
+    from sampled sources (see `centrality.betweenness_centrality`); the mode and its error bound are recorded
+    in the global statistics. With `workers` > 1, betweenness and clustering are computed by a pool of
+    processes sharing the graph (see `parallel.SharedGraphPool`).
+
+    A ModuleTree partition is analyzed at `level`; with `level=None` the lazily computed statistics of
+    every level are returned instead (see `HierarchyStats`), so further levels can be looked at without
+    recomputing the node centralities.
 
     Args:
-        partition (dict): Maps paper IDs to community IDs.
-        labeled_papers (dict): Maps paper IDs to their corresponding subfields.
-        graph (networkx.Graph): The graph representing papers as nodes and their relationships as edges.
+        partition (dict, np.ndarray or ModuleTree): Maps paper IDs to community IDs, holds the community ID of
+            each node index, or holds the module hierarchy over the node indices.
+        labeled_papers (dict or LabelMatrix): Maps paper IDs to their corresponding subfields.
+        graph (networkx.Graph or CitationGraph): The graph representing papers as nodes and their relationships as edges.
+        betweenness_mode (str): 'exact', 'kpivot' or 'adaptive'.
+        betweenness_samples (int): Number of pivots for the 'kpivot' mode.
+        betweenness_epsilon (float): Target error for the 'adaptive' mode.
+        betweenness_delta (float): Failure probability of the reported betweenness error bound.
+        seed (int): Seed for pivot sampling.
+        workers (int): Number of worker processes.
+        level (int): Level of the partition to analyze, 1 for the top level; None for every level.
 
     Returns:
         tuple: Contains two elements:
-            - A dictionary with community-specific statistics including the dominant subfield and its percentage.
+            - A dictionary with community-specific statistics including the dominant subfield and its percentage,
+              or the HierarchyStats of every level when `level` is None.
             - A dictionary with global statistics for the entire graph.
     """
-    community_stats = col.defaultdict(lambda: {
-        'count': 0,
-        'subfields': col.defaultdict(int), 
-        'edge_density': 0,
-        'avg_clustering': 0,
-        'avg_degree_centrality': 0,
-        'avg_betweenness_centrality': 0,
-        'dominant_subfield': None,
-        'dominant_percentage': 0
-    })
+    if isinstance(partition, ModuleTree):
+        graph, _, label_matrix = index_community_inputs(partition.labels(1), labeled_papers, graph)
+        tree = partition
+    else:
+        graph, labels, label_matrix = index_community_inputs(partition, labeled_papers, graph)
+        tree = ModuleTree.from_labels(labels)
 
     # Global metrics
-    global_edge_density = nx.density(graph)
-    global_clustering_coefficient = nx.average_clustering(graph)
-    global_degree_centrality = nx.degree_centrality(graph)
-    global_betweenness_centrality = nx.betweenness_centrality(graph)
-
-    for paper_id, community_id in partition.items():
-        community_stats[community_id]['count'] += 1
-        subfields = labeled_papers.get(paper_id, ["Unknown"])
-        for subfield in subfields:
-            community_stats[community_id]['subfields'][subfield] += 1
-
-    for community_id, stats in community_stats.items():
-        subgraph = graph.subgraph([node for node, comm in partition.items() if comm == community_id])
-        stats['edge_density'] = nx.density(subgraph)
-        stats['avg_clustering'] = nx.average_clustering(subgraph)
-        stats['avg_degree_centrality'] = sum(global_degree_centrality[node] for node in subgraph.nodes()) / len(subgraph.nodes())
-        stats['avg_betweenness_centrality'] = sum(global_betweenness_centrality[node] for node in subgraph.nodes()) / len(subgraph.nodes())
-        if stats['subfields']:
-            dominant_subfield = max(stats['subfields'], key=stats['subfields'].get)
-            stats['dominant_subfield'] = dominant_subfield
-            stats['dominant_percentage'] = (stats['subfields'][dominant_subfield] / stats['count']) * 100 if stats['count'] > 0 else 0
+    with ins.stage('degree') as record:
+        degree_centrality = gm.degree_centrality(graph)
+        record.count(nodes=graph.number_of_nodes())
+    with SharedGraphPool(graph, workers) as pool:
+        with ins.stage('betweenness') as record:
+            betweenness_centrality, betweenness_info = ce.betweenness_centrality(
+                graph, betweenness_mode, betweenness_samples, betweenness_epsilon, betweenness_delta, seed,
+                accumulate=pool.accumulate_dependencies)
+            record.count(sources=betweenness_info['samples'])
+        with ins.stage('clustering') as record:
+            global_clustering = pool.clustering().mean() if graph.number_of_nodes() else 0
+            record.count(nodes=graph.number_of_nodes())
 
     global_stats = {
-        'global_edge_density': global_edge_density,
-        'global_clustering_coefficient': global_clustering_coefficient,
-        'global_avg_degree_centrality': sum(global_degree_centrality.values()) / len(graph.nodes()),
-        'global_avg_betweenness_centrality': sum(global_betweenness_centrality.values()) / len(graph.nodes())
+        'global_edge_density': gm.density(graph.number_of_nodes(), graph.number_of_edges(), graph.directed),
+        'global_clustering_coefficient': global_clustering,
+        'global_avg_degree_centrality': degree_centrality.mean(),
+        'global_avg_betweenness_centrality': betweenness_centrality.mean(),
+        'betweenness_mode': betweenness_info['mode'],
+        'betweenness_samples': betweenness_info['samples'],
+        'betweenness_epsilon': betweenness_info['epsilon'],
+        'betweenness_delta': betweenness_info['delta']
     }
+    if isinstance(partition, ModuleTree):
+        global_stats['levels'] = tree.num_levels
+        if not np.isnan(tree.codelength):
+            global_stats['codelength'] = tree.codelength
+            global_stats['level_codelengths'] = tree.level_codelengths()
+
+    hierarchy = HierarchyStats(tree, graph, label_matrix, degree_centrality, betweenness_centrality, workers)
+    return (hierarchy if level is None else hierarchy.level(level)), global_stats
+
+
+class HierarchyStats:
+    """
+    Community statistics of every level of a ModuleTree, computed lazily when a level is first looked at.
+
+    Member counts, centrality sums, subfield counts and the edge counts between modules all add up over
+    submodules. A level is therefore aggregated from the nearest finer level already computed, through
+    the tree's parent pointers, and only computed from the nodes when no finer level is available; the
+    edges between submodules of one parent become its internal edges. Clustering within communities
+    does not add up and is computed for each level from its intra-community edges.
+
+    Args:
+        tree (ModuleTree): The module hierarchy over the node indices of `graph`.
+        graph (CitationGraph): The citation graph.
+        label_matrix (LabelMatrix): Encoded subfield labels.
+        degree_centrality (np.ndarray): Degree centrality of each node in the whole graph.
+        betweenness_centrality (np.ndarray): Betweenness centrality of each node in the whole graph.
+        workers (int): Number of worker processes for the clustering coefficients.
+    """
+
+    def __init__(self, tree, graph, label_matrix, degree_centrality, betweenness_centrality, workers=1):
+        self.tree = tree
+        self.graph = graph
+        self.label_matrix = label_matrix
+        self.degree_centrality = degree_centrality
+        self.betweenness_centrality = betweenness_centrality
+        self.workers = workers
+        self._aggregates = {}
+        self._stats = {}
+
+    @property
+    def num_levels(self):
+        return self.tree.num_levels
+
+    def level(self, level):
+        """
+        Return the community statistics of `level` in the format of `prepare_community_stats`, keyed by
+        the tree's community IDs in order of first appearance over the node indices. Below the top
+        level, each community also records the ID of its 'parent' community one level up.
+        """
+        if level not in self._stats:
+            self._stats[level] = self._community_stats(level)
+        return self._stats[level]
+
+    def aggregates(self, level):
+        """
+        Return the additive aggregates of every module of `level`, by dense module index.
+
+        Returns:
+            dict: 'count', 'degree_sum' and 'betweenness_sum' arrays, the 'quotient' graph of edge counts
+            between modules, and the modules x subfields 'subfield_counts' with the 'subfield_first_seen'
+            sort keys of `subfield_cells`.
+        """
+        if level not in self._aggregates:
+            finer = min((cached for cached in self._aggregates if cached > level), default=None)
+            if finer is None:
+                self._aggregates[level] = self._node_aggregates(level)
+            else:
+                self._aggregates[level] = self._parent_aggregates(level, finer)
+        return self._aggregates[level]
+
+    def _node_aggregates(self, level):
+        graph = self.graph
+        module_index = self.tree.indices(level)
+        num_modules = self.tree.num_modules(level)
+        with ins.stage('density') as record:
+            in_partition = module_index >= 0
+            members = module_index[in_partition]
+            sources, targets = graph.edge_arrays()
+            quotient = QuotientGraph.from_edges(module_index[sources], module_index[targets], num_modules,
+                                                graph.directed, self.tree.module_ids(level))
+            aggregates = {
+                'count': np.bincount(members, minlength=num_modules),
+                'degree_sum': np.bincount(members, weights=self.degree_centrality[in_partition], minlength=num_modules),
+                'betweenness_sum': np.bincount(members, weights=self.betweenness_centrality[in_partition],
+                                               minlength=num_modules),
+                'quotient': quotient
+            }
+            record.count(edges=graph.number_of_edges(), internal_edges=quotient.internal_edges().sum())
+        with ins.stage('subfields') as record:
+            counts, first_seen = subfield_cells(module_index, self.label_matrix, num_modules)
+            aggregates['subfield_counts'] = counts.reshape(num_modules, -1)
+            aggregates['subfield_first_seen'] = first_seen.reshape(num_modules, -1)
+            record.count(communities=num_modules)
+        return aggregates
+
+    def _parent_aggregates(self, level, finer):
+        children = self._aggregates[finer]
+        # Module of `level` containing each module of the finer level
+        ancestors = np.arange(self.tree.num_modules(finer))
+        for child_level in range(finer, level, -1):
+            ancestors = self.tree.parents(child_level)[ancestors]
+        num_modules = self.tree.num_modules(level)
+        grouping = sparse.csr_matrix((np.ones(len(ancestors), dtype=np.int64), (ancestors, np.arange(len(ancestors)))),
+                                     shape=(num_modules, len(ancestors)))
+        first_seen = np.full((num_modules, children['subfield_first_seen'].shape[1]), np.iinfo(np.int64).max)
+        np.minimum.at(first_seen, ancestors, children['subfield_first_seen'])
+        return {
+            'count': grouping @ children['count'],
+            'degree_sum': grouping @ children['degree_sum'],
+            'betweenness_sum': grouping @ children['betweenness_sum'],
+            'quotient': children['quotient'].coarsen(ancestors, num_modules, self.tree.module_ids(level)),
+            'subfield_counts': grouping @ children['subfield_counts'],
+            'subfield_first_seen': first_seen
+        }
+
+    def _community_stats(self, level):
+        aggregates = self.aggregates(level)
+        module_index = self.tree.indices(level)
+        counts = aggregates['count']
+        quotient = aggregates['quotient']
+        internal_edges = quotient.internal_edges()
+        with ins.stage('community_clustering') as record:
+            intra_graph = intra_community_graph(self.graph, module_index)
+            clustering = community_clustering(intra_graph, module_index, counts, self.workers)
+            record.count(nodes=counts.sum())
+
+        in_partition = np.flatnonzero(module_index >= 0)
+        first_node = np.full(len(counts), len(module_index))
+        np.minimum.at(first_node, module_index[in_partition], in_partition)
+        order = np.argsort(first_node[counts > 0], kind='stable')
+        modules = np.flatnonzero(counts > 0)[order]
+        module_ids = self.tree.module_ids(level)
+        edge_density = gm.density(counts, internal_edges, self.graph.directed)
+        avg_degree = np.divide(aggregates['degree_sum'], counts, out=np.zeros(len(counts)), where=counts > 0)
+        avg_betweenness = np.divide(aggregates['betweenness_sum'], counts, out=np.zeros(len(counts)), where=counts > 0)
+        cut_sizes, conductance = quotient.cut_sizes(), quotient.conductance()
+        modularity_contributions = quotient.modularity_contributions()
+        subfield_counts = subfield_dicts(aggregates['subfield_counts'][modules],
+                                         aggregates['subfield_first_seen'][modules], self.label_matrix.subfields)
+
+        community_stats = col.defaultdict(lambda: {
+            'count': 0,
+            'subfields': col.defaultdict(int), 
+            'edge_density': 0,
+            'avg_clustering': 0,
+            'avg_degree_centrality': 0,
+            'avg_betweenness_centrality': 0,
+            'cut_size': 0,
+            'conductance': 0,
+            'modularity_contribution': 0,
+            'dominant_subfield': None,
+            'dominant_percentage': 0
+        })
+        parent_ids = self.tree.module_ids(level - 1)[self.tree.parents(level)] if level > 1 else None
+        for module, subfields in zip(modules.tolist(), subfield_counts):
+            stats = community_stats[int(module_ids[module])]
+            if parent_ids is not None:
+                stats['parent'] = int(parent_ids[module])
+            stats['count'] = int(counts[module])
+            stats['subfields'].update(subfields)
+            stats['edge_density'] = edge_density[module]
+            stats['avg_clustering'] = clustering[module]
+            stats['avg_degree_centrality'] = avg_degree[module]
+            stats['avg_betweenness_centrality'] = avg_betweenness[module]
+            stats['cut_size'] = int(cut_sizes[module])
+            stats['conductance'] = conductance[module]
+            stats['modularity_contribution'] = modularity_contributions[module]
+            if stats['subfields']:
+                dominant_subfield = max(stats['subfields'], key=stats['subfields'].get)
+                stats['dominant_subfield'] = dominant_subfield
+                stats['dominant_percentage'] = (stats['subfields'][dominant_subfield] / stats['count']) * 100 if stats['count'] > 0 else 0
+        return community_stats
+
+
+def intra_community_graph(graph, community_ids):
+    """ Return the subgraph of the edges joining two nodes of the same community. """
+    source_ids = community_ids[graph.row_indices()]
+    return graph.edge_subgraph((source_ids >= 0) & (source_ids == community_ids[graph.indices]))
+
+
+def community_clustering(intra_graph, community_ids, counts, workers=1):
+    """
+    Average clustering coefficient of every community.
+
+    Clustering is taken on the graph of intra-community edges, where each node's coefficient equals its
+    coefficient inside its own community subgraph.
+
+    Args:
+        intra_graph (CitationGraph): The intra-community edges, from `intra_community_graph`.
+        community_ids (np.ndarray): Dense community index of each node, -1 for nodes outside the partition.
+        counts (np.ndarray): Number of members of each community.
+        workers (int): Number of worker processes.
 
-    return community_stats, global_stats
+    Returns:
+        np.ndarray: Mean clustering coefficient of the members of each community.
+    """
+    in_partition = np.flatnonzero(community_ids >= 0)
+    with SharedGraphPool(intra_graph, workers) as pool:
+        clustering = pool.clustering(in_partition)
+    return gm.group_mean(clustering, community_ids[in_partition], counts)
+
+
+def index_community_inputs(partition, labeled_papers, graph):
+    """
+    Bring the inputs of the community analysis onto shared integer node indices.
+
+    Dict partitions are laid out in their own iteration order, so "first appearance" in the returned
+    arrays matches iterating the dict. Graph nodes missing from the partition get community -1.
+
+    Args:
+        partition (dict or np.ndarray): Paper ID -> community dict, or community per node index.
+        labeled_papers (dict or LabelMatrix): Paper ID -> subfields dict, or an encoded label matrix.
+        graph (networkx.Graph or CitationGraph): The citation graph.
+
+    Returns:
+        tuple: (CitationGraph, community label array, LabelMatrix).
+    """
+    if isinstance(partition, dict):
+        if not isinstance(graph, CitationGraph):
+            graph = CitationGraph.from_networkx(graph, nodes=partition)
+        rows = graph.interner.index_of(list(partition))
+        labels = np.full(graph.number_of_nodes(), -1, dtype=np.int64)
+        labels[rows[rows >= 0]] = np.fromiter(partition.values(), dtype=np.int64, count=len(partition))[rows >= 0]
+    else:
+        labels = np.asarray(partition)
+        if not isinstance(graph, CitationGraph):
+            graph = CitationGraph.from_networkx(graph)
+    if not isinstance(labeled_papers, la.LabelMatrix):
+        labeled_papers = la.LabelMatrix.from_dict(labeled_papers, graph.interner)
+    return graph, labels, labeled_papers
+
+
+def subfield_cells(community_ids, label_matrix, num_communities):
+    """
+    Count the (community, subfield) cells of a label matrix.
 
+    Args:
+        community_ids (np.ndarray): Dense community index of each node, -1 for nodes outside the partition.
+        label_matrix (LabelMatrix): Encoded subfield labels.
+        num_communities (int): Number of communities.
+
+    Returns:
+        tuple: Flat count and first-encounter key of each cell, community-major. The key orders a
+        community's subfields by first encounter when walking its papers in node order and each paper's
+        labels in rank order, so ties for the dominant subfield resolve as before.
+    """
+    rows, columns = np.nonzero(label_matrix.ranks)
+    keep = community_ids[rows] >= 0
+    rows, columns = rows[keep], columns[keep]
+    num_subfields = len(label_matrix.subfields)
+
+    cells = community_ids[rows].astype(np.int64) * num_subfields + columns
+    first_seen = np.full(num_communities * num_subfields, np.iinfo(np.int64).max)
+    np.minimum.at(first_seen, cells, rows.astype(np.int64) * (num_subfields + 1) + label_matrix.ranks[rows, columns])
+    counts = np.bincount(cells, minlength=num_communities * num_subfields)
+    return counts, first_seen
+
+
+def subfield_dicts(counts, first_seen, subfields):
+    """ Turn communities x subfields counts and first-encounter keys into ordered {subfield: count} dicts. """
+    subfield_counts = []
+    for row_counts, row_first_seen in zip(counts, first_seen):
+        present = np.flatnonzero(row_counts)
+        present = present[np.argsort(row_first_seen[present], kind='stable')]
+        subfield_counts.append({subfields[column]: int(row_counts[column]) for column in present})
+    return subfield_counts
 
 
-def perform_fisher_analysis(community_stats, labeled_papers, total_papers):
+@ins.instrumented(items=lambda community_stats: {
+    'tests': sum(len(stats['fisher_results']) for stats in community_stats.values())})
+def perform_fisher_analysis(community_stats, labeled_papers, total_papers, correction=None):
     """
     Calculates Fisher's Exact Test for each community and subfield.
-    
+
+    All (community, subfield) tables are tested in one vectorized batch. With a `correction`, every
+    result also gets a 'p_adjusted' value corrected over the whole family of tests.
+
     Args:
         community_stats (dict): Community statistics with subfield counts.
         labeled_papers (dict): Mapping from paper IDs to their assigned subfields.
         total_papers (int): Total number of papers.
-    
+        correction (str): None, 'bonferroni' or 'fdr_bh' (Benjamini-Hochberg).
+
     Returns:
         dict: Updated community statistics with Fisher's test results.
     """
+    if correction not in en.FISHER_CORRECTIONS:
+        raise ValueError(f"Unknown correction '{correction}', expected one of {en.FISHER_CORRECTIONS}.")
     overall_counts = calculate_overall_subfield_counts(labeled_papers)
-    for community_id, stats in community_stats.items():
-        fisher_results = {}
-        community_size = stats['count']
-        for subfield, count_in_community in stats['subfields'].items():
-            count_outside_community = overall_counts[subfield] - count_in_community
-            non_subfield_community = community_size - count_in_community
-            non_subfield_outside = total_papers - community_size - count_outside_community
-            table = [[count_in_community, count_outside_community], [non_subfield_community, non_subfield_outside]]
-            odds_ratio, p_value = st.fisher_exact(table)  # corrected use of scipy.stats
-            fisher_results[subfield] = {'odds_ratio': odds_ratio, 'p_value': p_value}
-        stats['fisher_results'] = fisher_results
+    cells = [(stats, subfield, count_in_community)
+             for stats in community_stats.values() for subfield, count_in_community in stats['subfields'].items()]
+    count_in_community = np.array([count for _, _, count in cells], dtype=np.int64)
+    community_size = np.array([stats['count'] for stats, _, _ in cells], dtype=np.int64)
+    overall = np.array([overall_counts[subfield] for _, subfield, _ in cells], dtype=np.int64)
+    count_outside_community = overall - count_in_community
+    non_subfield_community = community_size - count_in_community
+    non_subfield_outside = total_papers - community_size - count_outside_community
+    odds_ratios, p_values = en.fisher_exact_batch(count_in_community, count_outside_community,
+                                                  non_subfield_community, non_subfield_outside)
+    adjusted = en.adjust_pvalues(p_values, correction) if correction else None
+
+    for stats in community_stats.values():
+        stats['fisher_results'] = {}
+    for index, (stats, subfield, _) in enumerate(cells):
+        result = {'odds_ratio': float(odds_ratios[index]), 'p_value': float(p_values[index])}
+        if correction:
+            result['p_adjusted'] = float(adjusted[index])
+        stats['fisher_results'][subfield] = result
     return community_stats
 
 def calculate_overall_subfield_counts(labeled_papers):
@@ -96,12 +396,17 @@ def calculate_overall_subfield_counts(labeled_papers):
     Calculates the total counts of each subfield across all papers.
     
     Args:
-        labeled_papers (dict): Mapping from paper IDs to their assigned subfields.
+        labeled_papers (dict or LabelMatrix): Mapping from paper IDs to their assigned subfields.
     
     Returns:
         dict: Total counts of each subfield.
     """
     total_counts = col.defaultdict(int)
+    if isinstance(labeled_papers, la.LabelMatrix):
+        for subfield, count in zip(labeled_papers.subfields, labeled_papers.overall_counts().tolist()):
+            if count:
+                total_counts[subfield] = count
+        return total_counts
     for subfields in labeled_papers.values():
         for subfield in subfields:
             total_counts[subfield] += 1
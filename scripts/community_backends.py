@@ -0,0 +1,222 @@
+import collections as col
+import time
+import numpy as np
+import community as community_louvain
+from scripts import community_detection as cd
+from scripts import graph_metrics as gm
+from scripts import instrumentation as ins
+from scripts.module_tree import ModuleTree
+try:
+    import igraph
+    import leidenalg
+except ImportError:  # The Leiden backend is optional
+    igraph = leidenalg = None
+
+CommunityResult = col.namedtuple('CommunityResult', ['labels', 'quality', 'elapsed', 'backend', 'tree'])
+
+BACKENDS = {}
+
+
+def register_backend(name):
+    """
+    Register a community detection backend under `name`.
+
+    A backend takes a CitationGraph and keyword options and returns the community label of each node
+    index as an integer array, or a ModuleTree when it finds a hierarchy of communities.
+    """
+    def decorate(function):
+        BACKENDS[name] = function
+        return function
+    return decorate
+
+
+def detect_communities(graph, backend='infomap', **options):
+    """
+    Detect communities with a registered backend and score the partition.
+
+    Args:
+        graph (CitationGraph): The citation graph.
+        backend (str): One of `BACKENDS`: 'infomap', 'louvain', 'leiden' or 'label_propagation'.
+        **options: Backend options, e.g. `seed`.
+
+    Returns:
+        CommunityResult: Top-level community label of each node index, modularity of that partition on
+        `graph`, seconds spent in the backend, the backend name and the ModuleTree of the communities
+        (a single level for flat backends).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown community detection backend '{backend}', expected one of {sorted(BACKENDS)}.")
+    with ins.stage(backend) as record:
+        start = time.perf_counter()
+        tree = BACKENDS[backend](graph, **options)
+        elapsed = time.perf_counter() - start
+        if not isinstance(tree, ModuleTree):
+            tree = ModuleTree.from_labels(tree)
+        labels = tree.labels(1)
+        quality = gm.modularity(graph, labels)
+        record.count(communities=tree.num_modules(1), levels=tree.num_levels)
+        record.measure(modularity=quality)
+    return CommunityResult(labels, quality, elapsed, backend, tree)
+
+
+@register_backend('infomap')
+def infomap_labels(graph, **options):
+    """ Infomap's module hierarchy; see `community_detection.detect_community_labels` for the options. """
+    return cd.detect_module_tree(graph, **options)
+
+
+@register_backend('louvain')
+def louvain_labels(graph, seed=0, resolution=1.0):
+    """
+    Louvain modularity optimisation (python-louvain) on the undirected view of the graph.
+
+    Args:
+        graph (CitationGraph): The citation graph.
+        seed (int): Seed of the node order.
+        resolution (float): Modularity resolution.
+
+    Returns:
+        np.ndarray: int32 community label of each node index.
+    """
+    undirected = graph.to_undirected().to_networkx(keyed_by_index=True)
+    partition = community_louvain.best_partition(undirected, resolution=resolution, random_state=seed)
+    return np.fromiter((partition[node] for node in range(graph.number_of_nodes())), dtype=np.int32,
+                       count=graph.number_of_nodes())
+
+
+@register_backend('leiden')
+def leiden_labels(graph, seed=0, resolution=1.0, iterations=-1):
+    """
+    Leiden modularity optimisation (leidenalg) on the undirected view of the graph.
+
+    Args:
+        graph (CitationGraph): The citation graph.
+        seed (int): Seed of the optimiser.
+        resolution (float): Modularity resolution.
+        iterations (int): Number of Leiden iterations; -1 iterates until the partition is stable.
+
+    Returns:
+        np.ndarray: int32 community label of each node index.
+    """
+    if leidenalg is None:
+        raise ImportError("The 'leiden' backend needs the leidenalg and igraph packages.")
+    sources, targets = graph.edge_arrays()
+    undirected = igraph.Graph(n=graph.number_of_nodes(), edges=np.column_stack([sources, targets]).tolist(),
+                              directed=False)
+    undirected.simplify()
+    partition = leidenalg.find_partition(undirected, leidenalg.RBConfigurationVertexPartition, seed=seed,
+                                         n_iterations=iterations, resolution_parameter=resolution)
+    return np.asarray(partition.membership, dtype=np.int32)
+
+
+@register_backend('label_propagation')
+def label_propagation_labels(graph, seed=0, max_iterations=100, update_fraction=0.5, tolerance=1e-3,
+                             initial_labels=None, active=None):
+    """
+    Fast label propagation on the CSR arrays of the undirected view of the graph.
+
+    Every node repeatedly takes the label held by most of its neighbours, keeping its own label on ties
+    and breaking other ties at random. As in fast label propagation (Traag and Subelj, 2023), only
+    active nodes are revisited: after the first sweep over every node, a sweep looks at the neighbours
+    of nodes that changed label and at nodes still waiting to change. Sweeps are vectorized over the
+    edges of the active nodes; to avoid the oscillations of synchronous updates only a random
+    `update_fraction` of the nodes that would change adopts its new label per sweep. Synchronous sweeps
+    can leave a few boundary nodes flipping between two communities, so propagation stops once at
+    most a `tolerance` share of the initially active nodes would still change.
+
+    Given `initial_labels` and `active` nodes, propagation warm-starts from that partition and only
+    makes local moves spreading out from the active nodes, e.g. the nodes touched by new citations.
+
+    Args:
+        graph (CitationGraph): The citation graph.
+        seed (int): Seed of tie-breaking and update selection.
+        max_iterations (int): Maximum number of sweeps.
+        update_fraction (float): Share of the changing nodes updated in each sweep.
+        tolerance (float): Share of changing nodes below which propagation stops.
+        initial_labels (np.ndarray): Community label of each node index to start from instead of singletons.
+        active (np.ndarray): Node indices visited in the first sweep; defaults to every node.
+
+    Returns:
+        np.ndarray: int32 community label of each node index, numbered from 0 in order of first appearance,
+        or taken from `initial_labels` when given.
+    """
+    undirected = graph.to_undirected()
+    num_nodes = undirected.number_of_nodes()
+    labels = np.arange(num_nodes, dtype=np.int64) if initial_labels is None else np.array(initial_labels, dtype=np.int64)
+    active = np.arange(num_nodes) if active is None else active
+    propagate_labels(lambda nodes: _row_neighbours(undirected, nodes), labels, active, seed, max_iterations,
+                     update_fraction, tolerance)
+    if initial_labels is not None:
+        return labels.astype(np.int32)
+    _, first_seen, dense = np.unique(labels, return_index=True, return_inverse=True)
+    return np.argsort(np.argsort(first_seen))[dense].astype(np.int32)
+
+
+def propagate_labels(neighbours, labels, active, seed=0, max_iterations=100, update_fraction=0.5, tolerance=1e-3):
+    """
+    Run the label propagation sweeps of `label_propagation_labels` in place, from the `active` nodes.
+
+    Each sweep only reads the neighbourhoods of its active nodes, through `neighbours`, so the cost
+    of propagation follows the nodes it reaches rather than the size of the graph.
+
+    Args:
+        neighbours (callable): Maps an array of node indices to (row, neighbour) arrays of their
+            neighbours in the undirected view of the graph.
+        labels (np.ndarray): int64 community label of each node index; updated in place.
+        active (np.ndarray): Node indices visited in the first sweep.
+        seed (int): Seed of tie-breaking and update selection.
+        max_iterations (int): Maximum number of sweeps.
+        update_fraction (float): Share of the changing nodes updated in each sweep.
+        tolerance (float): Share of changing nodes below which propagation stops.
+
+    Returns:
+        np.ndarray: Sorted node indices whose label differs from the one they started with.
+    """
+    rng = np.random.default_rng(seed)
+    active = np.unique(active)
+    tolerance *= len(active)
+    changed, started_with = [], []
+    for _ in range(max_iterations):
+        rows, neighbour_nodes = neighbours(active)
+        if not len(rows):
+            break
+        # Count the labels around each active node; the own label wins ties, other ties are broken at random
+        neighbour_labels = labels[neighbour_nodes]
+        order = np.lexsort((neighbour_labels, rows))
+        rows, neighbour_labels = rows[order], neighbour_labels[order]
+        starts = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1]) | (neighbour_labels[1:] != neighbour_labels[:-1])])
+        counts = np.diff(np.r_[starts, len(rows)])
+        key_rows, key_labels = rows[starts], neighbour_labels[starts]
+        scores = counts + 0.5 * (key_labels == labels[key_rows]) + 0.49 * rng.random(len(key_rows))
+        # Candidates are sorted by row, so each active node's candidates are one contiguous group
+        starts = np.flatnonzero(np.r_[True, key_rows[1:] != key_rows[:-1]])
+        sizes = np.diff(np.r_[starts, len(key_rows)])
+        winners = np.flatnonzero(scores == np.repeat(np.maximum.reduceat(scores, starts), sizes))
+        moves = key_labels[winners] != labels[key_rows[winners]]
+        changing, best = key_rows[winners][moves], key_labels[winners][moves]
+        if len(changing) <= tolerance:
+            break
+        update = rng.random(len(changing)) < update_fraction if len(changing) > 1 else np.ones(1, dtype=bool)
+        changed.append(changing[update])
+        started_with.append(labels[changing[update]])
+        labels[changing[update]] = best[update]
+        _, neighbour_nodes = neighbours(changing[update])
+        active = np.union1d(neighbour_nodes, changing[~update])
+    if not changed:
+        return np.empty(0, dtype=np.int64)
+    nodes, first = np.unique(np.concatenate(changed), return_index=True)
+    return nodes[labels[nodes] != np.concatenate(started_with)[first]]
+
+
+def _row_neighbours(graph, nodes):
+    rows, positions = _row_entries(graph.indptr, nodes)
+    return rows, graph.indices[positions]
+
+
+def _row_entries(indptr, nodes):
+    """ Return the row and the position in `indices` of every stored entry of the given CSR rows. """
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    ends = np.cumsum(lengths)
+    positions = np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - (ends - lengths), lengths)
+    return np.repeat(nodes, lengths).astype(np.int64), positions
@@ -1,39 +1,134 @@
 import os
+import time
 import networkx as nx
 import infomap
-from collections import defaultdict
+from collections import defaultdict, deque
 import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib.patches as mpatches
+from matplotlib.collections import LineCollection
 import random
 import scipy.spatial as sp
+from scripts.citation_graph import CitationGraph
+from scripts.layout import community_layout
+from scripts.module_tree import ModuleTree
+from scripts import instrumentation as ins
+from scripts.parallel import SharedGraphPool
 
-def detect_communities_infomap(citation_graph):
+# Infomap's default seed, used for the first trial unless another seed is given
+INFOMAP_SEED = 123
+
+@ins.instrumented(items=lambda partition: {'nodes': len(partition), 'communities': len(set(partition.values()))})
+def detect_communities_infomap(citation_graph, **options):
     """
     Detect communities in the citation graph using the Infomap algorithm.
 
     Args:
-        citation_graph (nx.Graph): The citation graph.
+        citation_graph (nx.Graph or CitationGraph): The citation graph.
+        **options: Infomap settings passed on to `detect_community_labels`.
 
     Returns:
         dict: A dictionary where keys are nodes and values are community labels.
     """
-    infomap_instance = infomap.Infomap()
+    graph = as_citation_graph(citation_graph)
+    labels = detect_community_labels(graph, **options)
+    return dict(zip(graph.node_ids.tolist(), labels.tolist()))
+
+
+@ins.instrumented(items=lambda labels: {'nodes': len(labels), 'communities': len(np.unique(labels))})
+def detect_community_labels(graph, seed=INFOMAP_SEED, trials=1, directed=False, two_level=False, time_limit=None,
+                            workers=1, initial_labels=None):
+    """
+    Detect communities with Infomap directly on the integer node indices of a CSR graph.
+
+    Every trial is a separate Infomap run seeded with `seed + trial`, so the result depends only on
+    the seed and the number of trials, not on how many workers ran them. Trials run in `workers`
+    processes sharing the graph, and the partition with the shortest codelength is kept (the earliest
+    trial on ties). With a `time_limit`, no new trial starts once that many seconds have passed;
+    trials already running are finished and at least one trial always runs. With `initial_labels`,
+    every trial starts from that partition instead of singletons, e.g. the previous partition of a
+    graph that has since grown.
 
-    # Convert nodes to integers and add edges to the Infomap instance
-    node_to_int = {node: idx for idx, node in enumerate(citation_graph.nodes())}
-    int_to_node = {idx: node for node, idx in node_to_int.items()}
+    Args:
+        graph (CitationGraph): The citation graph.
+        seed (int): Seed of the first trial; defaults to Infomap's own default seed.
+        trials (int): Number of independent trials.
+        directed (bool): Use the directed flow model instead of the undirected one.
+        two_level (bool): Search two-level partitions only instead of a module hierarchy.
+        time_limit (float): Seconds after which no further trial is started.
+        workers (int): Number of processes running trials.
+        initial_labels (np.ndarray): Community label of each node index to warm-start Infomap from.
+
+    Returns:
+        np.ndarray: int32 community label (top-level module) for each node index. Nodes Infomap does
+        not report (isolated nodes) get singleton labels after the largest module ID.
+    """
+    best_modules = _best_trial(graph, seed, trials, directed, two_level, time_limit, workers, initial_labels,
+                               hierarchy=False)
+    labels = np.full(graph.number_of_nodes(), -1, dtype=np.int32)
+    labels[np.fromiter(best_modules.keys(), dtype=np.int64, count=len(best_modules))] = list(best_modules.values())
+    missing = labels < 0
+    labels[missing] = labels.max(initial=0) + 1 + np.arange(np.count_nonzero(missing), dtype=np.int32)
+    return labels
+
+
+@ins.instrumented(items=lambda tree: {'levels': tree.num_levels, 'communities': tree.num_modules(1)})
+def detect_module_tree(graph, seed=INFOMAP_SEED, trials=1, directed=False, two_level=False, time_limit=None,
+                       workers=1, initial_labels=None):
+    """
+    Detect the full Infomap module hierarchy on the integer node indices of a CSR graph.
 
-    for u, v in citation_graph.edges():
-        infomap_instance.add_link(node_to_int[u], node_to_int[v])
+    Trials run as in `detect_community_labels`, which takes the same options, and the tree of the
+    trial with the shortest codelength is kept. Its top level equals the labels of `detect_community_labels`.
 
-    # Run the Infomap algorithm
-    infomap_instance.run()
+    Returns:
+        ModuleTree: Modules of every level with parent pointers, codelengths and flows.
+    """
+    return _best_trial(graph, seed, trials, directed, two_level, time_limit, workers, initial_labels, hierarchy=True)
+
+
+def _best_trial(graph, seed, trials, directed, two_level, time_limit, workers, initial_labels, hierarchy):
+    """ Run the seeded Infomap trials and return the partition of the trial with the shortest codelength. """
+    options = {'silent': True, 'directed': directed, 'two_level': two_level}
+    initial_partition = None if initial_labels is None else dict(enumerate(np.asarray(initial_labels).tolist()))
+    start = time.perf_counter()
+    best_codelength, best_partition = None, None
+    with SharedGraphPool(graph, min(workers, trials)) as pool:
+        pending = deque()
+        next_trial = 0
+        while True:
+            while next_trial < trials and len(pending) < pool.workers and not (
+                    next_trial and time_limit is not None and time.perf_counter() - start >= time_limit):
+                pending.append(pool.submit(_infomap_trial, options, seed + next_trial, hierarchy, initial_partition))
+                next_trial += 1
+            if not pending:
+                break
+            codelength, partition = pending.popleft().result()
+            if best_codelength is None or codelength < best_codelength:
+                best_codelength, best_partition = codelength, partition
+    return best_partition
+
+
+def _infomap_trial(graph, options, seed, hierarchy=False, initial_partition=None):
+    """
+    Run one seeded Infomap trial and return (codelength, node index -> top-level module), or
+    (codelength, ModuleTree) with `hierarchy`.
+    """
+    infomap_instance = infomap.Infomap(seed=seed, num_trials=1, **options)
+    sources, targets = graph.edge_arrays()
+    infomap_instance.add_links(np.column_stack([sources, targets]).astype(np.int64))
+    if initial_partition is None:
+        result = infomap_instance.run()
+    else:
+        result = infomap_instance.run(initial_partition=initial_partition)
+    if hierarchy:
+        return result.codelength, ModuleTree.from_infomap(result, graph.number_of_nodes())
+    return result.codelength, result.modules()
 
-    # Retrieve the partition without calling nodes as a function
-    partition = {int_to_node[node.node_id]: node.module_id for node in infomap_instance.nodes}
-    return partition
 
+def as_citation_graph(graph):
+    """ Return `graph` as a CitationGraph, converting networkx graphs with their node order. """
+    return graph if isinstance(graph, CitationGraph) else CitationGraph.from_networkx(graph)
 
 
 def analyze_community_subfields(communities, metadata):
@@ -56,19 +151,29 @@ def analyze_community_subfields(communities, metadata):
     return community_subfields
 
 
-def visualize_communities(graph, partition, community_stats, num_communities_to_label=6, degree_threshold=60, output_path=None):
+@ins.instrumented()
+def visualize_communities(graph, partition, community_stats, num_communities_to_label=6, degree_threshold=0, output_path=None,
+                          max_edges=20000, cache_file=None):
     """
     Visualizes the network graph with nodes colored by community using distinct random colors, with consistent colors across runs.
 
+    Nodes are placed by `layout.community_layout`, which lays out the community supergraph and packs
+    members inside each community, so every node can be drawn even for graphs of 100k+ nodes.
+
     Args:
-        graph (nx.Graph): The graph to visualize.
-        partition (dict): Node-community mapping.
+        graph (nx.Graph or CitationGraph): The graph to visualize.
+        partition (dict or np.ndarray): Node-community mapping, or the community label of each node index.
         community_stats (dict): Statistics about each community.
         num_communities_to_label (int): Number of communities to label in the legend.
-        degree_threshold (int): Threshold of nodes degree for showing in the visualization.
+        degree_threshold (int): Only nodes with a degree above this threshold are drawn.
         output_path (str): Path where the visualization image will be saved. Defaults to 'Results' directory.
+        max_edges (int): Maximum number of edges drawn, sampled at random beyond that.
+        cache_file (str): Optional file caching the node positions between runs on the same graph and partition.
     """
-    
+    if not isinstance(graph, CitationGraph):
+        graph = CitationGraph.from_networkx(graph)
+    labels = np.asarray(partition if isinstance(partition, np.ndarray) else [partition[node] for node in graph.node_ids])
+
     if output_path is None:
         output_path = 'Results'
     
@@ -78,32 +183,41 @@ def visualize_communities(graph, partition, community_stats, num_communities_to_
     # Set a random seed for color consistency across runs
     random.seed(42)
 
+    positions = community_layout(graph, labels, cache_file=cache_file)
+
     # Apply a threshold to filter nodes
-    filtered_nodes = [node for node in graph.nodes() if graph.degree(node) > degree_threshold]
-    subgraph = graph.subgraph(filtered_nodes)
-    pos = nx.kamada_kawai_layout(subgraph)
+    degrees = graph.degree()
+    shown = degrees > degree_threshold
+    sources, targets = graph.edge_arrays()
+    edges = np.flatnonzero(shown[sources] & shown[targets])
+    if len(edges) > max_edges:
+        edges = np.sort(np.random.default_rng(42).choice(edges, max_edges, replace=False))
 
     plt.figure(figsize=(12, 8))
     
     # Generate distinct random colors for communities
-    communities = set(partition.values())
-    color_map = {community: "#" + ''.join([random.choice('0123456789ABCDEF') for _ in range(6)]) for community in communities}
+    communities = np.unique(labels)
+    color_map = {community: "#" + ''.join([random.choice('0123456789ABCDEF') for _ in range(6)]) for community in communities.tolist()}
+    colors = np.array([color_map[community] for community in communities.tolist()])
 
-    # Node colors and sizes for the filtered nodes
-    node_colors = [color_map[partition[node]] for node in subgraph]
-    node_sizes = [subgraph.degree(node) * 10 for node in subgraph]  # Scale node sizes by degree
+    # Node colors and sizes for the filtered nodes, sizes scaled by degree
+    nodes = np.flatnonzero(shown)
+    node_colors = colors[np.searchsorted(communities, labels[nodes])]
+    node_sizes = 100 * degrees[nodes] / max(degrees.max(initial=0), 1)
 
-    # Draw nodes and edges for the filtered graph
-    nx.draw_networkx_nodes(subgraph, pos, node_color=node_colors, node_size=node_sizes, alpha=0.7)
-    nx.draw_networkx_edges(subgraph, pos, alpha=0.5)
+    # Draw edges under the nodes
+    segments = np.stack([positions[sources[edges]], positions[targets[edges]]], axis=1)
+    plt.gca().add_collection(LineCollection(segments, colors='k', linewidths=0.1, alpha=0.05))
+    plt.scatter(positions[nodes, 0], positions[nodes, 1], s=node_sizes, c=node_colors, alpha=0.7, linewidths=0)
 
     # Create a legend for the largest communities
-    largest_communities = sorted([(comm_id, stats) for comm_id, stats in community_stats.items() if comm_id in partition.values()], key=lambda x: x[1]['count'], reverse=True)[:num_communities_to_label]
+    largest_communities = sorted([(comm_id, stats) for comm_id, stats in community_stats.items() if comm_id in color_map], key=lambda x: x[1]['count'], reverse=True)[:num_communities_to_label]
     legend_handles = [plt.Line2D([0], [0], marker='o', color=color_map[comm_id], label=f"Community {comm_id}", markersize=10, linestyle='') for comm_id, stats in largest_communities]
 
     plt.legend(handles=legend_handles, title="Communities", loc='upper left')
     plt.title('Community Visualization')
     plt.axis('off')
+    plt.gca().set_aspect('equal')
 
     # Construct full output path
     output_filename = os.path.join(output_path, 'community_visualization.png')
@@ -2,7 +2,11 @@ import json
 import tempfile
 import shutil
 import os
+import hashlib
+import time
 from datetime import datetime
+import numpy as np
+from scripts.citation_graph import CitationGraph
 
 class JSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -11,19 +15,32 @@ class JSONEncoder(json.JSONEncoder):
         return super().default(obj)
 
 def save_json_cache(data_dict, cache_file, description="data"):
-    """ Save data to a JSON cache file safely. """
-    temp_file = tempfile.NamedTemporaryFile('w', delete=False)
+    """
+    Save data to a JSON cache file safely.
+
+    The data is written and synced to a temporary file next to the cache, which then replaces the
+    cache in one rename, so a crash leaves either the old or the new cache on disk.
+
+    Returns:
+        bool: Whether the cache was saved.
+    """
+    temp_file = None
     try:
+        temp_file = tempfile.NamedTemporaryFile('w', delete=False, dir=os.path.dirname(os.path.abspath(cache_file)),
+                                                suffix='.tmp', encoding='utf-8')
         json.dump(data_dict, temp_file, ensure_ascii=False, indent=4, cls=JSONEncoder)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
         temp_file.close()
-        shutil.move(temp_file.name, cache_file)
+        os.replace(temp_file.name, cache_file)
         print(f"{description.capitalize()} cache saved successfully for {len(data_dict)} items.")
+        return True
     except Exception as e:
         print(f"Failed to save {description} cache: {e}")
-        os.unlink(temp_file.name)
-    finally:
-        if not temp_file.closed:
+        if temp_file is not None:
             temp_file.close()
+            os.unlink(temp_file.name)
+        return False
 
 def load_json_cache(cache_file, description="data"):
     """ Load data from a JSON cache file. """
@@ -37,3 +54,211 @@ def load_json_cache(cache_file, description="data"):
             print(f"Error decoding JSON from {description} cache file: {e}")
             return {}
     return {}
+
+class JsonJournal:
+    """
+    Append-only JSON-lines journal of key/value records that complements a JSON cache file.
+
+    Each record is written once as one line. Lines are buffered and made durable in batches, every
+    `flush_every` records or `flush_interval` seconds, with an fsync. A crash loses at most the
+    unflushed batch, and a torn last line is skipped on replay. The owner folds the replayed records
+    into its cache, saves it with `save_json_cache` and then calls `discard`.
+
+    Usage:
+        with JsonJournal(cache_file + '.journal') as journal:
+            journal.append(key, value)
+    """
+
+    def __init__(self, journal_file, flush_every=256, flush_interval=5.0):
+        self.journal_file = journal_file
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._file = None
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def replay(self):
+        """
+        Read back the records left in the journal by earlier runs.
+
+        Returns:
+            dict: Key -> value of every complete record, later records overriding earlier ones.
+        """
+        records = {}
+        if not os.path.exists(self.journal_file):
+            return records
+        skipped = 0
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    key, value = json.loads(line)
+                except (json.JSONDecodeError, ValueError):
+                    skipped += 1
+                    continue
+                records[key] = value
+        if skipped:
+            print(f"Skipped {skipped} incomplete records in {self.journal_file}.")
+        return records
+
+    def append(self, key, value):
+        """ Append one record, flushing when the current batch is full or old enough. """
+        if self._file is None:
+            self._file = open(self.journal_file, 'a', encoding='utf-8')
+        self._file.write(json.dumps([key, value], ensure_ascii=False, cls=JSONEncoder) + '\n')
+        self._pending += 1
+        if self._pending >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """ Make every appended record durable. """
+        if self._file is not None and self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """ Close and delete the journal once its records are safely in the compacted cache. """
+        self.close()
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+
+
+# Bumped whenever loading the same files gives a different graph, so older snapshots are rebuilt
+# (2: dates of cross-listed IDs are folded onto their true IDs)
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOT_ARRAYS = ('node_ids', 'indptr', 'indices', 'dates')
+
+
+def file_fingerprint(path):
+    """ Return the size, modification time and SHA-256 digest identifying a source file. """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+
+def _fingerprint_matches(path, fingerprint):
+    """
+    Check a source file against a stored fingerprint.
+
+    Size and mtime are compared first so that an unchanged file is accepted without reading it;
+    the file is only hashed when its mtime moved but its size did not.
+    """
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_size != fingerprint['size']:
+        return False
+    if stat.st_mtime_ns == fingerprint['mtime_ns']:
+        return True
+    return file_fingerprint(path)['sha256'] == fingerprint['sha256']
+
+
+def save_graph_snapshot(graph, snapshot_dir, source_files):
+    """
+    Save a CSR citation graph as a directory of .npy arrays keyed by its source files.
+
+    The snapshot is written to a temporary directory and swapped into place, so readers
+    never see a partial snapshot.
+
+    Args:
+        graph (CitationGraph): The graph to save.
+        snapshot_dir (str): Directory that will hold the snapshot.
+        source_files (list): Files the graph was built from; their fingerprints key the snapshot.
+    """
+    def write_arrays(temp_dir):
+        for name in SNAPSHOT_ARRAYS:
+            array = getattr(graph, name)
+            if array is not None:
+                np.save(os.path.join(temp_dir, f'{name}.npy'), np.asarray(array))
+
+    try:
+        write_graph_snapshot(snapshot_dir, source_files, graph.directed, write_arrays)
+    except Exception as e:
+        print(f"Failed to save graph snapshot: {e}")
+
+
+def write_graph_snapshot(snapshot_dir, source_files, directed, write_arrays):
+    """
+    Write a graph snapshot whose arrays are produced by `write_arrays` and swap it into place.
+
+    Args:
+        snapshot_dir (str): Directory that will hold the snapshot.
+        source_files (list): Files the graph was built from; their fingerprints key the snapshot.
+        directed (bool): Whether the graph is directed.
+        write_arrays (callable): Called with the temporary snapshot directory; writes the .npy file of
+            each name in `SNAPSHOT_ARRAYS` the graph has.
+    """
+    parent = os.path.dirname(os.path.abspath(snapshot_dir))
+    temp_dir = tempfile.mkdtemp(dir=parent, prefix='.snapshot-')
+    try:
+        write_arrays(temp_dir)
+        meta = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'directed': directed,
+            'sources': {os.path.abspath(path): file_fingerprint(path) for path in source_files}
+        }
+        with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=4)
+
+        stale_dir = None
+        if os.path.exists(snapshot_dir):
+            stale_dir = tempfile.mkdtemp(dir=parent, prefix='.snapshot-stale-')
+            os.replace(snapshot_dir, os.path.join(stale_dir, 'snapshot'))
+        os.replace(temp_dir, snapshot_dir)
+        if stale_dir:
+            shutil.rmtree(stale_dir, ignore_errors=True)
+        print(f"Graph snapshot saved to {snapshot_dir}.")
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+
+def load_graph_snapshot(snapshot_dir, source_files):
+    """
+    Open a graph snapshot memory-mapped, provided it was built from the given source files.
+
+    Args:
+        snapshot_dir (str): Directory holding the snapshot.
+        source_files (list): Files the caller would otherwise parse.
+
+    Returns:
+        CitationGraph or None: The memory-mapped graph, or None if the snapshot is missing or stale.
+    """
+    meta_file = os.path.join(snapshot_dir, 'meta.json')
+    if not os.path.exists(meta_file):
+        return None
+    try:
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+    except json.JSONDecodeError as e:
+        print(f"Error decoding graph snapshot metadata: {e}")
+        return None
+
+    sources = {os.path.abspath(path) for path in source_files}
+    if meta.get('format_version') != SNAPSHOT_FORMAT_VERSION or set(meta['sources']) != sources:
+        return None
+    if not all(_fingerprint_matches(path, fingerprint) for path, fingerprint in meta['sources'].items()):
+        return None
+
+    arrays = {}
+    for name in SNAPSHOT_ARRAYS:
+        array_file = os.path.join(snapshot_dir, f'{name}.npy')
+        arrays[name] = np.load(array_file, mmap_mode='r') if os.path.exists(array_file) else None
+    print(f"Loaded graph snapshot for {len(arrays['indptr']) - 1} nodes from {snapshot_dir}.")
+    return CitationGraph(arrays['node_ids'], arrays['indptr'], arrays['indices'], meta['directed'], arrays['dates'])
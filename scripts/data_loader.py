@@ -1,29 +1,250 @@
-import networkx as nx
+import concurrent.futures as cf
+import csv
+import io
+import itertools
+import os
+import numpy as np
+import pandas as pd
 from scripts import utils as ut
+from scripts import data_access as da
+from scripts import instrumentation as ins
+from scripts.citation_graph import CitationGraph
+from scripts import id_interner as ii
+from scripts.id_interner import IdInterner
 
-def load_citation_network(filepath):
+# Smallest shard worth a worker process; smaller files are parsed in fewer shards
+MIN_SHARD_BYTES = 2 ** 20
+
+# Shards per worker, so shards of uneven parsing cost still balance across the pool
+SHARDS_PER_WORKER = 4
+
+
+def read_edge_list(filepath):
     """
-    Loads the citation network from a file and returns it as a directed graph.
-    
+    Reads a tab-separated SNAP edge list in one vectorized pass.
+
+    Lines starting with '#' and lines that do not hold exactly two tab-separated fields are skipped,
+    as in the line-by-line parser this replaces, the first line of the file included. Unlike that
+    parser, trailing empty fields are not stripped: "1\t2\t" holds three fields and is skipped.
+
     Args:
         filepath (str): Path to the citation network file.
-    
+
     Returns:
-        nx.DiGraph: A directed graph where nodes are paper IDs and edges represent citations.
+        tuple: (from_papers, to_papers) arrays of formatted paper IDs, one entry per edge.
+    """
+    with open(filepath, 'rb') as file:
+        return parse_edge_frame(_read_edge_frame(file))
+
+
+def iter_edge_chunks(filepath, chunk_lines):
+    """
+    Reads a SNAP edge list in chunks of at most `chunk_lines` lines, parsed as in `read_edge_list`.
+
+    Args:
+        filepath (str): Path to the citation network file.
+        chunk_lines (int): Number of lines read at a time.
+
+    Yields:
+        tuple: (from_papers, to_papers) arrays of formatted paper IDs of the chunk's edges.
+    """
+    # Each chunk is parsed as a file of its own: pandas' chunked reader keeps a line with three fields
+    # when it starts a chunk instead of skipping it
+    with open(filepath, 'rb') as file:
+        while True:
+            chunk = b''.join(itertools.islice(file, chunk_lines))
+            if not chunk:
+                break
+            yield parse_edge_frame(_read_edge_frame(io.BytesIO(chunk)))
+
+
+def read_interned_edges(filepath, workers=1, min_shard_bytes=MIN_SHARD_BYTES):
     """
-    citation_graph = nx.DiGraph()
-    with open(filepath, 'r') as file:
-        for line in file:
-            if not line.startswith('#'):
-                parts = line.strip().split('\t')
-                if len(parts) == 2:
-                    from_paper, to_paper = parts
-                    from_paper = ut.format_paper_id(from_paper)
-                    to_paper = ut.format_paper_id(to_paper)
-                    citation_graph.add_edge(from_paper, to_paper)
-    return citation_graph
+    Reads a SNAP edge list into paper ID codes, parsing byte-range shards of the file in parallel.
+
+    The file is cut into shards at line boundaries (see `shard_ranges`). Each worker parses its
+    shard as `read_edge_list` does, comment and malformed lines included, and returns its edges as
+    integer codes into the shard's own ID table, so only integer arrays and one copy of each ID
+    cross process boundaries. The tables are merged in shard order: IDs are numbered in order of
+    first appearance in the file, exactly as a single-process load, whatever the number of workers.
+
+    Args:
+        filepath (str): Path to the citation network file.
+        workers (int): Number of parsing processes; 1 parses the shards in the calling process.
+        min_shard_bytes (int): Smallest shard size.
+
+    Returns:
+        tuple: (IdInterner of the paper IDs, (e, 2) int64 array of the citing and cited code of each edge).
+    """
+    workers = max(1, int(workers or 1))
+    ranges = shard_ranges(filepath, workers * SHARDS_PER_WORKER, min_shard_bytes)
+    with ins.stage('parse_shards') as record:
+        if workers > 1 and len(ranges) > 1:
+            with cf.ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+                shards = list(executor.map(_parse_shard, [filepath] * len(ranges), *zip(*ranges)))
+        else:
+            shards = [_parse_shard(filepath, start, stop) for start, stop in ranges]
+        record.count(shards=len(ranges), bytes=ranges[-1][1] if ranges else 0)
+
+    interner, merged = IdInterner.from_values(np.concatenate([ids for ids, _ in shards] + [np.empty(0, dtype=object)]))
+    offsets = np.cumsum([0] + [len(ids) for ids, _ in shards])
+    codes = [merged[offset + shard_codes] for offset, (_, shard_codes) in zip(offsets, shards)]
+    codes = np.concatenate(codes + [np.empty(0, dtype=np.int64)]).astype(np.int64)
+    return interner, codes.reshape(-1, 2)
+
+
+def shard_ranges(filepath, shards, min_shard_bytes=MIN_SHARD_BYTES):
+    """
+    Splits a file into at most `shards` byte ranges of about equal size, each ending after a newline.
+
+    Every boundary is moved forward to the start of the next line, so each line, '#' header lines
+    included, falls whole into exactly one shard.
+
+    Returns:
+        list: (start, stop) byte offsets of each non-empty shard, in file order.
+    """
+    size = os.path.getsize(filepath)
+    shards = max(1, min(shards, size // max(min_shard_bytes, 1)))
+    boundaries = [0]
+    with open(filepath, 'rb') as file:
+        for shard in range(1, shards):
+            offset = max(size * shard // shards, boundaries[-1])
+            if offset >= size:
+                break
+            file.seek(offset - 1)
+            file.readline()
+            boundaries.append(file.tell())
+    boundaries.append(size)
+    return [(start, stop) for start, stop in zip(boundaries, boundaries[1:]) if stop > start]
+
+
+def _parse_shard(filepath, start, stop):
+    """ Parse one shard of an edge list into its ID table and the (citing, cited) codes of its edges. """
+    # _read_edge_frame skips a malformed first line, so a shard starting with one parses like the whole file
+    with open(filepath, 'rb') as file:
+        file.seek(start)
+        data = file.read(stop - start)
+    from_papers, to_papers = parse_edge_frame(_read_edge_frame(io.BytesIO(data)))
+    interner, codes = IdInterner.from_values(np.column_stack([from_papers, to_papers]).ravel())
+    return np.asarray(interner.ids, dtype=object), codes.astype(np.int32)
+
+
+def _read_edge_frame(file):
+    """ Read the raw 'from' and 'to' columns of an edge list from a binary file object. """
+    # pandas takes a first line with three fields as an index column followed by two data columns and
+    # then misreads every line after it; a leading two-field comment line, dropped with the other
+    # comments, fixes the shape it infers, so a malformed first line is skipped like any other
+    guarded = io.BufferedReader(_PrefixedReader(b'#\t#\n', file))
+    return pd.read_csv(guarded, sep='\t', header=None, names=['from', 'to'], dtype=str, keep_default_na=False,
+                       quoting=csv.QUOTE_NONE, on_bad_lines='skip')
 
 
+class _PrefixedReader(io.RawIOBase):
+    """ A read-only stream giving `prefix` and then the rest of `file`. """
 
+    def __init__(self, prefix, file):
+        self._prefix = prefix
+        self._file = file
 
+    def readable(self):
+        return True
 
+    def readinto(self, buffer):
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        return self._file.readinto(buffer)
+
+
+def parse_edge_frame(edges):
+    """ Format the raw 'from' and 'to' columns of an edge list frame and drop comment and empty lines. """
+    # Each distinct raw ID is stripped and formatted once; line.strip().split('\t') leaves
+    # outer whitespace on the first and last field only.
+    from_codes, from_raw = pd.factorize(edges['from'])
+    to_codes, to_raw = pd.factorize(edges['to'])
+    from_formatted = np.array([_format_field(raw.lstrip()) for raw in from_raw], dtype=object)
+    to_formatted = np.array([_format_field(raw.rstrip()) for raw in to_raw], dtype=object)
+    is_comment = np.array([raw.startswith('#') for raw in from_raw], dtype=bool)
+
+    from_papers, to_papers = from_formatted[from_codes], to_formatted[to_codes]
+    valid = ~is_comment[from_codes] & (from_papers != '') & (to_papers != '')
+    return from_papers[valid], to_papers[valid]
+
+
+def _format_field(field):
+    return ut.format_paper_id(field) if field else ''
+
+
+def load_paper_dates(filepath):
+    """
+    Loads the paper submission dates shipped as cit-HepPh-dates.txt.
+
+    The file lists some IDs more than once, and cross-listed papers under the "11<true_id>" form;
+    cross-listed IDs are folded onto their true ID and the earliest date is kept for each paper.
+
+    Args:
+        filepath (str): Path to the dates file.
+
+    Returns:
+        pd.Series: Submission dates (datetime64) indexed by formatted paper ID.
+    """
+    from_papers, dates = read_edge_list(filepath)
+    dates = pd.Series(pd.to_datetime(dates, format='%Y-%m-%d', errors='coerce'), index=ii.true_ids(from_papers))
+    return dates.groupby(level=0, sort=False).min()
+
+
+@ins.instrumented(items=lambda graph: {'nodes': graph.number_of_nodes(), 'edges': graph.number_of_edges()})
+def load_citation_graph(filepath, dates_path=None, snapshot_dir=None, workers=1):
+    """
+    Loads the citation network from a file into a CSR graph.
+
+    Node indices follow the order in which paper IDs first appear in the file. When `snapshot_dir`
+    is given, a binary snapshot is reused if it was built from the same files, and written otherwise.
+    With `workers` > 1 the file is parsed in shards by a process pool (see `read_interned_edges`);
+    the graph is the same for any number of workers.
+
+    Args:
+        filepath (str): Path to the citation network file.
+        dates_path (str): Optional path to the paper dates file.
+        snapshot_dir (str): Optional directory for the memory-mapped graph snapshot.
+        workers (int): Number of processes parsing the edge list.
+
+    Returns:
+        CitationGraph: A directed CSR graph where nodes are paper IDs and edges represent citations.
+    """
+    source_files = [filepath] + ([dates_path] if dates_path else [])
+    if snapshot_dir:
+        graph = da.load_graph_snapshot(snapshot_dir, source_files)
+        if graph is not None:
+            return graph
+
+    if workers > 1:
+        interner, codes = read_interned_edges(filepath, workers)
+    else:
+        from_papers, to_papers = read_edge_list(filepath)
+        interner, codes = IdInterner.from_values(np.column_stack([from_papers, to_papers]).ravel())
+        codes = codes.reshape(-1, 2)
+    graph = CitationGraph.from_edges(codes[:, 0], codes[:, 1], interner)
+    if dates_path:
+        dates = load_paper_dates(dates_path)
+        graph.dates = dates.reindex(interner.true_ids()).to_numpy(dtype='datetime64[D]')
+
+    if snapshot_dir:
+        da.save_graph_snapshot(graph, snapshot_dir, source_files)
+    return graph
+
+
+@ins.instrumented(items=lambda graph: {'nodes': graph.number_of_nodes(), 'edges': graph.number_of_edges()})
+def load_citation_network(filepath):
+    """
+    Loads the citation network from a file and returns it as a directed graph.
+
+    Args:
+        filepath (str): Path to the citation network file.
+
+    Returns:
+        nx.DiGraph: A directed graph where nodes are paper IDs and edges represent citations.
+    """
+    return load_citation_graph(filepath).to_networkx()
@@ -0,0 +1,128 @@
+import math
+import numpy as np
+from scipy.special import gammaln
+
+FISHER_CORRECTIONS = (None, 'bonferroni', 'fdr_bh')
+
+# Relative tolerance when comparing table probabilities, as in R's fisher.test. Log-probabilities built
+# from log-factorials of large counts carry absolute errors far above SciPy's 1e-14, so exact ties
+# between tables would otherwise be split at random.
+_RELATIVE_TOLERANCE = 1e-7
+
+# Largest number of support points evaluated at once
+_BLOCK_SIZE = 1 << 22
+
+_log_factorials = np.zeros(1)
+
+
+def log_factorials(n):
+    """
+    Return log(k!) for k = 0..n, extending a table shared by all calls when needed.
+
+    Args:
+        n (int): Largest argument needed.
+
+    Returns:
+        np.ndarray: The cached table, of length at least n + 1.
+    """
+    global _log_factorials
+    if len(_log_factorials) <= n:
+        size = max(n + 1, 2 * len(_log_factorials))
+        _log_factorials = gammaln(np.arange(size, dtype=np.float64) + 1)
+    return _log_factorials
+
+
+def fisher_exact_batch(a, b, c, d):
+    """
+    Two-sided Fisher's exact test on many 2x2 tables [[a, b], [c, d]] at once.
+
+    Follows the conventions of `scipy.stats.fisher_exact`: the odds ratio is a*d / (b*c), infinite
+    when b or c is 0, and NaN with a p-value of 1 when a row or column sums to 0. The p-value sums the
+    hypergeometric probabilities of every table with the same margins that is no more likely than the
+    observed one. Probabilities are evaluated as log-pmf differences of cached log-factorials over the
+    ragged supports of all tables together.
+
+    Args:
+        a, b, c, d (array-like): Cell counts of each table.
+
+    Returns:
+        tuple: (odds ratio array, p-value array).
+    """
+    a, b, c, d = (np.asarray(cell, dtype=np.int64).ravel() for cell in (a, b, c, d))
+    if min(a.min(initial=0), b.min(initial=0), c.min(initial=0), d.min(initial=0)) < 0:
+        raise ValueError("All values in the tables must be nonnegative.")
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        odds_ratio = (a * d) / (b * c)
+    odds_ratio[(b == 0) | (c == 0)] = np.inf
+    degenerate = (a + b == 0) | (c + d == 0) | (a + c == 0) | (b + d == 0)
+    odds_ratio[degenerate] = np.nan
+
+    # Hypergeometric draws: `drawn` balls out of `total`, `marked` of which are marked; `a` are observed
+    total = a + b + c + d
+    marked = a + b
+    drawn = a + c
+    low = np.maximum(0, drawn - (total - marked))
+    high = np.minimum(drawn, marked)
+    lf = log_factorials(int(total.max(initial=0)))
+
+    # log C(marked, x) + log C(total - marked, drawn - x) - log C(total, drawn), split into a per-table part
+    unmarked = total - marked
+    constant = lf[marked] + lf[unmarked] - lf[total] + lf[drawn] + lf[total - drawn]
+
+    def log_pmf(x, marked, unmarked, drawn, constant):
+        return constant - lf[x] - lf[marked - x] - lf[drawn - x] - lf[unmarked - drawn + x]
+
+    threshold = log_pmf(a, marked, unmarked, drawn, constant) + math.log1p(_RELATIVE_TOLERANCE)
+    p_value = np.zeros(len(a))
+    at_mode = np.zeros(len(a), dtype=bool)
+    lengths = high - low + 1
+    for start, stop in _support_blocks(lengths):
+        block = slice(start, stop)
+        block_lengths = lengths[block]
+        cell = np.repeat(np.arange(stop - start), block_lengths)
+        offsets = np.cumsum(block_lengths) - block_lengths
+        x = np.arange(len(cell)) + np.repeat(low[block] - offsets, block_lengths)
+        log_p = log_pmf(x, *(np.repeat(values[block], block_lengths) for values in (marked, unmarked, drawn, constant)))
+        keep = log_p <= np.repeat(threshold[block], block_lengths)
+        p_value[block] = np.bincount(cell[keep], weights=np.exp(log_p[keep]), minlength=stop - start)
+        # Every table is as likely as the observed one only when the observed table is the mode
+        at_mode[block] = np.bincount(cell[~keep], minlength=stop - start) == 0
+
+    p_value[at_mode | degenerate] = 1.0
+    return odds_ratio, np.minimum(p_value, 1.0)
+
+
+def _support_blocks(lengths):
+    """ Split consecutive tables into blocks whose supports hold about `_BLOCK_SIZE` points in total. """
+    ends = np.cumsum(lengths)
+    start = 0
+    while start < len(lengths):
+        base = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, base + _BLOCK_SIZE, side='right')), start + 1)
+        yield start, stop
+        start = stop
+
+
+def adjust_pvalues(p_values, method):
+    """
+    Correct p-values for multiple testing.
+
+    Args:
+        p_values (array-like): Raw p-values of every test in the family.
+        method (str): 'bonferroni', or 'fdr_bh' for the Benjamini-Hochberg false discovery rate.
+
+    Returns:
+        np.ndarray: Adjusted p-values in the input order.
+    """
+    if method not in FISHER_CORRECTIONS[1:]:
+        raise ValueError(f"Unknown correction '{method}', expected one of {FISHER_CORRECTIONS[1:]}.")
+    p_values = np.asarray(p_values, dtype=np.float64)
+    count = len(p_values)
+    if method == 'bonferroni':
+        return np.minimum(p_values * count, 1.0)
+    order = np.argsort(p_values, kind='stable')
+    scaled = p_values[order] * count / np.arange(1, count + 1)
+    adjusted = np.empty(count)
+    adjusted[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+    return adjusted
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+
+class IdInterner:
+    """
+    Maps paper IDs to dense int32 indices and back.
+
+    The ID table is built once, usually by the loader, and shared by every later stage so that
+    graphs, partitions and label matrices can be plain NumPy arrays indexed by node. IDs are
+    turned back into strings only when results are written out.
+
+    Attributes:
+        ids (np.ndarray): Paper ID for each index.
+    """
+
+    def __init__(self, ids):
+        self.ids = np.asarray(ids)
+        self._lookup_index = None
+
+    @property
+    def _index(self):
+        # Built lazily so that wrapping a memory-mapped ID table stays free until a lookup is needed
+        if self._lookup_index is None:
+            self._lookup_index = pd.Index(self.ids)
+        return self._lookup_index
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Intern a sequence of IDs in order of first appearance.
+
+        Args:
+            values (array-like): Paper IDs, possibly repeated.
+
+        Returns:
+            tuple: (interner, codes) where `codes[i]` is the index of `values[i]`.
+        """
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        ids = np.asarray(uniques, dtype=str) if len(uniques) else np.array([], dtype='<U7')
+        return cls(ids), codes.astype(np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, paper_id):
+        return paper_id in self._index
+
+    def index_of(self, paper_ids):
+        """
+        Look up the indices of many paper IDs at once.
+
+        Args:
+            paper_ids (array-like): Paper IDs to look up.
+
+        Returns:
+            np.ndarray: int32 index of each ID, or -1 for IDs that were never interned.
+        """
+        if not len(paper_ids):
+            return np.empty(0, dtype=np.int32)
+        return self._index.get_indexer(np.asarray(paper_ids, dtype=object)).astype(np.int32)
+
+    def lookup(self, indices):
+        """ Return the paper IDs for an array of indices. """
+        return self.ids[np.asarray(indices)]
+
+    def cross_listed(self):
+        """ Flag papers stored in the cross-listed "11<true_id>" form (see `cross_listed`). """
+        return cross_listed(self.ids)
+
+    def true_ids(self):
+        """ Return the paper IDs with the cross-listed "11" prefix removed (see `true_ids`). """
+        return true_ids(self.ids)
+
+
+def cross_listed(paper_ids):
+    """
+    Flag paper IDs in the cross-listed "11<true_id>" form described in cit-HepPh-dates.txt.
+
+    Only IDs longer than seven characters are flagged. A cross-listed January 2000 paper such as
+    "11" + "1002" is indistinguishable from hep-ph/0111002 once padded, so it cannot be recovered.
+
+    Returns:
+        np.ndarray: Boolean mask over the IDs.
+    """
+    ids = pd.Series(np.asarray(paper_ids), dtype=object)
+    return ((ids.str.len() > 7) & ids.str.startswith('11')).to_numpy(dtype=bool)
+
+
+def true_ids(paper_ids):
+    """ Return formatted paper IDs with the cross-listed "11" prefix removed and re-padded to seven digits. """
+    ids = pd.Series(np.asarray(paper_ids), dtype=object)
+    flagged = cross_listed(paper_ids)
+    ids[flagged] = ids[flagged].str[2:].str.zfill(7)
+    return ids.to_numpy(dtype=str) if len(ids) else np.asarray(paper_ids)
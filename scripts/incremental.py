@@ -0,0 +1,419 @@
+import collections as col
+import numpy as np
+import pandas as pd
+from scripts.citation_graph import CitationGraph, GrowingGraph
+from scripts import community_backends as cb
+from scripts import community_detection as cd
+from scripts import graph_metrics as gm
+from scripts import instrumentation as ins
+from scripts.quotient_graph import QuotientGraph
+
+UPDATE_METHODS = ('local', 'infomap')
+
+GraphDelta = col.namedtuple('GraphDelta', ['graph', 'sources', 'targets', 'num_previous_nodes'])
+
+
+def extend_graph(graph, source_ids, target_ids, paper_ids=()):
+    """
+    Add new citations, and the papers they introduce, to a citation graph.
+
+    Existing papers keep their node indices and new papers are appended in order of first appearance,
+    `paper_ids` first. Citations already in the graph or repeated in the delta are skipped. A
+    GrowingGraph grows in place at a cost that follows the delta and the rows of the papers it cites
+    from; a CitationGraph is first copied into a GrowingGraph.
+
+    Args:
+        graph (GrowingGraph or CitationGraph): The current graph.
+        source_ids (array-like): Paper ID of each citing paper.
+        target_ids (array-like): Paper ID of each cited paper.
+        paper_ids (array-like): New papers to add even if they have no citations yet.
+
+    Returns:
+        GraphDelta: The grown graph, the node indices of the citations actually added and the number
+        of nodes before the delta.
+    """
+    if isinstance(graph, CitationGraph):
+        graph = GrowingGraph(graph)
+    num_nodes = graph.number_of_nodes()
+    paper_ids = np.asarray(paper_ids, dtype=object)
+    values = np.concatenate([paper_ids, np.asarray(source_ids, dtype=object), np.asarray(target_ids, dtype=object)])
+    codes = graph.index_of(values)
+    unknown = codes < 0
+    new_codes, new_ids = pd.factorize(values[unknown])
+    codes[unknown] = num_nodes + new_codes
+    graph.add_nodes(np.asarray(new_ids, dtype=object))
+
+    num_edges = (len(values) - len(paper_ids)) // 2
+    sources, targets = codes[len(paper_ids):len(paper_ids) + num_edges], codes[len(paper_ids) + num_edges:]
+    width = graph.number_of_nodes()
+    if graph.directed:
+        keys = sources * width + targets
+    else:
+        keys = np.minimum(sources, targets) * width + np.maximum(sources, targets)
+    _, first_seen = np.unique(keys, return_index=True)
+    first_seen.sort()
+    sources, targets = sources[first_seen], targets[first_seen]
+    new = ~graph.has_edges(sources, targets)
+    sources, targets = sources[new], targets[new]
+    graph.add_edges(sources, targets)
+    return GraphDelta(graph, sources, targets, num_nodes)
+
+
+def warm_start_labels(delta, labels, method='local', next_label=None, **options):
+    """
+    Update a partition after a delta, starting from the previous partition instead of from scratch.
+
+    New papers start as singleton communities. The 'local' method makes label propagation moves only
+    around the papers touched by the delta (see `community_backends.propagate_labels`), reading the
+    rows of the papers it reaches in the GrowingGraph, so its cost follows the delta and the
+    neighbourhoods it spreads to rather than the size of the graph. The 'infomap' method reruns
+    Infomap on the whole grown graph with the previous partition as its initial partition, which
+    converges faster than a cold start; its modules are then matched to the previous community IDs.
+
+    Args:
+        delta (GraphDelta): Output of `extend_graph`.
+        labels (np.ndarray): int64 community label of each node of the grown graph; the entries of the
+            previous nodes hold the previous partition and those of new nodes are overwritten. 'local'
+            updates it in place.
+        method (str): 'local' or 'infomap'.
+        next_label (int): Label of the first new singleton community; defaults to one past the largest
+            previous label.
+        **options: Options of the label propagation or Infomap run, e.g. `seed`.
+
+    Returns:
+        tuple: (labels, moved) where `labels` gives the community of each node of the grown graph and
+        `moved` the sorted node indices that joined the graph or changed community. Communities that
+        survive keep their previous labels; new communities get labels from `next_label` on.
+    """
+    if method not in UPDATE_METHODS:
+        raise ValueError(f"Unknown update method '{method}', expected one of {UPDATE_METHODS}.")
+    graph = delta.graph
+    num_previous = delta.num_previous_nodes
+    if next_label is None:
+        next_label = int(labels[:num_previous].max(initial=-1)) + 1
+    new_nodes = np.arange(num_previous, graph.number_of_nodes())
+    labels[num_previous:] = next_label + np.arange(len(new_nodes))
+    if method == 'local':
+        touched = np.concatenate([delta.sources, delta.targets, new_nodes])
+        changed = cb.propagate_labels(graph.neighbours, labels, touched, **options)
+        return labels, np.union1d(changed, new_nodes)
+    infomap_labels = cd.detect_community_labels(graph.to_graph(), initial_labels=labels, **options)
+    matched = match_labels(infomap_labels, labels)
+    return matched, np.union1d(np.flatnonzero(matched[:num_previous] != labels[:num_previous]), new_nodes)
+
+
+def match_labels(labels, reference):
+    """
+    Renumber communities after the reference communities they overlap most.
+
+    Pairs of (community, reference community) are matched greedily by decreasing overlap, each label
+    used at most once; unmatched communities get labels after the largest reference label.
+
+    Args:
+        labels (np.ndarray): Community label of each node.
+        reference (np.ndarray): Reference community label of each node.
+
+    Returns:
+        np.ndarray: int64 labels using the reference labels wherever a community was matched.
+    """
+    label_ids, labels = np.unique(labels, return_inverse=True)
+    reference_ids, reference = np.unique(reference, return_inverse=True)
+    pairs, overlap = np.unique(labels.astype(np.int64) * len(reference_ids) + reference, return_counts=True)
+    renamed = np.full(len(label_ids), -1, dtype=np.int64)
+    used = np.zeros(len(reference_ids), dtype=bool)
+    for pair in pairs[np.argsort(-overlap, kind='stable')].tolist():
+        label, match = divmod(pair, len(reference_ids))
+        if renamed[label] < 0 and not used[match]:
+            renamed[label] = reference_ids[match]
+            used[match] = True
+    unmatched = renamed < 0
+    renamed[unmatched] = reference_ids.max(initial=-1) + 1 + np.arange(np.count_nonzero(unmatched))
+    return renamed[labels]
+
+
+class CommunityTally:
+    """
+    Per-community paper counts, degree sums, subfield tallies and quotient graph of a growing graph.
+
+    Arrays and the rows of the `quotient` graph of citations between communities are indexed by
+    community label. `update` only visits the papers that joined the graph or changed community and
+    the citations around them, read from the rows of a GrowingGraph, so its cost follows the size of
+    the delta rather than of the graph. Arrays grow with spare capacity, and the citation counts
+    moving between communities are queued and folded into the quotient graph when it is read or once
+    they outnumber its entries. Betweenness and clustering do not update locally;
+    `prepare_community_stats` recomputes them.
+
+    Args:
+        graph (CitationGraph): The citation graph.
+        labels (np.ndarray): Non-negative community label of each node index.
+        label_matrix (LabelMatrix): Encoded subfield labels of the nodes.
+    """
+
+    def __init__(self, graph, labels, label_matrix):
+        self.directed = graph.directed
+        self._labels = np.asarray(labels, dtype=np.int64).copy()
+        self._degrees = graph.degree().astype(np.int64)
+        self.num_nodes = len(self._labels)
+        self.subfields = list(label_matrix.subfields)
+        self.size = int(self._labels.max(initial=-1)) + 1
+        self._counts = np.bincount(self._labels, minlength=self.size)
+        sources, targets = graph.edge_arrays()
+        self._quotient = QuotientGraph.from_edges(self._labels[sources], self._labels[targets], self.size, self.directed)
+        self._pending = []
+        self._degree_sums = np.bincount(self._labels, weights=self._degrees, minlength=self.size).astype(np.int64)
+        self._subfield_counts = np.zeros((self.size, len(self.subfields)), dtype=np.int64)
+        self._tally_subfields(np.arange(self.num_nodes), self._labels, label_matrix, 1)
+
+    @property
+    def labels(self):
+        return self._labels[:self.num_nodes]
+
+    @property
+    def counts(self):
+        return self._counts[:self.size]
+
+    @property
+    def degree_sums(self):
+        return self._degree_sums[:self.size]
+
+    @property
+    def subfield_counts(self):
+        return self._subfield_counts[:self.size]
+
+    @property
+    def quotient(self):
+        """ The quotient graph of citations between communities, with the queued changes folded in. """
+        self._fold_pending()
+        return self._quotient
+
+    @ins.instrumented(name='update_tally', items=lambda moved: {'moved': len(moved)})
+    def update(self, delta, labels, label_matrix, moved=None):
+        """
+        Fold in a delta and the updated partition.
+
+        Args:
+            delta (GraphDelta): Output of `extend_graph` on the graph this tally follows.
+            labels (np.ndarray): Community label of each node of the grown graph.
+            label_matrix (LabelMatrix): Subfield labels of the grown graph, e.g. from `LabelMatrix.append`.
+            moved (np.ndarray): Node indices that joined the graph or changed community, as returned by
+                `warm_start_labels`; when omitted they are found by comparing the whole partitions.
+
+        Returns:
+            np.ndarray: Node indices that joined the graph or changed community.
+        """
+        graph = delta.graph
+        num_previous, num_nodes = delta.num_previous_nodes, graph.number_of_nodes()
+        if num_previous != self.num_nodes:
+            raise ValueError("The delta does not start from the graph this tally follows.")
+        if label_matrix.subfields[:len(self.subfields)] != self.subfields:
+            raise ValueError("The label matrix must keep the subfield columns of the tally.")
+        if moved is None:
+            moved = np.concatenate([np.flatnonzero(self.labels != labels[:num_previous]),
+                                    np.arange(num_previous, num_nodes)])
+        moved = np.asarray(moved, dtype=np.int64)
+        labels = np.asarray(labels)
+        moved_before = moved[moved < num_previous]
+        self._grow(max(self.size, int(labels[moved].max(initial=-1)) + 1), len(label_matrix.subfields))
+        self.subfields = list(label_matrix.subfields)
+        self._labels = _grown(self._labels, num_nodes)
+        self._degrees = _grown(self._degrees, num_nodes)
+        self._labels[num_previous:num_nodes] = labels[num_previous:]
+        self._degrees[num_previous:num_nodes] = 0
+        previous = self._labels[moved_before]
+
+        # Moved papers leave their old community with their old degree and join the new one with the new degree
+        touched, degree_change = np.unique(np.concatenate([delta.sources, delta.targets]), return_counts=True)
+        np.subtract.at(self._counts, previous, 1)
+        np.add.at(self._counts, labels[moved], 1)
+        np.subtract.at(self._degree_sums, previous, self._degrees[moved_before])
+        self._degrees[touched] += degree_change
+        np.add.at(self._degree_sums, labels[moved], self._degrees[moved])
+        stayed = ~np.isin(touched, moved)
+        np.add.at(self._degree_sums, labels[touched[stayed]], degree_change[stayed])
+        self._tally_subfields(moved_before, previous, label_matrix, -1)
+        self._tally_subfields(moved, labels[moved], label_matrix, 1)
+
+        # Old citations around moved papers move between communities; new citations only add
+        sources, targets = self._citations_around(graph, moved_before, delta)
+        old_sources, old_targets = self._labels[sources], self._labels[targets]
+        self._labels[moved_before] = labels[moved_before]
+        self._pending.append((np.concatenate([old_sources, self._labels[sources], labels[delta.sources]]),
+                              np.concatenate([old_targets, self._labels[targets], labels[delta.targets]]),
+                              np.concatenate([np.full(len(sources), -1), np.ones(len(sources) + len(delta.sources),
+                                                                                 dtype=np.int64)])))
+        if sum(len(weights) for _, _, weights in self._pending) > self._quotient.counts.nnz + 1024:
+            self._fold_pending()
+        self.num_nodes = num_nodes
+        return moved
+
+    def community_stats(self):
+        """
+        Return the statistics that follow the tally, in the format of `prepare_community_stats`.
+
+        Communities are keyed by label in increasing order. Subfields are listed in column order, so
+        ties for the dominant subfield go to the subfield seen first overall.
+
+        Returns:
+            dict: Community label -> 'count', 'subfields', 'internal_edges', 'edge_density',
+            'avg_degree_centrality', 'cut_size', 'conductance', 'modularity_contribution',
+            'dominant_subfield' and 'dominant_percentage'.
+        """
+        communities = np.flatnonzero(self.counts)
+        counts = self.counts[communities]
+        internal_edges = self.quotient.internal_edges()[communities]
+        cut_sizes = self.quotient.cut_sizes()[communities]
+        conductance = self.quotient.conductance()[communities]
+        modularity_contributions = self.quotient.modularity_contributions()[communities]
+        edge_density = gm.density(counts, internal_edges, self.directed)
+        avg_degree = self.degree_sums[communities] / (counts * max(self.num_nodes - 1, 1))
+        community_stats = {}
+        for position, community in enumerate(communities.tolist()):
+            row = self.subfield_counts[community]
+            present = np.flatnonzero(row)
+            stats = {
+                'count': int(counts[position]),
+                'subfields': {self.subfields[column]: int(row[column]) for column in present},
+                'internal_edges': int(internal_edges[position]),
+                'edge_density': edge_density[position],
+                'avg_degree_centrality': avg_degree[position],
+                'cut_size': int(cut_sizes[position]),
+                'conductance': conductance[position],
+                'modularity_contribution': modularity_contributions[position],
+                'dominant_subfield': None,
+                'dominant_percentage': 0
+            }
+            if len(present):
+                dominant = int(np.argmax(row))
+                stats['dominant_subfield'] = self.subfields[dominant]
+                stats['dominant_percentage'] = row[dominant] / stats['count'] * 100
+            community_stats[community] = stats
+        return community_stats
+
+    def _fold_pending(self):
+        if self._quotient.num_modules < self.size:
+            self._quotient = self._quotient.resize(self.size)
+        if self._pending:
+            sources, targets, weights = (np.concatenate(column) for column in zip(*self._pending))
+            self._quotient = self._quotient.add_edges(sources, targets, weights)
+            self._pending = []
+
+    def _grow(self, size, num_subfields):
+        self._counts = _grown(self._counts, size)
+        self._degree_sums = _grown(self._degree_sums, size)
+        self._subfield_counts = _grown(self._subfield_counts, size)
+        self._counts[self.size:size] = 0
+        self._degree_sums[self.size:size] = 0
+        self._subfield_counts[self.size:size] = 0
+        if num_subfields > self._subfield_counts.shape[1]:
+            subfield_counts = np.zeros((len(self._subfield_counts), num_subfields), dtype=np.int64)
+            subfield_counts[:, :self._subfield_counts.shape[1]] = self._subfield_counts
+            self._subfield_counts = subfield_counts
+        self.size = size
+
+    def _tally_subfields(self, nodes, communities, label_matrix, sign):
+        rows, columns = np.nonzero(label_matrix.ranks[nodes])
+        np.add.at(self._subfield_counts, (communities[rows], columns), sign)
+
+    def _citations_around(self, graph, nodes, delta):
+        """ Return the citations from before `delta` with an end among `nodes`, each listed once. """
+        sources, targets = graph.successors(nodes)
+        if self.directed:
+            cited, citing = graph.predecessors(nodes)
+            sources, targets = np.concatenate([sources, citing]), np.concatenate([targets, cited])
+        width = graph.number_of_nodes()
+        if self.directed:
+            keys, new_keys = sources * width + targets, delta.sources * width + delta.targets
+        else:
+            keys = np.minimum(sources, targets) * width + np.maximum(sources, targets)
+            new_keys = np.minimum(delta.sources, delta.targets) * width + np.maximum(delta.sources, delta.targets)
+        keys = np.unique(keys)
+        keys = keys[~np.isin(keys, new_keys)]
+        return keys // width, keys % width
+
+
+def _grown(array, size):
+    """ Return `array`, or a copy with at least twice its rows and the rest zero-filled, so that it holds `size` rows. """
+    if size <= len(array):
+        return array
+    grown = np.zeros((max(size, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class IncrementalCommunities:
+    """
+    Keeps a partition and its community statistics current as citations arrive.
+
+    Each `update` grows a GrowingGraph by a delta, warm-starts community detection from the previous
+    partition (see `warm_start_labels`) and folds the delta into the community tally. With the
+    'local' warm start, an update reads only the rows of the papers the delta and the label moves
+    reach, so a daily batch of citations costs about as much as the batch rather than a rerun of the
+    whole pipeline. The 'infomap' warm start reruns Infomap on the whole graph. `graph` materializes
+    the CSR graph when it is looked at, at a cost linear in its size.
+
+    Usage:
+        communities = IncrementalCommunities(graph, labels, label_matrix)
+        communities.update(new_sources, new_targets, labeled_papers=new_labels)
+        stats = communities.community_stats()
+
+    Args:
+        graph (CitationGraph): The citation graph the partition was detected on.
+        labels (np.ndarray): Non-negative community label of each node index.
+        label_matrix (LabelMatrix): Encoded subfield labels of the nodes.
+        method (str): 'local' or 'infomap' warm start.
+        **options: Options of the warm start, e.g. `seed`.
+    """
+
+    def __init__(self, graph, labels, label_matrix, method='local', **options):
+        if method not in UPDATE_METHODS:
+            raise ValueError(f"Unknown update method '{method}', expected one of {UPDATE_METHODS}.")
+        self._graph = GrowingGraph(graph)
+        self._labels = np.asarray(labels, dtype=np.int64).copy()
+        self.label_matrix = label_matrix
+        self.method = method
+        self.options = options
+        self.tally = CommunityTally(graph, self._labels, label_matrix)
+
+    @property
+    def graph(self):
+        """ The current citation graph as a CitationGraph. """
+        return self._graph.to_graph()
+
+    @property
+    def labels(self):
+        """ Community label of each node; later updates change it in place, so copy it to keep a partition. """
+        return self._labels[:self._graph.number_of_nodes()]
+
+    @ins.instrumented(items=lambda delta: {'nodes': delta.graph.number_of_nodes() - delta.num_previous_nodes,
+                                           'edges': len(delta.sources)})
+    def update(self, source_ids, target_ids, paper_ids=(), labeled_papers=None):
+        """
+        Add new citations and papers, update the partition and the community tally.
+
+        Args:
+            source_ids (array-like): Paper ID of each citing paper.
+            target_ids (array-like): Paper ID of each cited paper.
+            paper_ids (array-like): New papers without citations yet.
+            labeled_papers (dict): Paper ID -> subfields of the new papers; entries of other papers are ignored.
+
+        Returns:
+            GraphDelta: The delta that was applied.
+        """
+        delta = extend_graph(self._graph, source_ids, target_ids, paper_ids)
+        num_previous, num_nodes = delta.num_previous_nodes, self._graph.number_of_nodes()
+        labeled_papers = labeled_papers or {}
+        rows = self._graph.index_of(list(labeled_papers))
+        self.label_matrix = self.label_matrix.append(
+            self._graph.node_ids[num_previous:],
+            {paper_id: labeled_papers[paper_id] for paper_id, row in zip(labeled_papers, rows.tolist())
+             if row >= num_previous})
+
+        self._labels = _grown(self._labels, num_nodes)
+        labels, moved = warm_start_labels(delta, self._labels[:num_nodes], self.method, self.tally.size, **self.options)
+        self._labels[:num_nodes] = labels
+        self.tally.update(delta, self.labels, self.label_matrix, moved)
+        return delta
+
+    def community_stats(self):
+        """ Return the current community statistics (see `CommunityTally.community_stats`). """
+        return self.tally.community_stats()
@@ -0,0 +1,253 @@
+import contextlib
+import cProfile
+import datetime
+import functools
+import json
+import os
+import platform
+import re
+import sys
+import threading
+import time
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILERS = (None, 'cprofile', 'pyinstrument')
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+_MAXRSS_SCALE = 1 if sys.platform == 'darwin' else 1024
+
+_active_report = None
+
+
+class StageRecord:
+    """
+    Measurements of one pipeline stage: wall and CPU time, peak RSS, the number of items processed and
+    any other values the stage reports, such as a quality score.
+
+    CPU time of child processes only includes children that were waited for during the stage, e.g.
+    a process pool shut down before the stage ends.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = {}
+        self.values = {}
+        self.profile = None
+        self.wall_time = self.cpu_time = self.children_cpu_time = 0.0
+        self.peak_rss = self.peak_rss_growth = self.children_peak_rss = None
+
+    def count(self, **items):
+        """ Record item counts, e.g. `stage.count(nodes=n, edges=m)`. """
+        self.items.update((key, int(value)) for key, value in items.items())
+
+    def measure(self, **values):
+        """ Record other results of the stage, e.g. `stage.measure(modularity=q)`. """
+        self.values.update((key, float(value)) for key, value in values.items())
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'children_cpu_time': self.children_cpu_time,
+            'peak_rss': self.peak_rss,
+            'peak_rss_growth': self.peak_rss_growth,
+            'children_peak_rss': self.children_peak_rss,
+            'items': self.items,
+            'values': self.values,
+            'profile': self.profile
+        }
+
+
+class _NullStage:
+    """ Stands in for a StageRecord when no report is active. """
+
+    def count(self, **items):
+        pass
+
+    def measure(self, **values):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class RunReport:
+    """
+    Collects stage measurements of a pipeline run and writes them as a JSON report.
+
+    Stages opened inside another stage are recorded as 'outer/inner'. With a `profiler`, each top-level
+    stage is also profiled and the profile is written to `profile_dir`: a `.prof` file for 'cprofile'
+    (readable with pstats or snakeviz) and an `.html` page for 'pyinstrument'. Nested stages are not
+    profiled separately since only one profiler can be active at a time.
+
+    Usage:
+        report = RunReport(profiler='cprofile', profile_dir='Results/profiles')
+        with report.activate():
+            graph = dl.load_citation_graph(path)  # instrumented functions record themselves
+            with stage('analysis') as record:
+                ...
+                record.count(communities=len(stats))
+        report.save('Results/run_report.json')
+
+    Args:
+        parameters (dict): Run parameters stored in the report.
+        profiler (str): None, 'cprofile' or 'pyinstrument'.
+        profile_dir (str): Directory for the profiles; defaults to 'profiles' in the working directory.
+    """
+
+    def __init__(self, parameters=None, profiler=None, profile_dir=None):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler '{profiler}', expected one of {PROFILERS}.")
+        if profiler == 'pyinstrument':
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError as e:
+                raise ImportError("profiler='pyinstrument' needs the pyinstrument package.") from e
+        self.parameters = dict(parameters or {})
+        self.profiler = profiler
+        self.profile_dir = profile_dir or 'profiles'
+        self.stages = []
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self._start = _clock()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def activate(self):
+        """ Make this the report that `stage` and `instrumented` functions record into. """
+        global _active_report
+        previous, _active_report = _active_report, self
+        try:
+            yield self
+        finally:
+            _active_report = previous
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ Measure the enclosed block as stage `name`, yielding its StageRecord for item counts. """
+        path = getattr(self._local, 'path', ())
+        record = StageRecord('/'.join(path + (name,)))
+        profiler = self._start_profiler() if not path and self.profiler else None
+        self._local.path = path + (name,)
+        rss_before, _ = _peak_rss()
+        start = _clock()
+        try:
+            yield record
+        finally:
+            end = _clock()
+            self._local.path = path
+            record.wall_time, record.cpu_time, record.children_cpu_time = (e - s for e, s in zip(end, start))
+            record.peak_rss, record.children_peak_rss = _peak_rss()
+            if record.peak_rss is not None:
+                record.peak_rss_growth = record.peak_rss - rss_before
+            if profiler is not None:
+                record.profile = self._save_profile(profiler, name)
+            with self._lock:
+                self.stages.append(record)
+
+    def to_dict(self):
+        end = _clock()
+        peak_rss, children_peak_rss = _peak_rss()
+        return {
+            'started': self.started.isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'parameters': self.parameters,
+            'wall_time': end[0] - self._start[0],
+            'cpu_time': end[1] - self._start[1],
+            'children_cpu_time': end[2] - self._start[2],
+            'peak_rss': peak_rss,
+            'children_peak_rss': children_peak_rss,
+            'stages': [record.to_dict() for record in self.stages]
+        }
+
+    def save(self, report_file):
+        """ Write the report as JSON to `report_file`. """
+        directory = os.path.dirname(report_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(report_file, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2, default=str)
+        print(f"Run report saved to {report_file}.")
+
+    def _start_profiler(self):
+        if self.profiler == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            import pyinstrument
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+        return profiler
+
+    def _save_profile(self, profiler, name):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, re.sub(r'[^\w.-]', '_', name))
+        if self.profiler == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(base + '.prof')
+            return base + '.prof'
+        profiler.stop()
+        with open(base + '.html', 'w') as file:
+            file.write(profiler.output_html())
+        return base + '.html'
+
+
+def active_report():
+    """ Return the RunReport currently recording, or None. """
+    return _active_report
+
+
+def stage(name):
+    """
+    Measure the enclosed block as a stage of the active report; does nothing when no report is active.
+
+    Returns:
+        A context manager yielding the StageRecord (or a stand-in) whose `count` records item counts.
+    """
+    report = _active_report
+    return report.stage(name) if report is not None else contextlib.nullcontext(_NULL_STAGE)
+
+
+def instrumented(name=None, items=None):
+    """
+    Decorator recording each call of a function as a stage of the active report.
+
+    Args:
+        name (str): Stage name; defaults to the function name.
+        items (callable): Maps the function's result to a dict of item counts.
+    """
+    def decorate(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            report = _active_report
+            if report is None:
+                return function(*args, **kwargs)
+            with report.stage(stage_name) as record:
+                result = function(*args, **kwargs)
+                if items is not None:
+                    record.count(**items(result))
+            return result
+        return wrapper
+    return decorate
+
+
+def _clock():
+    """ Return (wall time, CPU time of this process, CPU time of waited-for children) in seconds. """
+    times = os.times()
+    return time.perf_counter(), times.user + times.system, times.children_user + times.children_system
+
+
+def _peak_rss():
+    """ Return the peak resident set size in bytes of this process and of its largest child, if known. """
+    if resource is None:
+        return None, None
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_SCALE,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * _MAXRSS_SCALE)
@@ -1,12 +1,130 @@
+import collections as col
 import concurrent.futures as cf
-from scripts.data_access import save_json_cache
+import functools
+import hashlib
+import itertools
+import numpy as np
+from scripts.data_access import save_json_cache, load_json_cache
+from scripts.id_interner import IdInterner
+from scripts import instrumentation as ins
+import json
 import re as regex
 
+# Bump when the labeling rules change so that cached labels are recomputed
+LABELING_VERSION = 2
+
+
+class KeywordMatcher:
+    """
+    Finds every keyword of a subfield dictionary in a text with a single compiled regex.
+
+    The keywords are merged into one case-insensitive alternation laid out as a character trie, so the
+    regex engine follows shared prefixes once instead of trying each keyword separately. The alternation
+    sits inside a lookahead, which lets matches start at every word boundary and overlap; at each position
+    the trie prefers the longest keyword, and the shorter keywords it contains as a whole-word prefix
+    ("neutrino" in "neutrino oscillation") are added from a table built with the matcher. The result is
+    the same set of keywords that searching for each `\\b<keyword>\\b` separately would find.
+
+    Attributes:
+        subfield_dict (dict): Keyword -> subfield mapping; its order sets the label priority.
+    """
+
+    def __init__(self, subfield_dict):
+        self.subfield_dict = subfield_dict
+        keys = {}
+        for priority, (keyword, subfield) in enumerate(subfield_dict.items()):
+            keys.setdefault(keyword.lower(), []).append((priority, subfield))
+        self._keys = keys
+        self._implied = {key: self._word_prefixes(key) for key in keys}
+        self._pattern = None
+        if keys:
+            alternation = self._trie_pattern(self._build_trie(keys))
+            self._pattern = regex.compile(r'(?=\b({})\b)'.format(alternation), regex.IGNORECASE)
+
+    def _word_prefixes(self, key):
+        """ Keywords that match wherever `key` matches: `key` itself and its prefixes that end on a word boundary. """
+        def is_word(char):
+            return regex.match(r'\w', char) is not None
+
+        return [other for other in self._keys if other == key or (
+            other and key.startswith(other) and is_word(key[len(other) - 1]) != is_word(key[len(other)]))]
+
+    @staticmethod
+    def _build_trie(keys):
+        trie = {}
+        for key in keys:
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        return trie
+
+    def _trie_pattern(self, node):
+        branches = [regex.escape(char) + self._trie_pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:{})'.format('|'.join(branches))
+        if '' in node:
+            # Optional groups are greedy, so longer keywords are tried before this one ends
+            return '(?:{})?'.format(pattern)
+        return pattern
+
+    def find_keywords(self, text):
+        """
+        Find the dictionary keywords that occur in a text as whole words, ignoring case.
+
+        Args:
+            text (str): The text to scan.
+
+        Returns:
+            set: Lower-cased keywords found in the text.
+        """
+        found = set()
+        if self._pattern is None:
+            return found
+        for match in self._pattern.finditer(text):
+            key = match.group(1).lower()
+            if key not in found:
+                found.update(self._implied.get(key, (key,)))
+        return found
+
+    def assign_labels(self, title, abstract, max_labels=3):
+        """ Assign subfield labels to a paper; see `assign_labels`. """
+        found = self.find_keywords(title) | self.find_keywords(abstract)
+        matched_subfields = []
+        for _, subfield in sorted(entry for key in found for entry in self._keys.get(key, ())):
+            if subfield not in matched_subfields:
+                matched_subfields.append(subfield)
+                if len(matched_subfields) >= max_labels:
+                    break
+        return matched_subfields if matched_subfields else ["Unknown"]
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_matcher(items):
+    return KeywordMatcher(dict(items))
+
+
+def keyword_matcher(subfield_dict):
+    """
+    Return the compiled `KeywordMatcher` for a subfield dictionary, building it on first use.
+
+    Args:
+        subfield_dict (dict): A dictionary mapping keywords to subfields.
+
+    Returns:
+        KeywordMatcher: A matcher shared by every call with an equal dictionary.
+    """
+    return _cached_matcher(tuple(subfield_dict.items()))
+
 
 def assign_labels(title, abstract, subfield_dict, max_labels=3):
     """
     Assign subfield labels to a paper based on its title and abstract, allowing multiple labels per paper.
 
+    A subfield is assigned when one of its keywords occurs as a whole word in the title or the abstract,
+    ignoring case. Subfields are taken in the order of their first matching keyword in `subfield_dict`.
+
     Args:
         title (str): The title of the paper.
         abstract (str): The abstract of the paper.
@@ -16,16 +134,7 @@ def assign_labels(title, abstract, subfield_dict, max_labels=3):
     Returns:
         list: A list of assigned subfields, up to a specified maximum.
     """
-    matched_subfields = []
-    for keyword, subfield in subfield_dict.items():
-        pattern = regex.compile(r'\b{}\b'.format(regex.escape(keyword)), regex.IGNORECASE)
-        if pattern.search(title) or pattern.search(abstract):
-            if subfield not in matched_subfields:
-                matched_subfields.append(subfield)
-            if len(matched_subfields) >= max_labels:
-                break
-
-    return matched_subfields if matched_subfields else ["Unknown"]
+    return keyword_matcher(subfield_dict).assign_labels(title, abstract, max_labels)
 
 
 def create_subfield_dictionary():
@@ -206,26 +315,302 @@ def label_paper(paper_id, metadata, subfield_dict, max_labels=3):
     return paper_id, labels
 
 
-def label_papers(metadata, subfield_dict, cache_file='labels_cache.json'):
+@ins.instrumented(items=lambda labeled_papers: {'papers': len(labeled_papers)})
+def label_papers(metadata, subfield_dict, cache_file='labels_cache.json', workers=1, chunk_size=2048):
     """
-    Label all papers in the metadata dictionary using concurrent processing.
+    Label the papers in the metadata dictionary, reusing cached labels where possible.
+
+    See `iter_labeled_papers` for how the labels cache is used.
 
     Args:
         metadata (dict): A dictionary where keys are paper IDs and values are their metadata.
         subfield_dict (dict): A dictionary mapping keywords to subfields.
         cache_file (str): The path to the cache file for storing labels.
+        workers (int): Number of worker processes; 1 labels in the calling process.
+        chunk_size (int): Number of papers per block.
 
     Returns:
         dict: A dictionary mapping paper IDs to lists of labels.
     """
     labeled_papers = {}
-    with cf.ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(label_paper, pid, metadata[pid], subfield_dict): pid for pid in metadata}
-        for future in cf.as_completed(futures):
-            paper_id, labels = future.result()
-            labeled_papers[paper_id] = labels
-
-    save_json_cache(labeled_papers, cache_file, "labels")
+    for chunk_labels in iter_labeled_papers(metadata.items(), subfield_dict, cache_file, workers, chunk_size):
+        labeled_papers.update(chunk_labels)
     return labeled_papers
 
-    
+
+def iter_labeled_papers(records, subfield_dict, cache_file='labels_cache.json', workers=1, chunk_size=2048):
+    """
+    Label a stream of papers block by block, reusing cached labels where possible.
+
+    Each cache entry records a hash of the paper's title and abstract and the fingerprint of the
+    subfield dictionary it was labeled with. Only papers that are new, whose text changed, or whose
+    entry was made with another dictionary are labeled again, in blocks spread over worker processes.
+    Entries written in the older plain-list format count as stale. Blocks are labeled while later
+    records are still arriving, and the cache is saved once the stream ends.
+
+    Args:
+        records (iterable): (paper ID, metadata dict) pairs, e.g. `metadata.items()` or `iter_metadata(...)`.
+        subfield_dict (dict): A dictionary mapping keywords to subfields.
+        cache_file (str): The path to the cache file for storing labels.
+        workers (int): Number of worker processes; 1 labels in the calling process.
+        chunk_size (int): Number of papers per block.
+
+    Yields:
+        dict: Paper ID -> labels for one block, in the order of `records`.
+    """
+    cache = load_json_cache(cache_file, "labels")
+    dictionary = dictionary_fingerprint(subfield_dict)
+
+    def blocks():
+        for chunk in _record_chunks(records, chunk_size):
+            hashes = {paper_id: content_hash(title, abstract) for paper_id, title, abstract in chunk}
+            stale = [paper for paper in chunk if not _is_current(cache.get(paper[0]), hashes[paper[0]], dictionary)]
+            yield (chunk, hashes), stale
+
+    relabeled = total = 0
+    with _Labeler(subfield_dict, workers) as labeler:
+        for (chunk, hashes), labels in labeler.ordered(blocks()):
+            for paper_id, paper_labels in labels.items():
+                cache[paper_id] = {"labels": paper_labels, "hash": hashes[paper_id], "dictionary": dictionary}
+            relabeled += len(labels)
+            total += len(chunk)
+            yield {paper_id: cache[paper_id]["labels"] for paper_id, _, _ in chunk}
+
+    if relabeled:
+        print(f"Labeled {relabeled} of {total} papers; the others were in the labels cache.")
+        save_json_cache(cache, cache_file, "labels")
+
+
+def content_hash(title, abstract):
+    """ Return a short digest of a paper's title and abstract, used to detect changed metadata. """
+    return hashlib.blake2b(json.dumps([title, abstract]).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def dictionary_fingerprint(subfield_dict):
+    """ Return a short digest of a subfield dictionary, in order, and of the labeling rules version. """
+    payload = json.dumps([LABELING_VERSION, list(subfield_dict.items())])
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _is_current(entry, paper_hash, dictionary):
+    return isinstance(entry, dict) and entry.get("hash") == paper_hash and entry.get("dictionary") == dictionary
+
+
+class _Labeler:
+    """ Labels blocks of (paper ID, title, abstract) in the calling process or on a process pool. """
+
+    def __init__(self, subfield_dict, workers=1, max_labels=3):
+        self.subfield_dict = subfield_dict
+        self.workers = workers
+        self.max_labels = max_labels
+        self._executor = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self._executor = cf.ProcessPoolExecutor(max_workers=self.workers, initializer=_init_label_worker,
+                                                    initargs=(self.subfield_dict,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+    def submit(self, chunk):
+        if self._executor is not None and chunk:
+            return self._executor.submit(_label_worker_chunk, chunk, self.max_labels)
+        future = cf.Future()
+        future.set_result(_label_chunk(keyword_matcher(self.subfield_dict), chunk, self.max_labels))
+        return future
+
+    def ordered(self, items):
+        """
+        Label a stream of (key, block) pairs, yielding (key, labels) in input order.
+
+        A few blocks per worker are kept in flight; finished blocks at the head are handed back
+        without waiting for more input.
+        """
+        pending = col.deque()
+        for key, chunk in items:
+            pending.append((key, self.submit(chunk)))
+            while pending and (pending[0][1].done() or len(pending) > 2 * self.workers):
+                key, future = pending.popleft()
+                yield key, future.result()
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result()
+
+
+def _record_chunks(records, chunk_size):
+    papers = ((paper_id, entry.get("title", ""), entry.get("abstract", "")) for paper_id, entry in records)
+    while True:
+        chunk = list(itertools.islice(papers, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _label_chunk(matcher, chunk, max_labels):
+    return {paper_id: matcher.assign_labels(title, abstract, max_labels) for paper_id, title, abstract in chunk}
+
+
+# Matcher compiled by each labeling worker in `_init_label_worker`
+_worker_matcher = None
+
+
+def _init_label_worker(subfield_dict):
+    global _worker_matcher
+    _worker_matcher = keyword_matcher(subfield_dict)
+
+
+def _label_worker_chunk(chunk, max_labels):
+    return _label_chunk(_worker_matcher, chunk, max_labels)
+
+
+class LabelMatrix:
+    """
+    Subfield labels of every interned paper, stored as a rank matrix.
+
+    `ranks[i, j]` is k when subfield j is the k-th label of paper i and 0 when it is not assigned,
+    so both label membership and label order survive without per-paper Python lists.
+
+    Attributes:
+        ranks (np.ndarray): int8 matrix of shape (number of papers, number of subfields).
+        subfields (list): Subfield name for each column.
+        labeled (np.ndarray): Boolean mask of papers that were present in the labeled papers dict.
+        outside_counts (np.ndarray): Per-subfield label counts of labeled papers outside the ID table.
+    """
+
+    def __init__(self, ranks, subfields, labeled, outside_counts):
+        self.ranks = ranks
+        self.subfields = subfields
+        self.labeled = labeled
+        self.outside_counts = outside_counts
+        # [ranks, labeled, rows in use] with spare rows, shared with the matrix `append` was called on
+        self._buffer = None
+
+    @classmethod
+    def from_dict(cls, labeled_papers, interner, default=("Unknown",)):
+        """
+        Encode a paper ID -> labels dict against a shared ID interner.
+
+        Args:
+            labeled_papers (dict): Mapping from paper IDs to lists of subfields.
+            interner (IdInterner): The ID table that defines the row order.
+            default (tuple): Labels given to interned papers missing from `labeled_papers`.
+
+        Returns:
+            LabelMatrix: The encoded labels.
+        """
+        builder = LabelMatrixBuilder(interner, default)
+        builder.add(labeled_papers)
+        return builder.build()
+
+    def append(self, paper_ids, labeled_papers=None, default=("Unknown",)):
+        """
+        Return the label matrix with rows for new papers appended, encoding only the new papers.
+
+        Existing rows and subfield columns keep their positions; subfields first seen among the new
+        papers get new columns. Rows go to a buffer with spare capacity that the new matrix shares with this one, so appending
+        a batch costs amortized time in the size of the batch; the matrix is copied when the buffer is
+        full, when new subfields add columns, or when this matrix was appended to before.
+
+        Args:
+            paper_ids (array-like): IDs of the new papers, in row order.
+            labeled_papers (dict): Paper ID -> labels of the new papers; other entries count as labeled
+                papers outside the ID table.
+            default (tuple): Labels given to new papers missing from `labeled_papers`.
+
+        Returns:
+            LabelMatrix: The labels of the current and the new papers.
+        """
+        builder = LabelMatrixBuilder(IdInterner(paper_ids), default, self.subfields)
+        builder.add(labeled_papers or {})
+        added = builder.build()
+        num_rows = len(self.ranks)
+        size = num_rows + len(added.ranks)
+        buffer = self._buffer
+        if buffer is None or buffer[2] != num_rows or buffer[0].shape[1] != len(added.subfields) or size > len(buffer[0]):
+            capacity = max(size, 2 * num_rows)
+            ranks = np.zeros((capacity, len(added.subfields)), dtype=np.int8)
+            ranks[:num_rows, :len(self.subfields)] = self.ranks
+            labeled = np.zeros(capacity, dtype=bool)
+            labeled[:num_rows] = self.labeled
+            buffer = [ranks, labeled, size]
+        buffer[0][num_rows:size] = added.ranks
+        buffer[1][num_rows:size] = added.labeled
+        buffer[2] = size
+        outside_counts = added.outside_counts.copy()
+        outside_counts[:len(self.subfields)] += self.outside_counts
+        matrix = LabelMatrix(buffer[0][:size], added.subfields, buffer[1][:size], outside_counts)
+        matrix._buffer = buffer
+        return matrix
+
+    def overall_counts(self):
+        """ Count the labeled papers carrying each subfield, as `calculate_overall_subfield_counts` does for dicts. """
+        return np.count_nonzero(self.ranks[self.labeled], axis=0) + self.outside_counts
+
+    def to_dict(self, interner):
+        """ Rebuild the paper ID -> labels dict for the labeled papers in the ID table. """
+        paper_ids = interner.ids.tolist()
+        labeled_papers = {}
+        for row in np.flatnonzero(self.labeled):
+            columns = np.flatnonzero(self.ranks[row])
+            columns = columns[np.argsort(self.ranks[row, columns])]
+            labeled_papers[paper_ids[row]] = [self.subfields[column] for column in columns]
+        return labeled_papers
+
+
+class LabelMatrixBuilder:
+    """
+    Builds a `LabelMatrix` from labeled papers that arrive in blocks.
+
+    Only the (row, column, rank) cells of each block are kept, so a labeling stream can be folded in
+    without holding a paper ID -> labels dict. Adding the blocks of a dict in order builds the same
+    matrix as `LabelMatrix.from_dict` on the whole dict.
+
+    Usage:
+        builder = LabelMatrixBuilder(interner)
+        for chunk_labels in iter_labeled_papers(records, subfield_dict):
+            builder.add(chunk_labels)
+        label_matrix = builder.build()
+    """
+
+    def __init__(self, interner, default=("Unknown",), subfields=()):
+        self.interner = interner
+        self.default = default
+        self._subfield_index = {subfield: column for column, subfield in enumerate(subfields)}
+        self._cells = []
+        self._outside = []
+        self._labeled = np.zeros(len(interner), dtype=bool)
+
+    def add(self, labeled_papers):
+        """ Fold in a block of paper ID -> labels. """
+        paper_ids = list(labeled_papers)
+        rows = self.interner.index_of(paper_ids)
+        cells = []
+        for paper_id, row in zip(paper_ids, rows):
+            for rank, subfield in enumerate(labeled_papers[paper_id], start=1):
+                column = self._subfield_index.setdefault(subfield, len(self._subfield_index))
+                if row >= 0:
+                    cells.append((row, column, rank))
+                else:
+                    self._outside.append(column)
+        if cells:
+            self._cells.append(np.array(cells, dtype=np.int64))
+        self._labeled[rows[rows >= 0]] = True
+
+    def build(self):
+        """ Return the label matrix, giving the default labels to papers that were never added. """
+        cells = list(self._cells)
+        unlabeled = np.flatnonzero(~self._labeled)
+        for rank, subfield in enumerate(self.default, start=1):
+            column = self._subfield_index.setdefault(subfield, len(self._subfield_index))
+            if len(unlabeled):
+                cells.append(np.column_stack([unlabeled, np.full(len(unlabeled), column), np.full(len(unlabeled), rank)]))
+
+        ranks = np.zeros((len(self.interner), len(self._subfield_index)), dtype=np.int8)
+        if cells:
+            cells = np.concatenate(cells)
+            ranks[cells[:, 0], cells[:, 1]] = cells[:, 2]
+        outside_counts = np.bincount(np.array(self._outside, dtype=np.int64), minlength=len(self._subfield_index))
+        return LabelMatrix(ranks, list(self._subfield_index), self._labeled.copy(), outside_counts)
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import numpy as np
+from scripts import instrumentation as ins
+from scripts.quotient_graph import QuotientGraph
+
+# Angle between consecutive members of a sunflower spiral, which spreads them evenly over a disc
+GOLDEN_ANGLE = np.pi * (3 - np.sqrt(5))
+
+LAYOUT_FORMAT_VERSION = 1
+
+
+def community_layout(graph, labels, seed=0, iterations=50, max_modules=1000, cache_file=None):
+    """
+    Lay out a graph by its communities: modules are placed by a force-directed layout of the community
+    supergraph, then their members are packed inside each module's disc.
+
+    Each module is a disc with an area proportional to its size. The discs are positioned by a
+    Fruchterman-Reingold layout of the supergraph, whose edges are weighted by the citations between
+    modules and whose repulsion acts on the gaps between discs, so linked modules sit close without
+    overlapping. Members fill their module's disc along a sunflower spiral, best-connected members in
+    the middle. Only the `max_modules` largest modules are laid out by force; smaller ones are packed
+    at the rim of the large module they cite most. The force layout costs O(iterations * modules²)
+    and the packing O(n log n), so graphs of 100k+ nodes lay out in seconds.
+
+    Args:
+        graph (CitationGraph): The graph.
+        labels (np.ndarray): Community label of each node index.
+        seed (int): Seed of the initial module positions.
+        iterations (int): Number of force-directed iterations.
+        max_modules (int): Number of largest modules laid out by force.
+        cache_file (str): Optional .npz file keeping the positions; they are reused while the graph,
+            the labels and the options are unchanged.
+
+    Returns:
+        np.ndarray: (n, 2) float64 position of each node index.
+    """
+    key = None
+    if cache_file:
+        key = layout_key(graph, labels, seed, iterations, max_modules)
+        positions = load_layout(cache_file, key)
+        if positions is not None:
+            return positions
+
+    with ins.stage('layout') as record:
+        _, modules = np.unique(labels, return_inverse=True)
+        quotient = QuotientGraph.from_partition(graph, modules)
+        num_modules = quotient.num_modules
+        sizes = np.bincount(modules, minlength=num_modules)
+        links = _undirected_links(quotient)
+
+        # The largest modules are laid out by force; the others join the large module they cite most
+        large = np.zeros(num_modules, dtype=bool)
+        large[np.argsort(-sizes, kind='stable')[:max_modules]] = True
+        hosts = np.flatnonzero(large)
+        host_of = np.full(num_modules, -1, dtype=np.int64)
+        host_of[hosts] = np.arange(len(hosts))
+        small = np.flatnonzero(~large)
+        if len(small):
+            to_hosts = links[small][:, hosts]
+            has_link = np.diff(to_hosts.indptr) > 0
+            host_of[small] = np.where(has_link, np.asarray(to_hosts.argmax(axis=1)).ravel(),
+                                      np.argmax(sizes[hosts]))
+        host_sizes = np.bincount(host_of[modules], minlength=len(hosts))
+        radii = np.sqrt(host_sizes)
+        centers = _force_layout(_undirected_links(quotient.coarsen(host_of, len(hosts))), radii, seed, iterations)
+
+        # Host members first, then each satellite module in turn, best-connected nodes first
+        degrees = graph.degree()
+        order = np.lexsort((-degrees, modules, ~large[modules], host_of[modules]))
+        node_hosts = host_of[modules][order]
+        starts = np.searchsorted(node_hosts, np.arange(len(hosts)))
+        ranks = np.arange(len(order)) - starts[node_hosts]
+        radius = np.sqrt(ranks + 0.5)
+        angle = ranks * GOLDEN_ANGLE
+        positions = np.empty((len(order), 2))
+        positions[order] = centers[node_hosts] + radius[:, None] * np.column_stack([np.cos(angle), np.sin(angle)])
+        record.count(nodes=len(positions), modules=num_modules, placed_modules=len(hosts))
+
+    if cache_file:
+        save_layout(positions, cache_file, key)
+    return positions
+
+
+def _undirected_links(quotient):
+    """ Symmetric weights of the links between communities, ignoring citation direction and internal citations. """
+    links = quotient.matrix + quotient.matrix.T if quotient.directed else quotient.matrix.copy()
+    links.setdiag(0)
+    links.eliminate_zeros()
+    return links.tocsr()
+
+
+def _force_layout(links, radii, seed=0, iterations=50, block=512):
+    """
+    Fruchterman-Reingold layout of weighted discs, with repulsion acting on the gaps between them and
+    scaled by the product of their radii.
+
+    Args:
+        links (sparse.csr_matrix): Symmetric weights of the links between discs.
+        radii (np.ndarray): Radius of each disc.
+        seed (int): Seed of the initial positions.
+        iterations (int): Number of iterations; the step size cools linearly to zero.
+        block (int): Number of discs whose repulsion is computed at once, bounding memory to
+            block × discs pairs.
+
+    Returns:
+        np.ndarray: (k, 2) centre of each disc.
+    """
+    count = len(radii)
+    rng = np.random.default_rng(seed)
+    spread = np.sqrt(np.sum(radii ** 2) * 4)
+    positions = rng.random((count, 2)) * spread
+    if count < 2:
+        return positions
+    ideal = 2 * radii.mean()
+    # Repulsion grows with the discs' sizes, so small modules are not pushed to the fringes
+    mass = radii / radii.mean()
+    coo = links.tocoo()
+    rows, cols = coo.row, coo.col
+    weights = coo.data / coo.data.max()
+    temperature = spread / 10
+    for step in range(iterations):
+        displacement = np.zeros((count, 2))
+        for start in range(0, count, block):
+            delta = positions[start:start + block, None, :] - positions[None, :, :]
+            distance = np.sqrt(np.sum(delta ** 2, axis=2))
+            gap = np.maximum(distance - radii[start:start + block, None] - radii[None, :], 0.01 * ideal)
+            force = ideal ** 2 * mass[start:start + block, None] * mass[None, :] / gap / np.maximum(distance, 1e-9)
+            force[np.arange(len(delta)), np.arange(start, start + len(delta))] = 0
+            displacement[start:start + block] = np.einsum('ij,ijk->ik', force, delta)
+        delta = positions[rows] - positions[cols]
+        distance = np.sqrt(np.sum(delta ** 2, axis=1))
+        pull = (weights * np.maximum(distance - radii[rows] - radii[cols], 0) ** 2 / ideal
+                / np.maximum(distance, 1e-9))[:, None] * delta
+        np.subtract.at(displacement, rows, pull)
+        length = np.maximum(np.sqrt(np.sum(displacement ** 2, axis=1)), 1e-9)
+        positions += displacement / length[:, None] * np.minimum(length, temperature)[:, None]
+        temperature = spread / 10 * (1 - (step + 1) / iterations)
+    return positions
+
+
+def layout_key(graph, labels, *options):
+    """ Return a digest identifying the graph structure, the partition and the layout options. """
+    digest = hashlib.sha256()
+    for array in (graph.indptr, graph.indices, np.asarray(labels)):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(repr((graph.directed, LAYOUT_FORMAT_VERSION) + options).encode())
+    return digest.hexdigest()
+
+
+def save_layout(positions, cache_file, key):
+    """ Save node positions under `key`, replacing the file atomically. """
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    os.makedirs(directory, exist_ok=True)
+    temp_file = os.path.join(directory, f'.{os.path.basename(cache_file)}.tmp.npz')
+    np.savez(temp_file, positions=positions, key=np.array(key))
+    os.replace(temp_file, cache_file)
+
+
+def load_layout(cache_file, key):
+    """ Return the positions saved under `key`, or None if the cache is missing or was made for another layout. """
+    if not os.path.exists(cache_file):
+        return None
+    with np.load(cache_file) as cached:
+        if str(cached['key']) != key:
+            return None
+        return cached['positions']
@@ -1,3 +1,5 @@
+import concurrent.futures as cf
+import functools
 import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -5,35 +7,144 @@ import scripts.data_loader as dl
 import scripts.label_assigner as la
 import scripts.metadata_extractor as me
 import scripts.community_detection as cd
+import scripts.community_backends as cb
 import scripts.community_analysis as ca
+import scripts.temporal as tp
 import scripts.utils as ut
+import scripts.instrumentation as ins
 
-def main():
+def main(betweenness_mode='exact', betweenness_samples=None, betweenness_epsilon=0.01, workers=1, streaming=True,
+         fisher_correction=None, detection_backend='infomap', detection_options=None, analysis_levels=(1,),
+         snapshot_frequency=None, report_file='Results/run_report.json', profiler=None):
+    """
+    Runs the full pipeline: load the graph, label papers, detect communities and write the analysis.
+
+    In streaming mode metadata records flow straight from the fetcher into the labeler and the label
+    matrix block by block, while community detection runs in a separate process; otherwise each stage
+    finishes before the next starts. Both modes produce the same results.
+
+    Every stage is timed, and a JSON run report with wall time, CPU time, peak memory and item counts
+    per stage is written to `report_file` (see `instrumentation.RunReport`).
+
+    Args:
+        betweenness_mode (str): 'exact', 'kpivot' or 'adaptive' betweenness centrality.
+        betweenness_samples (int): Number of pivots for the 'kpivot' mode.
+        betweenness_epsilon (float): Target error for the 'adaptive' mode.
+        workers (int): Number of processes for edge list parsing, labeling, betweenness and clustering.
+        streaming (bool): Overlap fetching, labeling and community detection instead of running them in turn.
+        fisher_correction (str): None, 'bonferroni' or 'fdr_bh' multiple-testing correction of the Fisher p-values.
+        detection_backend (str): Community detection backend: 'infomap', 'louvain', 'leiden' or 'label_propagation'.
+        detection_options (dict): Options of the backend, e.g. seed, trials and time_limit for Infomap
+            (see `community_backends`).
+        analysis_levels (tuple): Levels of the module hierarchy to analyze; the top level is written to
+            Results/community_analysis.txt and level n to Results/community_analysis_level<n>.txt. Levels
+            below the deepest one found are skipped.
+        snapshot_frequency (str): None, 'year' or 'month' to also follow the communities through cumulative
+            snapshots of the network by submission date, written to Results/community_snapshots.txt.
+        report_file (str): Path of the JSON run report; None to skip it.
+        profiler (str): None, 'cprofile' or 'pyinstrument' to also profile each stage into Results/profiles.
+    """
+    parameters = {'betweenness_mode': betweenness_mode, 'betweenness_samples': betweenness_samples,
+                  'betweenness_epsilon': betweenness_epsilon, 'workers': workers, 'streaming': streaming,
+                  'fisher_correction': fisher_correction, 'detection_backend': detection_backend,
+                  'detection_options': detection_options, 'analysis_levels': list(analysis_levels),
+                  'snapshot_frequency': snapshot_frequency}
+    report = ins.RunReport(parameters, profiler, profile_dir=os.path.join('Results', 'profiles'))
+    try:
+        with report.activate():
+            run_pipeline(betweenness_mode, betweenness_samples, betweenness_epsilon, workers, streaming,
+                         fisher_correction, detection_backend, detection_options, analysis_levels, snapshot_frequency)
+    finally:
+        if report_file:
+            report.save(report_file)
+
+def run_pipeline(betweenness_mode='exact', betweenness_samples=None, betweenness_epsilon=0.01, workers=1,
+                 streaming=True, fisher_correction=None, detection_backend='infomap', detection_options=None,
+                 analysis_levels=(1,), snapshot_frequency=None):
+    """ Runs the stages of `main` with the same arguments. """
     base_path = os.path.join(os.path.dirname(__file__), '..', 'Data')
     citation_file = os.path.join(base_path, 'cit-HepPh.txt')
+    dates_file = os.path.join(base_path, 'cit-HepPh-dates.txt')
+    snapshot_dir = os.path.join(base_path, 'cit-HepPh.snapshot')
+    layout_cache_path = os.path.join(base_path, 'cit-HepPh.layout.npz')
     metadata_cache_path = os.path.join(base_path, 'metadata_cache.json')
     labels_cache_path = os.path.join(base_path, 'labels_cache.json')
 
     # Load data
-    citation_network = dl.load_citation_network(citation_file)
-    paper_ids = list(citation_network.nodes())
+    citation_graph = dl.load_citation_graph(citation_file, dates_file, snapshot_dir, workers)
+    paper_ids = citation_graph.node_ids.tolist()
 
-    # Fetch metadata and labels
+    # Fetch metadata and labels, and detect communities
     subfield_dict = la.create_subfield_dictionary()
-    metadata = me.fetch_metadata(paper_ids, metadata_cache_path)
-    labeled_papers = la.label_papers(metadata, subfield_dict, labels_cache_path)
+    if streaming:
+        label_matrix, detection = stream_labels_and_communities(
+            citation_graph, subfield_dict, metadata_cache_path, labels_cache_path, workers, detection_backend,
+            detection_options)
+    else:
+        metadata = me.fetch_metadata(paper_ids, metadata_cache_path)
+        labeled_papers = la.label_papers(metadata, subfield_dict, labels_cache_path, workers=workers)
+        with ins.stage('label_matrix'):
+            label_matrix = la.LabelMatrix.from_dict(labeled_papers, citation_graph.interner)
+        detection = cb.detect_communities(citation_graph, detection_backend, **(detection_options or {}))
+    community_labels = detection.labels
 
-    # Detect communities and analyze them
-    partition = cd.detect_communities_infomap(citation_network)
-    community_stats, global_stats = ca.prepare_community_stats(partition, labeled_papers, citation_network)
+    # Analyze the communities; each level of the hierarchy is only computed when it is written
+    hierarchy, global_stats = ca.prepare_community_stats(
+        detection.tree, label_matrix, citation_graph, betweenness_mode, betweenness_samples, betweenness_epsilon,
+        workers=workers, level=None)
+    global_stats['detection_backend'] = detection.backend
+    global_stats['modularity'] = detection.quality
 
     # Calculate and display Fisher's Exact Test results
-    community_stats = ca.perform_fisher_analysis(community_stats, labeled_papers, len(paper_ids))
     if not os.path.exists('Results'):
         os.makedirs('Results')
-    ut.save_analysis(community_stats, global_stats, output_file='Results/community_analysis.txt')
-    cd.visualize_communities(citation_network, partition, community_stats)
+    # Finest level first, so that coarser levels are aggregated from it
+    for level in sorted({1, *analysis_levels} & set(range(1, hierarchy.num_levels + 1)), reverse=True):
+        level_stats = ca.perform_fisher_analysis(hierarchy.level(level), label_matrix, len(paper_ids),
+                                                 fisher_correction)
+        if level == 1:
+            community_stats = level_stats
+            ut.save_analysis(level_stats, global_stats, output_file='Results/community_analysis.txt')
+        else:
+            ut.save_analysis(level_stats, global_stats, output_file=f'Results/community_analysis_level{level}.txt',
+                             level=level)
+    if snapshot_frequency:
+        snapshots = tp.community_snapshots(citation_graph, label_matrix, snapshot_frequency)
+        ut.save_snapshots(snapshots, output_file='Results/community_snapshots.txt')
+    cd.visualize_communities(citation_graph, community_labels, community_stats, cache_file=layout_cache_path)
+
+def stream_labels_and_communities(citation_graph, subfield_dict, metadata_cache_path, labels_cache_path, workers=1,
+                                  detection_backend='infomap', detection_options=None):
+    """
+    Label papers as their metadata arrives while communities are detected in another process.
+
+    Args:
+        citation_graph (CitationGraph): The citation graph.
+        subfield_dict (dict): A dictionary mapping keywords to subfields.
+        metadata_cache_path (str): The path to the metadata cache.
+        labels_cache_path (str): The path to the labels cache.
+        workers (int): Number of labeling processes.
+        detection_backend (str): Community detection backend (see `community_backends`).
+        detection_options (dict): Options of the backend.
 
+    Returns:
+        tuple: (LabelMatrix, CommunityResult of the detection).
+    """
+    with ins.stage('stream_labels_and_communities') as record, cf.ProcessPoolExecutor(max_workers=1) as detector:
+        detection = detector.submit(functools.partial(cb.detect_communities, **(detection_options or {})),
+                                      citation_graph, detection_backend)
+        records = me.iter_metadata(citation_graph.node_ids.tolist(), metadata_cache_path)
+        builder = la.LabelMatrixBuilder(citation_graph.interner)
+        with ins.stage('fetch_and_label') as labeling:
+            papers = 0
+            for chunk_labels in la.iter_labeled_papers(records, subfield_dict, labels_cache_path, workers=workers):
+                builder.add(chunk_labels)
+                papers += len(chunk_labels)
+            labeling.count(papers=papers)
+        with ins.stage('wait_for_communities'):
+            result = detection.result()
+        record.count(nodes=len(result.labels), communities=len(set(result.labels.tolist())))
+        return builder.build(), result
 
 if __name__ == "__main__":
     main()
@@ -1,52 +1,73 @@
-import arxiv
-import concurrent.futures as cf
-import requests
-from bs4 import BeautifulSoup
-from scripts.data_access import save_json_cache, load_json_cache
-
-def query_arxiv(paper_id):
-    """ Query the ArXiv API for metadata using the paper's ID. """
-    try:
-        if paper_id.isdigit() and len(paper_id) == 7:
-            paper_id = f"hep-ph/{paper_id}"
-        search = arxiv.Search(id_list=[paper_id], max_results=1)
-        result = next(search.results(), None)
-        if result:
-            return {
-                "title": result.title,
-                "abstract": result.summary,
-                "published": result.published,
-                "authors": [author.name for author in result.authors]
-            }
-        else:
-            print(f"No metadata found for {paper_id}.")
-            return None
-    except Exception as e:
-        print(f"Error querying Paper ID {paper_id}: {e}")
-        return None
-
-def fetch_metadata(paper_ids, cache_file='metadata_cache.json'):
-    """Fetches metadata for a list of paper IDs using caching to avoid redundant API calls."""
-    metadata_dict = load_json_cache(cache_file, "metadata") 
+from scripts.data_access import save_json_cache, load_json_cache, JsonJournal
+from scripts.arxiv_fetcher import AsyncArxivFetcher
+from scripts import instrumentation as ins
+
+@ins.instrumented(items=lambda metadata: {'papers': len(metadata)})
+def fetch_metadata(paper_ids, cache_file='metadata_cache.json', fetcher=None):
+    """
+    Fetches metadata for a list of paper IDs using caching to avoid redundant API calls.
+
+    See `iter_metadata` for how papers are fetched and cached.
+
+    Args:
+        paper_ids (list): Paper IDs to fetch.
+        cache_file (str): The path to the metadata cache.
+        fetcher (ArxivFetcher): Optional fetcher, e.g. one with a custom transport; defaults to an `AsyncArxivFetcher`.
+
+    Returns:
+        dict: Paper ID -> metadata for every requested paper that has metadata.
+    """
+    return dict(iter_metadata(paper_ids, cache_file, fetcher))
+
+
+def iter_metadata(paper_ids, cache_file='metadata_cache.json', fetcher=None):
+    """
+    Yield the metadata of each paper, cached papers first and fetched papers as their batch arrives.
+
+    Missing papers are fetched in id_list batches by the fetcher. Fetched records are appended to a
+    journal next to the cache before they are yielded, instead of rewriting the whole cache for every
+    paper. Records left in the journal by an interrupted run are recovered first, and the journal is
+    compacted into the cache file once every paper has been yielded. Papers arXiv does not know get
+    a default entry; papers whose requests kept failing are skipped so that the next run retries them.
+
+    Args:
+        paper_ids (list): Paper IDs to fetch.
+        cache_file (str): The path to the metadata cache.
+        fetcher (ArxivFetcher): Optional fetcher; defaults to an `AsyncArxivFetcher` on the arXiv API.
+
+    Yields:
+        tuple: (paper ID, metadata dict).
+    """
+    metadata_dict = load_json_cache(cache_file, "metadata")
+    journal = JsonJournal(cache_file + '.journal')
+    recovered = journal.replay()
+    if recovered:
+        print(f"Recovered metadata for {len(recovered)} papers from the journal.")
+        metadata_dict.update(recovered)
 
     missing_ids = [pid for pid in paper_ids if pid not in metadata_dict]
+    for paper_id in paper_ids:
+        if paper_id in metadata_dict:
+            yield paper_id, metadata_dict[paper_id]
+
+    fetched, failed_ids = 0, []
     if missing_ids:
         print(f"Fetching metadata for {len(missing_ids)} missing papers.")
-        with cf.ThreadPoolExecutor(max_workers=10) as executor:
-            futures = {executor.submit(query_arxiv, paper_id): paper_id for paper_id in missing_ids}
-            for future in cf.as_completed(futures):
-                paper_id = futures[future]
-                try:
-                    metadata = future.result()
-                    if metadata:
-                        metadata_dict[paper_id] = metadata
-                        save_json_cache(metadata_dict, cache_file, description="metadata") 
-                    else:
-                        # Store a default entry for papers where metadata could not be fetched
-                        metadata_dict[paper_id] = {"title": "Unknown", "abstract": "Unknown", "subfield": "Unknown"}
-                        save_json_cache(metadata_dict, cache_file, description="metadata")  
-                except Exception as e:
-                    print(f"Error fetching metadata for {paper_id}: {e}")
-                    metadata_dict[paper_id] = {"title": "Unknown", "abstract": "Unknown", "subfield": "Unknown"}
-                    save_json_cache(metadata_dict, cache_file, description="metadata")  # Ensuring error handling also caches the default data
-    return metadata_dict
+        fetcher = fetcher or AsyncArxivFetcher()
+        with journal:
+            for batch in fetcher.iter_batches(missing_ids):
+                # Store a default entry for papers arXiv does not know
+                records = dict(batch.found)
+                records.update((paper_id, {"title": "Unknown", "abstract": "Unknown", "subfield": "Unknown"})
+                               for paper_id in batch.not_found)
+                for paper_id, metadata in records.items():
+                    metadata_dict[paper_id] = metadata
+                    journal.append(paper_id, metadata)
+                fetched += len(records)
+                failed_ids.extend(batch.failed)
+                yield from records.items()
+        if failed_ids:
+            print(f"Could not fetch metadata for {len(failed_ids)} papers; they will be retried on the next run.")
+
+    if (fetched or recovered) and save_json_cache(metadata_dict, cache_file, description="metadata"):
+        journal.discard()
@@ -0,0 +1,189 @@
+import numpy as np
+import pandas as pd
+
+
+class ModuleTree:
+    """
+    A nested partition of the nodes: top-level modules split into submodules, level by level.
+
+    Level 1 holds the top-level modules and every deeper level refines the one above it. Each level
+    is a complete partition of the nodes: a module holding nodes directly (a leaf module) is carried
+    down unchanged to the levels below it, so drilling from coarse to fine modules never loses nodes.
+    Modules are numbered densely per level in depth-first order of the tree; `parents(level)` points
+    every module of a level to the module containing it one level up.
+
+    Codelengths follow Infomap: the total codelength of the map is the index codelength plus the
+    codelength of every module's codebook. A module carried down from a shallower level adds no
+    codelength at the levels below. Trees built from flat or user-supplied partitions have NaN
+    codelengths.
+
+    Args:
+        indices (list): Per level, the int64 dense module index of each node, -1 outside the partition.
+        parents (list): Per level below the first, the index of each module's parent one level up.
+        module_ids (list): Per level, the community ID reported for each dense module index.
+        codelengths (list): Per level, the codelength of each module's codebook.
+        flows (list): Per level, the flow through each module.
+        index_codelength (float): Codelength of the top-level (index) codebook.
+    """
+
+    def __init__(self, indices, parents, module_ids, codelengths, flows, index_codelength=np.nan):
+        self._indices = indices
+        self._parents = [None] + list(parents)
+        self._module_ids = module_ids
+        self._codelengths = codelengths
+        self._flows = flows
+        self.index_codelength = float(index_codelength)
+
+    @classmethod
+    def from_infomap(cls, result, num_nodes):
+        """
+        Build the tree from an Infomap run.
+
+        Top-level modules keep Infomap's module IDs, so `labels(1)` equals `result.modules()`. Nodes
+        Infomap does not report (isolated nodes) get singleton modules after the largest module ID.
+
+        Args:
+            result: Result of `infomap.Infomap.run`.
+            num_nodes (int): Number of node indices.
+
+        Returns:
+            ModuleTree
+        """
+        paths, codelengths, flows, top_ids = [], [], [], []
+        path_index = {}
+        leaf_nodes, leaf_modules = [], []
+        index_codelength = 0.0
+        for node in result.tree():
+            if node.is_leaf:
+                leaf_nodes.append(node.node_id)
+                leaf_modules.append(path_index[node.path[:-1]])
+            elif node.depth:
+                path_index[node.path] = len(paths)
+                paths.append(node.path)
+                codelengths.append(node.codelength)
+                flows.append(node.flow)
+                top_ids.append(node.module_id)
+            else:
+                index_codelength = node.codelength
+        has_leaves = np.zeros(len(paths), dtype=bool)
+        has_leaves[leaf_modules] = True
+
+        # Dense module index at every level of each module holding leaves, carried down below its own depth
+        num_levels = max((len(path) for path in paths), default=1)
+        leaf_indices, parents, module_ids, level_codelengths, level_flows = [], [], [], [], []
+        previous = None
+        for level in range(1, num_levels + 1):
+            keys = {}
+            for module, path in enumerate(paths):
+                if len(path) == level or (len(path) < level and has_leaves[module]):
+                    keys[path] = len(keys)
+            modules = [path_index[key] for key in keys]
+            leaf_indices.append(np.array([keys[path[:level]] if has_leaves[module] else -1
+                                          for module, path in enumerate(paths)], dtype=np.int64))
+            if previous is not None:
+                parents.append(np.array([previous[key[:level - 1]] for key in keys], dtype=np.int64))
+            module_ids.append(np.array([top_ids[module] for module in modules], dtype=np.int64) if level == 1
+                              else np.arange(len(keys), dtype=np.int64))
+            level_codelengths.append(np.array([codelengths[module] if len(paths[module]) == level else 0.0
+                                               for module in modules]))
+            level_flows.append(np.array([flows[module] for module in modules]))
+            previous = keys
+
+        indices = []
+        leaf_nodes = np.array(leaf_nodes, dtype=np.int64)
+        leaf_modules = np.array(leaf_modules, dtype=np.int64)
+        missing = np.ones(num_nodes, dtype=bool)
+        missing[leaf_nodes] = False
+        missing = np.flatnonzero(missing)
+        for level in range(num_levels):
+            index = np.empty(num_nodes, dtype=np.int64)
+            index[leaf_nodes] = leaf_indices[level][leaf_modules]
+            num_modules = len(module_ids[level])
+            index[missing] = num_modules + np.arange(len(missing))
+            indices.append(index)
+            if level:
+                parents[level - 1] = np.concatenate([parents[level - 1],
+                                                     len(module_ids[level - 1]) - len(missing) + np.arange(len(missing))])
+            first_id = module_ids[level].max(initial=0) + 1 if level == 0 else num_modules
+            module_ids[level] = np.concatenate([module_ids[level], first_id + np.arange(len(missing))])
+            level_codelengths[level] = np.concatenate([level_codelengths[level], np.zeros(len(missing))])
+            level_flows[level] = np.concatenate([level_flows[level], np.zeros(len(missing))])
+        return cls(indices, parents, module_ids, level_codelengths, level_flows, index_codelength)
+
+    @classmethod
+    def from_labels(cls, *levels):
+        """
+        Build a tree from nested partitions, coarsest first.
+
+        Args:
+            *levels (np.ndarray): Community label of each node index per level, negative outside the
+                partition. Each level must refine the previous one.
+
+        Returns:
+            ModuleTree: Modules numbered in order of first appearance, with NaN codelengths.
+        """
+        indices, parents, module_ids = [], [], []
+        for level, labels in enumerate(levels):
+            labels = np.asarray(labels)
+            index = np.full(len(labels), -1, dtype=np.int64)
+            inside = labels >= 0
+            index[inside], ids = pd.factorize(labels[inside])
+            if level:
+                parent = np.full(len(ids), -1, dtype=np.int64)
+                parent[index[inside]] = indices[-1][inside]
+                if not np.array_equal(inside, indices[-1] >= 0) or np.any(parent[index[inside]] != indices[-1][inside]):
+                    raise ValueError(f"Level {level + 1} does not refine level {level}.")
+                parents.append(parent)
+            indices.append(index)
+            module_ids.append(np.asarray(ids, dtype=np.int64))
+        return cls(indices, parents, module_ids, [np.full(len(ids), np.nan) for ids in module_ids],
+                   [np.full(len(ids), np.nan) for ids in module_ids])
+
+    @property
+    def num_levels(self):
+        return len(self._indices)
+
+    @property
+    def codelength(self):
+        """ Total codelength of the map: the index codelength plus every module's codelength. """
+        return self.index_codelength + sum(float(codelengths.sum()) for codelengths in self._codelengths)
+
+    def level_codelengths(self):
+        """ Return the index codelength followed by the summed module codelength of every level. """
+        return [self.index_codelength] + [float(codelengths.sum()) for codelengths in self._codelengths]
+
+    def num_modules(self, level):
+        return len(self._module_ids[self._check(level)])
+
+    def indices(self, level):
+        """ Return the dense module index of each node at `level`, -1 for nodes outside the partition. """
+        return self._indices[self._check(level)]
+
+    def labels(self, level=1):
+        """ Return the community ID of each node at `level`, -1 for nodes outside the partition. """
+        level = self._check(level)
+        index = self._indices[level]
+        return np.where(index >= 0, self._module_ids[level][np.maximum(index, 0)], -1)
+
+    def module_ids(self, level):
+        """ Return the community ID of each module at `level`, by dense module index. """
+        return self._module_ids[self._check(level)]
+
+    def parents(self, level):
+        """ Return the dense index at `level - 1` of the parent of each module at `level` (> 1). """
+        if self._check(level) == 0:
+            raise ValueError("Top-level modules have no parent.")
+        return self._parents[level - 1]
+
+    def codelengths(self, level):
+        """ Return the codelength of each module's codebook at `level`. """
+        return self._codelengths[self._check(level)]
+
+    def flows(self, level):
+        """ Return the flow through each module at `level`. """
+        return self._flows[self._check(level)]
+
+    def _check(self, level):
+        if not 1 <= level <= self.num_levels:
+            raise ValueError(f"Level {level} is outside the tree's levels 1 to {self.num_levels}.")
+        return level - 1
@@ -0,0 +1,354 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from scripts import data_access as da
+from scripts import data_loader as dl
+from scripts import id_interner as ii
+from scripts import instrumentation as ins
+from scripts.quotient_graph import QuotientGraph
+
+# Default memory ceiling of the out-of-core loader and the streaming statistics
+DEFAULT_MEMORY_LIMIT = 256 * 2 ** 20
+
+# Rough peak bytes per edge while a chunk is parsed into Python strings by pandas
+PARSE_BYTES_PER_EDGE = 400
+
+# Rough bytes per ID held in the in-memory part of a SpillingInterner
+INTERNED_BYTES_PER_ID = 200
+
+# Bytes per edge of the sort keys in memory during the merge
+SORT_BYTES_PER_EDGE = 16
+
+# Number of spilled runs of a SpillingInterner that triggers their compaction into one
+MAX_INTERNER_RUNS = 8
+
+
+class SpillingInterner:
+    """
+    Maps paper IDs to dense indices in order of first appearance, keeping at most `max_ids` IDs in memory.
+
+    New IDs are looked up in memory first and then in the runs spilled to disk. When the in-memory
+    table is full, it is sorted and spilled as a run of (ID, index) pairs, and every `max_runs` runs
+    are merged into one, so lookups search a bounded number of memory-mapped sorted runs. The ID of
+    each index is appended to disk as it is interned.
+
+    Args:
+        work_dir (str): Directory for the spilled runs and the ID table.
+        max_ids (int): Number of IDs kept in memory before spilling.
+        max_runs (int): Number of runs merged into one at a time.
+    """
+
+    def __init__(self, work_dir, max_ids, max_runs=MAX_INTERNER_RUNS):
+        self.work_dir = work_dir
+        self.max_ids = max(max_ids, 1)
+        self.max_runs = max(max_runs, 2)
+        self._memory_ids = pd.Index([], dtype=object)
+        self._runs = []
+        self._id_blocks = []
+        self._spills = 0
+        self.num_ids = 0
+
+    def intern(self, paper_ids):
+        """
+        Return the index of each paper ID, interning new IDs after the known ones in order of first appearance.
+
+        Args:
+            paper_ids (np.ndarray): Paper IDs as strings.
+
+        Returns:
+            np.ndarray: int64 index of each ID.
+        """
+        codes, uniques = pd.factorize(np.asarray(paper_ids, dtype=object))
+        uniques = np.asarray(uniques, dtype=object)
+        indices = self._memory_ids.get_indexer(uniques).astype(np.int64)
+        found = indices >= 0
+        indices[found] += self.num_ids - len(self._memory_ids)
+        for run_ids, run_indices in self._runs:
+            missing = np.flatnonzero(~found)
+            if not len(missing):
+                break
+            queries = np.asarray(uniques[missing].tolist(), dtype=str)
+            positions = np.minimum(np.searchsorted(run_ids, queries), len(run_ids) - 1)
+            hits = run_ids[positions] == queries
+            indices[missing[hits]] = run_indices[positions[hits]]
+            found[missing[hits]] = True
+
+        new = np.flatnonzero(~found)
+        indices[new] = self.num_ids + np.arange(len(new))
+        self._add(uniques[new])
+        return indices[codes]
+
+    def ids(self):
+        """ Return the memory-mapped ID of each index, written once all IDs are interned. """
+        path = os.path.join(self.work_dir, 'ids.npy')
+        width = max([block.dtype.itemsize // 4 for block in self._id_blocks], default=1)
+        table = np.lib.format.open_memmap(path, mode='w+', dtype=f'<U{width}', shape=(self.num_ids,))
+        start = 0
+        for block in self._id_blocks:
+            table[start:start + len(block)] = block
+            start += len(block)
+        table.flush()
+        return np.load(path, mmap_mode='r')
+
+    def _add(self, new_ids):
+        if not len(new_ids):
+            return
+        block = np.asarray(new_ids.tolist(), dtype=str)
+        path = os.path.join(self.work_dir, f'ids-{len(self._id_blocks)}.npy')
+        np.save(path, block)
+        self._id_blocks.append(np.load(path, mmap_mode='r'))
+        self._memory_ids = self._memory_ids.append(pd.Index(new_ids, dtype=object))
+        self.num_ids += len(new_ids)
+        if len(self._memory_ids) >= self.max_ids:
+            self._spill()
+
+    def _spill(self):
+        ids = np.asarray(self._memory_ids.tolist(), dtype=str)
+        order = np.argsort(ids, kind='stable')
+        indices = self.num_ids - len(ids) + order
+        self._runs.append(self._save_run(ids[order], indices.astype(np.int64)))
+        self._memory_ids = pd.Index([], dtype=object)
+        if len(self._runs) >= self.max_runs:
+            width = max(run_ids.dtype.itemsize // 4 for run_ids, _ in self._runs)
+            path = os.path.join(self.work_dir, f'run-{self._spills}')
+            self._spills += 1
+            parts = []
+
+            def emit(keys, values):
+                part = f'{path}-part-{len(parts)}'
+                np.save(f'{part}-ids.npy', keys.astype(f'<U{width}'))
+                np.save(f'{part}-indices.npy', values)
+                parts.append(part)
+
+            merge_sorted_runs(self._runs, emit, block=self.max_ids)
+            self._runs = [(_concatenate_saved([f'{part}-ids.npy' for part in parts], f'{path}-ids.npy', f'<U{width}'),
+                           _concatenate_saved([f'{part}-indices.npy' for part in parts], f'{path}-indices.npy',
+                                              np.int64))]
+
+    def _save_run(self, ids, indices):
+        path = os.path.join(self.work_dir, f'run-{self._spills}')
+        self._spills += 1
+        np.save(f'{path}-ids.npy', ids)
+        return np.load(f'{path}-ids.npy', mmap_mode='r'), self._save_values(indices, f'{path}-indices.npy')
+
+    @staticmethod
+    def _save_values(values, path):
+        np.save(path, values)
+        return np.load(path, mmap_mode='r')
+
+
+def merge_sorted_runs(runs, emit, block):
+    """
+    K-way merge of sorted runs in bounded memory.
+
+    Each step takes up to `block` entries from every run, emits in sorted order all entries up to the
+    smallest last key taken from a run that is not yet exhausted, and keeps the rest for the next
+    step, so memory stays within about `block` entries per run.
+
+    Args:
+        runs (list): (keys, values) pairs of sorted, usually memory-mapped, arrays of equal length.
+        emit (callable): Called with each sorted block of keys and the matching values.
+        block (int): Number of entries read from each run per step.
+    """
+    positions = [0] * len(runs)
+    while True:
+        live = [run for run, position in enumerate(positions) if position < len(runs[run][0])]
+        if not live:
+            return
+        ends = {run: min(positions[run] + block, len(runs[run][0])) for run in live}
+        bounds = [runs[run][0][ends[run] - 1] for run in live if ends[run] < len(runs[run][0])]
+        bound = min(bounds) if bounds else None
+        keys, values = [], []
+        for run in live:
+            run_keys = runs[run][0][positions[run]:ends[run]]
+            take = len(run_keys) if bound is None else int(np.searchsorted(run_keys, bound, side='right'))
+            keys.append(np.asarray(run_keys[:take]))
+            values.append(np.asarray(runs[run][1][positions[run]:positions[run] + take]))
+            positions[run] += take
+        keys, values = np.concatenate(keys), np.concatenate(values)
+        order = np.argsort(keys, kind='stable')
+        emit(keys[order], values[order])
+
+
+def _concatenate_saved(paths, path, dtype):
+    """ Concatenate saved 1-D arrays into one memory-mapped .npy file, one array in memory at a time. """
+    arrays = [np.load(part, mmap_mode='r') for part in paths]
+    table = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(sum(len(array) for array in arrays),))
+    start = 0
+    for array in arrays:
+        table[start:start + len(array)] = array
+        start += len(array)
+    table.flush()
+    return np.load(path, mmap_mode='r')
+
+
+@ins.instrumented(items=lambda graph: {'nodes': graph.number_of_nodes(), 'edges': graph.number_of_edges()})
+def load_citation_graph_out_of_core(filepath, snapshot_dir, dates_path=None, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    Loads a citation network larger than memory into a memory-mapped CSR graph snapshot.
+
+    The edge file is read in chunks sized to `memory_limit`. Paper IDs are interned by a
+    SpillingInterner in order of first appearance, as `load_citation_graph` does, and each chunk's
+    edges become a sorted run of deduplicated (source, target) keys on disk. An external merge sort
+    of the runs then writes the CSR arrays block by block into a graph snapshot (see
+    `data_access.load_graph_snapshot`), which later runs reuse while the source files are unchanged.
+    Apart from the chunk buffers, memory holds one int64 row count per node. Successors are stored
+    in increasing node index order rather than in order of appearance.
+
+    Args:
+        filepath (str): Path to the citation network file.
+        snapshot_dir (str): Directory of the graph snapshot.
+        dates_path (str): Optional path to the paper dates file.
+        memory_limit (int): Memory ceiling in bytes for the chunk, interner and merge buffers.
+
+    Returns:
+        CitationGraph: The graph, memory-mapped from the snapshot.
+    """
+    source_files = [filepath] + ([dates_path] if dates_path else [])
+    graph = da.load_graph_snapshot(snapshot_dir, source_files)
+    if graph is not None:
+        return graph
+
+    parent = os.path.dirname(os.path.abspath(snapshot_dir))
+    work_dir = tempfile.mkdtemp(dir=parent, prefix='.out-of-core-')
+    try:
+        with ins.stage('intern_and_sort') as record:
+            interner = SpillingInterner(work_dir, memory_limit // INTERNED_BYTES_PER_ID)
+            runs = []
+            for from_papers, to_papers in dl.iter_edge_chunks(filepath, max(memory_limit // PARSE_BYTES_PER_EDGE, 1)):
+                # IDs are interned edge by edge, citing paper first, in the node order of load_citation_graph
+                codes = interner.intern(np.column_stack([from_papers, to_papers]).ravel())
+                keys = np.unique((codes[0::2] << 32) | codes[1::2])
+                path = os.path.join(work_dir, f'edges-{len(runs)}.npy')
+                np.save(path, keys)
+                runs.append(np.load(path, mmap_mode='r'))
+            node_ids = interner.ids()
+            record.count(nodes=len(node_ids), runs=len(runs))
+
+        def write_arrays(snapshot):
+            with ins.stage('merge') as merge:
+                np.save(os.path.join(snapshot, 'node_ids.npy'), node_ids)
+                num_edges = _write_csr(runs, len(node_ids), snapshot, work_dir, memory_limit)
+                merge.count(edges=num_edges)
+            if dates_path:
+                dates = dl.load_paper_dates(dates_path)
+                table = np.lib.format.open_memmap(os.path.join(snapshot, 'dates.npy'), mode='w+',
+                                                  dtype='datetime64[D]', shape=(len(node_ids),))
+                step = max(memory_limit // INTERNED_BYTES_PER_ID, 1)
+                for start in range(0, len(node_ids), step):
+                    block = ii.true_ids(node_ids[start:start + step])
+                    table[start:start + step] = dates.reindex(block).to_numpy(dtype='datetime64[D]')
+                table.flush()
+
+        da.write_graph_snapshot(snapshot_dir, source_files, True, write_arrays)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return da.load_graph_snapshot(snapshot_dir, source_files)
+
+
+def _write_csr(runs, num_nodes, snapshot, work_dir, memory_limit):
+    """ Merge sorted edge key runs into the snapshot's CSR arrays, dropping duplicates across runs. """
+    row_counts = np.zeros(num_nodes, dtype=np.int64)
+    indices_path = os.path.join(work_dir, 'indices.bin')
+    last_key = [-1]
+    with open(indices_path, 'wb') as indices_file:
+        def emit(keys, _):
+            keep = np.r_[keys[:1] != last_key[0], keys[1:] != keys[:-1]] if len(keys) else np.zeros(0, dtype=bool)
+            keys = keys[keep]
+            if not len(keys):
+                return
+            last_key[0] = keys[-1]
+            rows, counts = np.unique(keys >> 32, return_counts=True)
+            row_counts[rows] += counts
+            (keys & 0xFFFFFFFF).astype(np.int32).tofile(indices_file)
+
+        block = max(memory_limit // (SORT_BYTES_PER_EDGE * max(len(runs), 1)), 1)
+        merge_sorted_runs([(run, run) for run in runs], emit, block)
+
+    indptr = np.lib.format.open_memmap(os.path.join(snapshot, 'indptr.npy'), mode='w+', dtype=np.int64,
+                                       shape=(num_nodes + 1,))
+    indptr[0] = 0
+    np.cumsum(row_counts, out=indptr[1:])
+    indptr.flush()
+    num_edges = int(indptr[-1])
+    raw = np.memmap(indices_path, dtype=np.int32, mode='r', shape=(num_edges,)) if num_edges else np.empty(0, np.int32)
+    indices = np.lib.format.open_memmap(os.path.join(snapshot, 'indices.npy'), mode='w+', dtype=np.int32,
+                                        shape=(num_edges,))
+    step = max(memory_limit // 8, 1)
+    for start in range(0, num_edges, step):
+        indices[start:start + step] = raw[start:start + step]
+    indices.flush()
+    return num_edges
+
+
+def iter_row_blocks(graph, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    Iterate over a CSR graph in blocks of consecutive rows holding about `memory_limit` bytes of edges.
+
+    Yields:
+        tuple: (first row, row offsets of the block starting at 0, successor indices of the block).
+    """
+    num_nodes = graph.number_of_nodes()
+    edges_per_block = max(memory_limit // SORT_BYTES_PER_EDGE, 1)
+    start = 0
+    while start < num_nodes:
+        first_edge = graph.indptr[start]
+        stop = int(np.searchsorted(graph.indptr, first_edge + edges_per_block, side='right')) - 1
+        stop = min(max(stop, start + 1), num_nodes)
+        indptr = np.asarray(graph.indptr[start:stop + 1]) - first_edge
+        yield start, indptr, np.asarray(graph.indices[first_edge:graph.indptr[stop]])
+        start = stop
+
+
+@ins.instrumented(items=lambda stats: {'nodes': stats['nodes'], 'edges': stats['edges']})
+def streaming_graph_stats(graph, labels=None, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    Degree, density and community statistics computed over the CSR graph in row blocks.
+
+    Only one block of edges is in memory at a time, besides per-node degree arrays and, with
+    `labels`, the sparse quotient graph between communities, so the statistics run over
+    memory-mapped graphs larger than memory.
+
+    Args:
+        graph (CitationGraph): A directed graph, usually memory-mapped from a snapshot.
+        labels (np.ndarray): Optional community label of each node index.
+        memory_limit (int): Bytes of edges read per block.
+
+    Returns:
+        dict: 'nodes', 'edges', 'density', 'average_degree', 'max_in_degree', 'max_out_degree' and
+        'isolated_nodes'; with `labels` also 'communities', 'largest_community', 'internal_edge_fraction'
+        and 'modularity'.
+    """
+    num_nodes = graph.number_of_nodes()
+    in_degree = np.zeros(num_nodes, dtype=np.int64)
+    out_degree = np.zeros(num_nodes, dtype=np.int64)
+    quotient = None
+    if labels is not None:
+        community_ids, modules = np.unique(np.asarray(labels), return_inverse=True)
+        quotient = QuotientGraph.from_edges([], [], len(community_ids), graph.directed, community_ids)
+    for start, indptr, indices in iter_row_blocks(graph, memory_limit):
+        lengths = np.diff(indptr)
+        out_degree[start:start + len(lengths)] = lengths
+        np.add.at(in_degree, indices, 1)
+        if quotient is not None:
+            sources = np.repeat(modules[start:start + len(lengths)], lengths)
+            quotient = quotient.add_edges(sources, modules[indices])
+    num_edges = int(out_degree.sum())
+    degree = in_degree + out_degree
+    stats = {
+        'nodes': num_nodes,
+        'edges': num_edges,
+        'density': num_edges / (num_nodes * (num_nodes - 1)) if num_nodes > 1 else 0,
+        'average_degree': float(degree.mean()) if num_nodes else 0.0,
+        'max_in_degree': int(in_degree.max(initial=0)),
+        'max_out_degree': int(out_degree.max(initial=0)),
+        'isolated_nodes': int(np.count_nonzero(degree == 0))
+    }
+    if quotient is not None:
+        stats['communities'] = quotient.num_modules
+        stats['largest_community'] = int(np.bincount(modules).max(initial=0)) if len(modules) else 0
+        stats['internal_edge_fraction'] = float(quotient.internal_edges().sum() / num_edges) if num_edges else 0.0
+        stats['modularity'] = quotient.modularity()
+    return stats
@@ -0,0 +1,145 @@
+import concurrent.futures as cf
+import numpy as np
+from multiprocessing import shared_memory
+from scripts.citation_graph import CitationGraph
+from scripts import centrality as ce
+from scripts import graph_metrics as gm
+
+# Graph attached by each worker process in `_attach_graph`, and its clustering operands once built
+_worker_graph = None
+_worker_operands = None
+_worker_segments = []
+
+
+class SharedGraphPool:
+    """
+    Process pool whose workers share one copy of a CSR graph through shared memory.
+
+    The CSR arrays are copied once into shared memory blocks; every worker attaches to them in its
+    initializer instead of receiving a pickled graph. Work is split into more chunks than workers so
+    uneven chunks still balance, and partial results are reduced in the parent. With `workers=1`
+    everything runs in the calling process.
+
+    Usage:
+        with SharedGraphPool(graph, workers=8) as pool:
+            total, total_sq = pool.accumulate_dependencies(sources)
+            coefficients = pool.clustering()
+            future = pool.submit(function, *args)  # function(graph, *args) on a worker
+    """
+
+    def __init__(self, graph, workers=1, chunks_per_worker=8):
+        self.graph = graph
+        self.workers = max(1, int(workers or 1))
+        self.chunks_per_worker = chunks_per_worker
+        self._segments = []
+        self._executor = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            specs = {}
+            for name in ('indptr', 'indices'):
+                array = np.ascontiguousarray(getattr(self.graph, name))
+                segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[:] = array
+                self._segments.append(segment)
+                specs[name] = (segment.name, array.shape, array.dtype.str)
+            self._executor = cf.ProcessPoolExecutor(max_workers=self.workers, initializer=_attach_graph,
+                                                    initargs=(specs, self.graph.directed))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
+
+    def _chunks(self, items):
+        num_chunks = min(len(items), self.workers * self.chunks_per_worker)
+        return [chunk for chunk in np.array_split(np.asarray(items), max(num_chunks, 1)) if len(chunk)]
+
+    def accumulate_dependencies(self, sources):
+        """
+        Sum Brandes dependencies over source nodes, split across the workers.
+
+        Args:
+            sources (np.ndarray): Source node indices.
+
+        Returns:
+            tuple: (sum of delta_s, sum of delta_s ** 2) arrays over nodes.
+        """
+        if self._executor is None:
+            return ce.accumulate_dependencies(self.graph.indptr, self.graph.indices, sources)
+        num_nodes = self.graph.number_of_nodes()
+        total = np.zeros(num_nodes)
+        total_sq = np.zeros(num_nodes)
+        for chunk_total, chunk_sq in self._executor.map(_accumulate_chunk, self._chunks(sources)):
+            total += chunk_total
+            total_sq += chunk_sq
+        return total, total_sq
+
+    def clustering(self, nodes=None):
+        """
+        Local clustering coefficients (see `graph_metrics.clustering`), split across the workers.
+
+        Args:
+            nodes (np.ndarray): Optional node indices; defaults to every node.
+
+        Returns:
+            np.ndarray: Clustering coefficient of each requested node.
+        """
+        if nodes is None:
+            nodes = np.arange(self.graph.number_of_nodes())
+        if self._executor is None or not len(nodes):
+            return gm.clustering(self.graph, nodes=nodes)
+        return np.concatenate(list(self._executor.map(_clustering_chunk, self._chunks(nodes))))
+
+    def submit(self, function, *args):
+        """
+        Schedule `function(graph, *args)` on a worker that has the shared graph attached.
+
+        Args:
+            function (callable): Module-level function taking the graph as its first argument.
+            *args: Further arguments, pickled to the worker.
+
+        Returns:
+            concurrent.futures.Future: The pending result; with `workers=1` it has already been computed.
+        """
+        if self._executor is not None:
+            return self._executor.submit(_call_with_graph, function, *args)
+        future = cf.Future()
+        try:
+            future.set_result(function(self.graph, *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def _attach_graph(specs, directed):
+    # Pool workers share the parent's resource tracker, so attaching here does not hand ownership of
+    # the blocks to the worker; the parent unlinks them when the pool closes.
+    global _worker_graph
+    arrays = {}
+    for name, (segment_name, shape, dtype) in specs.items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        _worker_segments.append(segment)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+    num_nodes = len(arrays['indptr']) - 1
+    _worker_graph = CitationGraph(np.arange(num_nodes), arrays['indptr'], arrays['indices'], directed)
+
+
+def _accumulate_chunk(sources):
+    return ce.accumulate_dependencies(_worker_graph.indptr, _worker_graph.indices, sources)
+
+
+def _call_with_graph(function, *args):
+    return function(_worker_graph, *args)
+
+
+def _clustering_chunk(nodes):
+    global _worker_operands
+    if _worker_operands is None:
+        _worker_operands = gm.clustering_operands(_worker_graph)
+    return gm.clustering(_worker_graph, nodes=nodes, operands=_worker_operands)
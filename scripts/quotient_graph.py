@@ -0,0 +1,180 @@
+import numpy as np
+from scipy import sparse
+from scripts import instrumentation as ins
+
+
+class QuotientGraph:
+    """
+    The citation graph collapsed onto a partition: a sparse matrix of citation counts between communities.
+
+    Entry (c, d) counts the citations from papers of community c to papers of community d, and the
+    diagonal counts the citations inside each community. Undirected graphs store each pair of
+    communities once, in the upper triangle, and `matrix` gives the symmetric view. Citations with an
+    end outside the partition are left out.
+
+    Per-community cut sizes, volumes, conductance and modularity contributions follow from the matrix
+    alone, and coarser partitions are obtained by summing its blocks (`coarsen`), so hierarchy levels,
+    layouts and incremental updates never go back to the edges.
+
+    Args:
+        counts (sparse.spmatrix): Square matrix of citation counts between communities.
+        directed (bool): Whether the citations are directed.
+        community_ids (np.ndarray): Community ID of each row; defaults to the row numbers.
+    """
+
+    def __init__(self, counts, directed=True, community_ids=None):
+        counts = sparse.csr_matrix(counts, dtype=np.int64)
+        if not directed:
+            counts = sparse.triu(counts) + sparse.tril(counts, -1).T
+        self.counts = sparse.csr_matrix(counts)
+        self.counts.eliminate_zeros()
+        self.directed = directed
+        self.community_ids = np.arange(counts.shape[0]) if community_ids is None else np.asarray(community_ids)
+
+    @classmethod
+    @ins.instrumented(name='quotient_graph', items=lambda quotient: {'communities': quotient.num_modules,
+                                                                      'pairs': quotient.counts.nnz})
+    def from_partition(cls, graph, labels):
+        """
+        Collapse a graph onto a partition in one vectorized pass over its edges.
+
+        Args:
+            graph (CitationGraph): The citation graph.
+            labels (np.ndarray): Community label of each node index, negative outside the partition.
+
+        Returns:
+            QuotientGraph: Rows and columns follow the sorted community labels.
+        """
+        labels = np.asarray(labels)
+        inside = labels >= 0
+        community_ids, modules = np.unique(labels[inside], return_inverse=True)
+        index = np.full(len(labels), -1, dtype=np.int64)
+        index[inside] = modules
+        sources, targets = graph.edge_arrays()
+        return cls.from_edges(index[sources], index[targets], len(community_ids), graph.directed, community_ids)
+
+    @classmethod
+    def from_edges(cls, source_modules, target_modules, num_modules, directed=True, community_ids=None):
+        """ Count edges given by the dense module index of their ends; edges with a negative end are left out. """
+        source_modules, target_modules = np.asarray(source_modules), np.asarray(target_modules)
+        between = (source_modules >= 0) & (target_modules >= 0)
+        counts = sparse.coo_matrix((np.ones(np.count_nonzero(between), dtype=np.int64),
+                                    (source_modules[between], target_modules[between])),
+                                   shape=(num_modules, num_modules))
+        return cls(counts, directed, community_ids)
+
+    @property
+    def num_modules(self):
+        return self.counts.shape[0]
+
+    @property
+    def matrix(self):
+        """ Citation counts between communities; symmetric for undirected graphs. """
+        if self.directed:
+            return self.counts
+        return (self.counts + sparse.triu(self.counts, 1).T).tocsr()
+
+    def number_of_edges(self):
+        return int(self.counts.sum())
+
+    def add_edges(self, source_modules, target_modules, weights=1):
+        """
+        Return the quotient graph with edges added, or removed with negative weights.
+
+        Args:
+            source_modules (np.ndarray): Dense module index of the source of each edge.
+            target_modules (np.ndarray): Dense module index of the target of each edge.
+            weights (int or np.ndarray): Count added per edge.
+
+        Returns:
+            QuotientGraph
+        """
+        weights = np.broadcast_to(weights, np.shape(source_modules))
+        delta = sparse.coo_matrix((weights, (source_modules, target_modules)), shape=self.counts.shape)
+        return QuotientGraph(self.counts + delta, self.directed, self.community_ids)
+
+    def resize(self, num_modules):
+        """ Return the quotient graph with empty communities appended up to `num_modules`, numbered on from the last row. """
+        counts = sparse.csr_matrix(self.counts)
+        counts.resize((num_modules, num_modules))
+        community_ids = np.concatenate([self.community_ids, np.arange(self.num_modules, num_modules)])
+        return QuotientGraph(counts, self.directed, community_ids)
+
+    def coarsen(self, parents, num_parents=None, community_ids=None):
+        """
+        Merge communities into coarser ones; the citations between merged communities become internal.
+
+        Args:
+            parents (np.ndarray): Dense index of the coarse community containing each community.
+            num_parents (int): Number of coarse communities; defaults to the largest parent index + 1.
+            community_ids (np.ndarray): Community ID of each coarse community.
+
+        Returns:
+            QuotientGraph
+        """
+        parents = np.asarray(parents)
+        num_parents = parents.max(initial=-1) + 1 if num_parents is None else num_parents
+        grouping = sparse.csr_matrix((np.ones(len(parents), dtype=np.int64), (parents, np.arange(len(parents)))),
+                                     shape=(num_parents, len(parents)))
+        return QuotientGraph(grouping @ self.counts @ grouping.T, self.directed, community_ids)
+
+    def internal_edges(self):
+        """ Number of citations inside each community. """
+        return self.counts.diagonal()
+
+    def out_strengths(self):
+        """ Citations made by each community's papers; the sum of its members' degrees when undirected. """
+        if self.directed:
+            return np.asarray(self.counts.sum(axis=1)).ravel()
+        return self.volumes()
+
+    def in_strengths(self):
+        """ Citations received by each community's papers; the sum of its members' degrees when undirected. """
+        if self.directed:
+            return np.asarray(self.counts.sum(axis=0)).ravel()
+        return self.volumes()
+
+    def volumes(self):
+        """ Volume of each community as in `nx.volume`: the summed out-degree (degree if undirected) of its members. """
+        if self.directed:
+            return self.out_strengths()
+        return np.asarray(self.counts.sum(axis=1)).ravel() + np.asarray(self.counts.sum(axis=0)).ravel()
+
+    def cut_sizes(self):
+        """ Number of citations between each community and the rest of the partition, in either direction. """
+        if self.directed:
+            return self.out_strengths() + self.in_strengths() - 2 * self.internal_edges()
+        return self.volumes() - 2 * self.internal_edges()
+
+    def conductance(self):
+        """ Cut size over the smaller of the volumes on either side of the cut, as in `nx.conductance`; 0 for empty sides. """
+        volumes = self.volumes()
+        smaller = np.minimum(volumes, volumes.sum() - volumes)
+        return np.divide(self.cut_sizes(), smaller, out=np.zeros(len(volumes)), where=smaller > 0)
+
+    def modularity_contributions(self, resolution=1.0):
+        """ Each community's term of the modularity, which sum to `graph_metrics.modularity` of the partition. """
+        num_edges = self.number_of_edges()
+        if not num_edges:
+            return np.zeros(self.num_modules)
+        if self.directed:
+            expected = self.out_strengths() * self.in_strengths() / num_edges ** 2
+        else:
+            expected = (self.volumes() / (2 * num_edges)) ** 2
+        return self.internal_edges() / num_edges - resolution * expected
+
+    def modularity(self, resolution=1.0):
+        return float(self.modularity_contributions(resolution).sum())
+
+    def module_stats(self):
+        """
+        Return the per-community statistics of the quotient graph.
+
+        Returns:
+            dict: Community ID -> 'internal_edges', 'cut_size', 'conductance' and 'modularity_contribution'.
+        """
+        columns = zip(self.community_ids.tolist(), self.internal_edges().tolist(), self.cut_sizes().tolist(),
+                      self.conductance().tolist(), self.modularity_contributions().tolist())
+        return {community: {'internal_edges': internal, 'cut_size': cut, 'conductance': conductance,
+                            'modularity_contribution': contribution}
+                for community, internal, cut, conductance, contribution in columns}
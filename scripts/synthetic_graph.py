@@ -0,0 +1,138 @@
+import collections as col
+import numpy as np
+import pandas as pd
+
+# Edges per paper and date range of cit-HepPh (421578 edges between 34546 papers)
+HEPPH_EDGES_PER_NODE = 421578 / 34546
+HEPPH_START, HEPPH_END = np.datetime64('1992-02-01'), np.datetime64('2002-04-30')
+
+FILLER_WORDS = ("we", "study", "the", "of", "in", "and", "a", "model", "results", "show", "that", "this",
+                "paper", "calculation", "analysis", "data", "effects", "new", "present", "contributions",
+                "order", "corrections", "energy", "scale", "limit", "parameters", "mass", "for", "with", "are")
+
+# Rounds of redrawing duplicate references
+_REDRAWS = 8
+
+SyntheticCitations = col.namedtuple('SyntheticCitations', ['paper_ids', 'dates', 'sources', 'targets'])
+
+
+def synthetic_citations(num_edges, seed=0, edges_per_node=HEPPH_EDGES_PER_NODE, fitness_exponent=1.5,
+                        recency=3.0, start=HEPPH_START, end=HEPPH_END):
+    """
+    Generate a seeded citation DAG that mimics the shape of cit-HepPh.
+
+    Papers get submission dates in increasing order, with submissions growing over time, and only
+    cite earlier papers. Reference counts are log-normal. Each reference looks back over a window of
+    earlier papers that is usually recent (`recency` > 1 favours short windows) and picks a paper in
+    it with probability proportional to a Pareto-distributed fitness, which gives the heavy-tailed
+    in-degree of real citation networks. Paper IDs follow arXiv's old 'YYMMNNN' scheme, widened when
+    a month holds more than 999 papers. Duplicate references are redrawn, so the graph holds `num_edges`
+    edges unless a few papers cite almost all of their predecessors.
+
+    Args:
+        num_edges (int): Number of references to draw.
+        seed (int): Seed of the random generator.
+        edges_per_node (float): Mean number of references per paper.
+        fitness_exponent (float): Pareto shape of the fitness; smaller values give heavier tails.
+        recency (float): Skew of the look-back window towards recent papers.
+        start, end (np.datetime64): Date range of the submissions.
+
+    Returns:
+        SyntheticCitations: Paper IDs (int64) and dates (datetime64[D]) of the papers in date order,
+        and int64 (source, target) node index arrays grouped by citing paper.
+    """
+    rng = np.random.default_rng(seed)
+    num_nodes = max(2, int(np.ceil(num_edges / edges_per_node)))
+
+    # Submission dates, growing over time, and IDs numbered within each month
+    span = (end - start).astype(np.int64)
+    dates = start + np.sort(rng.random(num_nodes) ** 0.8 * span).astype('timedelta64[D]')
+    months = dates.astype('datetime64[M]')
+    month_start = np.searchsorted(months, months)
+    sequence = np.arange(num_nodes) - month_start + 1
+    width = max(3, len(str(sequence.max())))
+    years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    yymm = (years % 100) * 100 + (months.astype(np.int64) % 12 + 1)
+    paper_ids = yymm * 10 ** width + sequence
+
+    # Reference counts; the first paper cannot cite anything and no paper cites more than its predecessors
+    weights = rng.lognormal(0.0, 1.0, num_nodes)
+    weights[0] = 0.0
+    references = np.minimum(rng.multinomial(num_edges, weights / weights.sum()), np.arange(num_nodes))
+
+    sources = np.repeat(np.arange(num_nodes), references)
+    fitness = rng.pareto(fitness_exponent, num_nodes) + 1.0
+    cumulative = np.concatenate([[0.0], np.cumsum(fitness)])
+    edges = np.empty(0, dtype=np.int64)
+    # Duplicate references are redrawn over all predecessors; papers citing nearly all of them may keep some
+    for attempt in range(_REDRAWS):
+        targets = _draw_targets(rng, sources, cumulative, recency if attempt == 0 else 1.0)
+        merged = np.concatenate([edges, sources * num_nodes + targets])
+        edges, first = np.unique(merged, return_index=True)
+        duplicate = np.ones(len(merged), dtype=bool)
+        duplicate[first] = False
+        sources = merged[duplicate] // num_nodes
+        if not len(sources):
+            break
+    return SyntheticCitations(paper_ids, dates, edges // num_nodes, edges % num_nodes)
+
+
+def _draw_targets(rng, sources, cumulative, recency):
+    """ Pick one earlier paper for each source, by fitness within a look-back window skewed to recent papers. """
+    lookback = np.maximum(1, np.ceil(sources * rng.random(len(sources)) ** recency)).astype(np.int64)
+    low = sources - lookback
+    draws = cumulative[low] + rng.random(len(sources)) * (cumulative[sources] - cumulative[low])
+    return np.clip(np.searchsorted(cumulative, draws, side='right') - 1, low, sources - 1)
+
+
+def write_snap_files(citations, edge_file, dates_file=None):
+    """
+    Write synthetic citations in the layout of cit-HepPh.txt and cit-HepPh-dates.txt.
+
+    Args:
+        citations (SyntheticCitations): Output of `synthetic_citations`.
+        edge_file (str): Path of the tab-separated edge list.
+        dates_file (str): Optional path of the paper dates file.
+    """
+    paper_ids = citations.paper_ids
+    with open(edge_file, 'w') as file:
+        file.write("# Directed graph (each unordered pair of nodes is saved once): synthetic citations\n")
+        file.write(f"# Nodes: {len(paper_ids)} Edges: {len(citations.sources)}\n")
+        file.write("# FromNodeId\tToNodeId\n")
+        pd.DataFrame({'from': paper_ids[citations.sources], 'to': paper_ids[citations.targets]}).to_csv(
+            file, sep='\t', header=False, index=False)
+    if dates_file:
+        with open(dates_file, 'w') as file:
+            pd.DataFrame({'id': paper_ids, 'date': citations.dates.astype(str)}).to_csv(
+                file, sep='\t', header=False, index=False)
+
+
+def synthetic_metadata(paper_ids, subfield_dict, seed=0, words=60, keywords=3):
+    """
+    Generate titles and abstracts that mention a few keywords of one subfield among filler words.
+
+    Args:
+        paper_ids (list): Paper IDs to describe.
+        subfield_dict (dict): A dictionary mapping keywords to subfields.
+        seed (int): Seed of the random generator.
+        words (int): Number of words in each abstract.
+        keywords (int): Number of subfield keywords in each abstract.
+
+    Returns:
+        dict: Paper ID -> {'title', 'abstract'} as stored in the metadata cache.
+    """
+    rng = np.random.default_rng(seed)
+    by_subfield = col.defaultdict(list)
+    for keyword, subfield in subfield_dict.items():
+        by_subfield[subfield].append(keyword)
+    subfields = list(by_subfield.values())
+    filler = np.array(FILLER_WORDS, dtype=object)
+
+    metadata = {}
+    topics = rng.integers(len(subfields), size=len(paper_ids))
+    fillers = filler[rng.integers(len(filler), size=(len(paper_ids), words - keywords))]
+    for paper_id, topic, text in zip(paper_ids, topics.tolist(), fillers.tolist()):
+        vocabulary = subfields[topic]
+        text[:0] = [vocabulary[index] for index in rng.integers(len(vocabulary), size=keywords).tolist()]
+        metadata[paper_id] = {"title": " ".join(text[:8]), "abstract": " ".join(text[8:])}
+    return metadata
@@ -21,7 +21,7 @@ def format_paper_id(paper_id):
     return paper_id.zfill(7)
 
 
-def save_analysis(community_stats, global_stats, output_file):
+def save_analysis(community_stats, global_stats, output_file, level=None):
     """
     Write a summary of community analysis including dominant subfields, their distributions, 
     and Fisher's Exact Test results to a file.
@@ -29,6 +29,7 @@ def save_analysis(community_stats, global_stats, output_file):
     Args:
         community_stats (dict): A dictionary containing statistics for each community.
         output_file (str): The filename where the summary will be saved.
+        level (int): Level of the module hierarchy the communities belong to, noted in the summary.
     """
     with open(output_file, 'w') as file:
         # Write global stats
@@ -38,9 +39,32 @@ def save_analysis(community_stats, global_stats, output_file):
         file.write("\n")
 
         # Write community stats
-        file.write("Community Specific Metrics:\n")
+        file.write("Community Specific Metrics:\n" if level is None else f"Community Specific Metrics (level {level}):\n")
         for community_id, stats in community_stats.items():
             file.write(f"Community {community_id}:\n")
             for stat_key, stat_value in stats.items():
                 file.write(f"  {stat_key}: {stat_value}\n")
-            file.write("\n")
\ No newline at end of file
+            file.write("\n")
+
+
+def save_snapshots(snapshots, output_file, top=5):
+    """
+    Write a summary of the cumulative community snapshots of the network, one section per period.
+
+    Args:
+        snapshots (list): Snapshots from `temporal.community_snapshots`.
+        output_file (str): The filename where the summary will be saved.
+        top (int): Number of largest communities listed per snapshot.
+    """
+    with open(output_file, 'w') as file:
+        for snapshot in snapshots:
+            file.write(f"Snapshot {snapshot.period}:\n")
+            file.write(f"  papers: {snapshot.graph.number_of_nodes()}\n")
+            file.write(f"  citations: {snapshot.graph.number_of_edges()}\n")
+            file.write(f"  communities: {len(snapshot.community_stats)}\n")
+            file.write(f"  modularity: {snapshot.modularity}\n")
+            largest = sorted(snapshot.community_stats.items(), key=lambda item: -item[1]['count'])[:top]
+            for community_id, stats in largest:
+                file.write(f"  Community {community_id}: {stats['count']} papers, "
+                           f"{stats['dominant_subfield']} ({stats['dominant_percentage']:.1f}%)\n")
+            file.write("\n")